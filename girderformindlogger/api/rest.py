@@ -26,17 +26,21 @@ from girderformindlogger.models.setting import Setting
 from girderformindlogger.models.token import Token
 from girderformindlogger.models.user import User
 from girderformindlogger.models.account_profile import AccountProfile
+from girderformindlogger.models.aes_encrypt import DecryptedCursor
 from girderformindlogger.models.shield import Shield
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.utility import toBool, config, JsonEncoder, optionalArgumentDecorator
+from girderformindlogger.utility import http_encoding, json_serializer
 from girderformindlogger.utility._cache import requestCache
 from girderformindlogger.utility.model_importer import ModelImporter
+from girderformindlogger.utility.query_count import countQueries
 from six.moves import range, urllib
 
 # Arbitrary buffer length for stream-reading request bodies
 READ_BUFFER_LEN = 65536
 
-_MONGO_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor, pymongo.command_cursor.CommandCursor)
+_MONGO_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor, pymongo.command_cursor.CommandCursor,
+                       DecryptedCursor)
 
 
 def getUrlParts(url=None):
@@ -508,6 +512,58 @@ def rawResponse(fun):
     return wrapped
 
 
+def checkETag(*validators):
+    """
+    Give the response a strong ETag made from the given validators, which
+    must change whenever the response does, and end the request with
+    ``304 Not Modified`` if the client sent it in ``If-None-Match``. Call it
+    before building the response, so that nothing is built in that case.
+    Responses with an ETag may be stored by the client, to be revalidated
+    on each use.
+
+    :param validators: JSON serializable values the response depends on.
+    """
+    etag = http_encoding.makeETag(*validators)
+    cherrypy.request.girderETag = etag
+    setResponseHeader('ETag', etag)
+    setResponseHeader('Cache-Control', 'private, no-cache')
+
+    if http_encoding.etagMatches(cherrypy.request.headers.get('If-None-Match'), etag):
+        raise cherrypy.HTTPRedirect([], 304)
+
+
+def _dropETag():
+    """
+    Remove the ETag of a response that is not the one it validates, such as
+    an error.
+    """
+    cherrypy.request.girderETag = None
+    cherrypy.response.headers.pop('ETag', None)
+    setResponseHeader('Cache-Control', 'private, no-cache, no-store, max-age=0')
+
+
+def _encodeResponse(body):
+    """
+    Compress a response body in a coding the client accepts, if it is
+    large enough, and tag the ETag of the response with the coding.
+    """
+    (enabled, minSize) = http_encoding.compressionSettings()
+    if not enabled:
+        return body
+
+    setResponseHeader('Vary', 'Accept-Encoding')
+    encoding = http_encoding.negotiateEncoding(
+        cherrypy.request.headers.get('Accept-Encoding')) if len(body) >= minSize else None
+    if encoding is None:
+        return body
+
+    etag = getattr(cherrypy.request, 'girderETag', None)
+    if etag:
+        setResponseHeader('ETag', http_encoding.encodedETag(etag, encoding))
+    setResponseHeader('Content-Encoding', encoding)
+    return http_encoding.compress(body, encoding)
+
+
 def _createResponse(val):
     """
     Helper that encodes the response according to the requested "Accepts"
@@ -524,12 +580,16 @@ def _createResponse(val):
             return val.encode('utf8')
         return val
 
+    if isinstance(cherrypy.response.status, int) and cherrypy.response.status >= 400:
+        _dropETag()
+
     accepts = cherrypy.request.headers.elements('Accept')
     for accept in accepts:
         if accept.value == 'application/json':
             break
         elif accept.value == 'text/html':
             # Pretty-print and HTML-ify the response for the browser
+            _dropETag()
             setResponseHeader('Content-Type', 'text/html')
             resp = cgi.escape(json.dumps(
                 val, indent=4, sort_keys=True, allow_nan=False, separators=(',', ': '),
@@ -542,16 +602,17 @@ def _createResponse(val):
     # outside of the loop body in case no Accept header is passed.
     setResponseHeader('Content-Type', 'application/json')
 
-    # disable api responses to be automatically cached on frontend
-    setResponseHeader('Cache-Control', 'private, no-cache, no-store, max-age=0')
+    # disable api responses to be automatically cached on frontend, but
+    # those with an ETag, which are revalidated
+    if getattr(cherrypy.request, 'girderETag', None) is None:
+        setResponseHeader('Cache-Control', 'private, no-cache, no-store, max-age=0')
     setResponseHeader('Pragma', 'no-cache')
     setResponseHeader('Expires', '0')
 
     # use https
     setResponseHeader('Strict-Transport-Security', 'max-age=31536000; includeSubDomains')
 
-    return json.dumps(val, sort_keys=True, allow_nan=False,
-                      cls=JsonEncoder).encode('utf8')
+    return _encodeResponse(json_serializer.dumps(val))
 
 
 def _handleRestException(e):
@@ -720,7 +781,20 @@ def endpoint(fun):
         _logRestRequest(self, path, params)
 
         return resp
-    return endpointDecorator
+
+    @six.wraps(fun)
+    def countingDecorator(self, *path, **params):
+        if not toBool((config.getConfig().get('server', {}) or {}).get(
+                'query_count_header', False)):
+            return endpointDecorator(self, *path, **params)
+
+        # queries of streamed responses are counted until the stream starts
+        with countQueries() as queries:
+            try:
+                return endpointDecorator(self, *path, **params)
+            finally:
+                setResponseHeader('Girder-Query-Count', str(queries.count))
+    return countingDecorator
 
 
 def ensureTokenScopes(token, scope):
@@ -1097,6 +1171,12 @@ class Resource(object):
         """
         return setRawResponse(*args, **kwargs)
 
+    def checkETag(self, *validators):
+        """
+        Bound alias for ``girderformindlogger.api.rest.checkETag``.
+        """
+        return checkETag(*validators)
+
     def getPagingParameters(self, params, defaultSortField=None, defaultSortDir=SortDir.ASCENDING):
         """
         Pass the URL parameters into this function if the request is for a
@@ -6,6 +6,7 @@ from ..describe import autoDescribeRoute, Description
 from girderformindlogger.api import access
 from girderformindlogger.constants import TokenScope
 from girderformindlogger.models.account_profile import AccountProfile
+from girderformindlogger.models.tenant import getTenantRouter
 
 from ..rest import Resource
 
@@ -31,4 +32,6 @@ class Account(Resource):
            'db': dbURL
         })
         self._model.save(account, validate=False)
+        # the accounts' applets are routed to the new database right away
+        getTenantRouter().invalidate()
         return 'DB was saved'
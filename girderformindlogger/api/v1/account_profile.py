@@ -3,6 +3,7 @@ from ..rest import Resource
 from ..describe import Description, autoDescribeRoute
 from girderformindlogger.api import access
 from girderformindlogger.models.account_profile import AccountProfile as AccountProfileModel
+from girderformindlogger.exceptions import ValidationException
 from girderformindlogger.constants import AccessType, SortDir, TokenScope,     \
     DEFINED_INFORMANTS, REPROLIB_CANONICAL, SPECIAL_SUBJECTS, USER_ROLES
 from girderformindlogger.models.profile import Profile as ProfileModel
@@ -23,6 +24,47 @@ class AccountProfile(Resource):
         self.route('GET', ('users',), self.getUsers)
         self.route('PUT', ('manage', 'pin', ), self.updatePin)
         self.route('PUT', ('updateAlertStatus', ':id', ), self.updateAlertStatus)
+        self.route('GET', ('alerts', ), self.getAlerts)
+
+    @access.user(scope=TokenScope.DATA_OWN)
+    @autoDescribeRoute(
+        Description('Get response alerts.')
+        .notes(
+            'This endpoint is used for reviewer/manager to get the alerts of the last 30 days, newest first. <br>'
+            'Pass the time of the newest alert received as since to only get newer ones.'
+        )
+        .param(
+            'limit',
+            'Number of alerts per page, 0 for all',
+            dataType='integer',
+            required=False,
+            default=0
+        )
+        .param(
+            'after',
+            'Token of the page to get, as returned in "next" with the previous page',
+            required=False
+        )
+        .param(
+            'since',
+            'Only get the alerts created after this date',
+            dataType='dateTime',
+            required=False
+        )
+    )
+    def getAlerts(self, limit=0, after=None, since=None):
+        accountProfile = self.getAccountProfile()
+
+        if limit < 0:
+            raise ValidationException('Invalid limit.', 'limit')
+
+        return ResponseAlerts().getResponseAlerts(
+            accountProfile['userId'],
+            accountProfile['accountId'],
+            limit=limit,
+            after=after,
+            since=since
+        )
 
     @access.user(scope=TokenScope.DATA_OWN)
     @autoDescribeRoute(
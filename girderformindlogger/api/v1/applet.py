@@ -43,7 +43,7 @@ from girderformindlogger.models.events import Events as EventsModel
 from girderformindlogger.utility import config, jsonld_expander, mail_utils
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.settings import SettingKey
-from girderformindlogger.models.profile import Profile as ProfileModel
+from girderformindlogger.models.profile import Profile as ProfileModel, PROFILE_LIST_SORT_KEYS
 from girderformindlogger.models.account_profile import AccountProfile
 from girderformindlogger.models.invitation import Invitation as InvitationModel
 from girderformindlogger.i18n import t
@@ -56,6 +56,41 @@ from girderformindlogger.utility.validate import validator, email_validator, sym
 
 USER_ROLE_KEYS = USER_ROLES.keys()
 
+# columns of the CSV response export; nested values are written as JSON
+EXPORT_CSV_COLUMNS = [
+    '_id', 'userId', 'MRN', 'activity', 'created', 'responseStarted',
+    'responseCompleted', 'responseScheduled', 'timeout', 'version', 'data',
+    'subScales', 'userPublicKey', 'dataSource', 'subScaleSource'
+]
+
+# size of the pieces a streamed response body is written in
+STREAM_CHUNK_SIZE = 65536
+
+
+def _csvValue(encoder, value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return encoder.encode(value)
+    if isinstance(value, (ObjectId, datetime.datetime)):
+        return encoder.default(value)
+    return value
+
+
+def _bufferedStream(chunks, size=STREAM_CHUNK_SIZE):
+    """
+    Coalesce small pieces of text into encoded chunks of about `size` bytes.
+    """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer).encode('utf8')
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf8')
+
 
 class Applet(Resource):
 
@@ -65,6 +100,7 @@ class Applet(Resource):
         self._model = AppletModel()
         self.route('GET', (':id',), self.getApplet)
         self.route('GET', (':id', 'data'), self.getAppletData)
+        self.route('GET', (':id', 'export'), self.exportAppletData)
         self.route('GET', (':id', 'groups'), self.getAppletGroups)
         self.route('POST', (), self.createApplet)
         self.route('POST', (':id', 'setRetention'), self.setRetentionSettings)
@@ -300,9 +336,12 @@ class Applet(Resource):
         if not reviewerProfile or 'reviewer' not in reviewerProfile.get('roles', []) or applet['_id'] != reviewerProfile['appletId']:
             raise AccessException('unable to find reviewer with specified id')
 
-        ProfileModel().updateReviewerList(reviewerProfile, [ObjectId(userId) for userId in users], operation)
+        modified = ProfileModel().updateReviewerList(reviewerProfile, [ObjectId(userId) for userId in users], operation)
 
-        return "success"
+        return {
+            'message': 'success',
+            'modified': modified
+        }
 
     @access.user(scope=TokenScope.DATA_READ)
     @autoDescribeRoute(
@@ -339,16 +378,11 @@ class Applet(Resource):
         if not reviewerProfile or 'reviewer' not in reviewerProfile.get('roles', []) or applet['_id'] != reviewerProfile['appletId']:
             raise AccessException('unable to find reviewer with specified id')
 
-        users = [
-            profileModel.displayProfileFields(
-                p,
-                thisUser,
-                forceManager=True
-            )
-            for p in list(
-                profileModel.find({'appletId': applet['_id'], 'reviewers': reviewerProfile['_id']})
-            )
-        ]
+        users = profileModel.displayProfileFieldsMany(
+            list(profileModel.find({'appletId': applet['_id'], 'reviewers': reviewerProfile['_id']})),
+            thisUser,
+            forceManager=True
+        )
         return users
 
     @access.user(scope=TokenScope.DATA_READ)
@@ -407,8 +441,57 @@ class Applet(Resource):
             required=False,
             default=False
         )
+        .param(
+            'limit',
+            'Number of users and of pending invitations per page. If none of '
+            'limit, after, pendingAfter, search and fields are set, all users '
+            'are returned in one list.',
+            dataType='integer',
+            required=False,
+            default=0
+        )
+        .param(
+            'sort',
+            'Key users are ordered by',
+            required=False,
+            enum=list(PROFILE_LIST_SORT_KEYS.keys()),
+            default='created'
+        )
+        .param(
+            'sortdir',
+            '1 for ascending, -1 for descending order',
+            dataType='integer',
+            required=False,
+            enum=[SortDir.ASCENDING, SortDir.DESCENDING],
+            default=SortDir.ASCENDING
+        )
+        .param(
+            'after',
+            'Token of the page of users to get, as returned in "next" with the previous page',
+            required=False
+        )
+        .param(
+            'pendingAfter',
+            'Token of the page of pending invitations to get, as returned in '
+            '"pendingNext" with the previous page',
+            required=False
+        )
+        .param(
+            'search',
+            'Only list users whose MRN or name contains this text',
+            required=False
+        )
+        .jsonParam(
+            'fields',
+            'List of keys of the user entries to return',
+            paramType='query',
+            required=False,
+            requireArray=True
+        )
     )
-    def getAppletUsers(self, applet, retrieveRoles=False):
+    def getAppletUsers(self, applet, retrieveRoles=False, limit=0, sort='created',
+                       sortdir=SortDir.ASCENDING, after=None, pendingAfter=None, search=None,
+                       fields=None):
         user = self.getCurrentUser()
         is_reviewer = AppletModel()._hasRole(applet['_id'], user, 'reviewer')
         is_coordinator = AppletModel().isCoordinator(applet['_id'], user)
@@ -416,9 +499,28 @@ class Applet(Resource):
         if not (is_coordinator or is_reviewer):
             raise AccessException("Only coordinators, managers and reviewers can see user lists.")
 
+        if limit < 0:
+            raise ValidationException('Invalid limit.', 'limit')
+
         profile = ProfileModel().findOne({'appletId': applet['_id'],
                                           'userId': user['_id']})
 
+        if limit or after or pendingAfter or search or fields:
+            return AppletModel().getAppletUsersPage(
+                applet,
+                user,
+                limit=limit,
+                sort=sort,
+                sortDir=sortdir,
+                after=after,
+                pendingAfter=pendingAfter,
+                search=search,
+                fields=fields,
+                reviewerId=profile['_id'] if not is_coordinator else None,
+                retrieveRoles=retrieveRoles and is_coordinator,
+                retrieveRequests=AppletModel().isManager(applet['_id'], user)
+            )
+
         if (not is_coordinator) and is_reviewer:
             # Only include the users this reviewer has access to.
             users = ProfileModel().find(query={'appletId': applet['_id'],
@@ -426,10 +528,9 @@ class Applet(Resource):
                                                'profile': True,
                                                'deactivated': {'$ne': True},
                                                'reviewers': profile['_id']})
-            return {'active': [
-                ProfileModel().displayProfileFields(p, user, forceManager=True)
-                for p in list(users)
-            ]}
+            return {'active': ProfileModel().displayProfileFieldsMany(
+                list(users), user, forceManager=True
+            )}
 
         return AppletModel().getAppletUsers(applet, user, force=True, retrieveRoles=retrieveRoles, retrieveRequests=AppletModel().isManager(applet['_id'], user))
 
@@ -1029,13 +1130,122 @@ class Applet(Resource):
         users = users if users else []
         data = AppletModel().getResponseData(id, thisUser, users)
 
+        setResponseHeader('Content-Type', 'application/json')
         setContentDisposition("{}-{}.{}".format(
             str(id),
             datetime.now().isoformat(),
             'json'
         ))
 
-        return(data)
+        return lambda: _bufferedStream(data)
+
+    @access.user(scope=TokenScope.DATA_WRITE)
+    @autoDescribeRoute(
+        Description('Export the responses you are authorized to see for an applet.')
+        .notes(
+            'Responses are streamed one per line as NDJSON, or as CSV rows, ordered by ID. <br>'
+            'An interrupted export can be resumed by passing the ID of the last response received as `after`. <br>'
+            'You\'ll need to access this endpoint only if you are owner/manager/reviewer of this applet.'
+        )
+        .param(
+            'id',
+            'ID of the applet for which to export data',
+            required=True
+        )
+        .param(
+            'format',
+            'Export format',
+            required=False,
+            enum=['ndjson', 'csv'],
+            default='ndjson'
+        )
+        .param(
+            'users',
+            'Only exports responses from the given users (profile IDs)',
+            required=False,
+            dataType='array',
+            default=''
+        )
+        .param(
+            'activities',
+            'Only exports responses to the given activities',
+            required=False,
+            dataType='array',
+            default=''
+        )
+        .param(
+            'fromDate',
+            'Only exports responses created at or after this time',
+            required=False,
+            dataType='dateTime'
+        )
+        .param(
+            'toDate',
+            'Only exports responses created before this time',
+            required=False,
+            dataType='dateTime'
+        )
+        .param(
+            'after',
+            'Resume token: ID of the last response received',
+            required=False
+        )
+        .errorResponse('Write access was denied for this applet.', 403)
+    )
+    def exportAppletData(self, id, format, users, activities, fromDate, toDate, after):
+        import csv
+        import io
+        from girderformindlogger.utility import JsonEncoder
+        from ..rest import setContentDisposition, setResponseHeader
+
+        thisUser = self.getCurrentUser()
+
+        if users and isinstance(users, str):
+            users = users.replace(' ', '').split(",")
+        if activities and isinstance(activities, str):
+            activities = activities.replace(' ', '').split(",")
+
+        rows = AppletModel().exportResponses(
+            id,
+            thisUser,
+            users=users if users else [],
+            activities=activities if activities else [],
+            fromDate=fromDate,
+            toDate=toDate,
+            after=after
+        )
+
+        encoder = JsonEncoder(sort_keys=True, allow_nan=False)
+
+        if format == 'csv':
+            setResponseHeader('Content-Type', 'text/csv')
+
+            def lines():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_CSV_COLUMNS)
+                for row in rows:
+                    writer.writerow([
+                        _csvValue(encoder, row[column]) for column in EXPORT_CSV_COLUMNS
+                    ])
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+        else:
+            setResponseHeader('Content-Type', 'application/x-ndjson')
+
+            def lines():
+                for row in rows:
+                    yield encoder.encode(row) + '\n'
+
+        setContentDisposition("{}-{}.{}".format(
+            str(id),
+            datetime.datetime.now().isoformat(),
+            format
+        ))
+
+        return lambda: _bufferedStream(lines())
 
 
     @access.user(scope=TokenScope.DATA_WRITE)
@@ -1155,6 +1365,11 @@ class Applet(Resource):
     def getApplet(self, applet, retrieveSchedule=False, retrieveAllEvents=False):
         user = self.getCurrentUser()
 
+        # the content of a cached applet changes with its update time or
+        # cache; the schedule is not covered
+        if applet.get('cached') and not retrieveSchedule:
+            self.checkETag(applet['_id'], applet['updated'], applet['cached'], applet['accountId'])
+
         formatted = jsonld_expander.formatLdObject(
             applet,
             'applet',
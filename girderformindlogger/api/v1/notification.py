@@ -15,6 +15,7 @@ from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.constants import SortDir
 from girderformindlogger.exceptions import RestException
 from girderformindlogger.models.notification import Notification as NotificationModel
+from girderformindlogger.models.notification_hub import getNotificationHub
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.models.profile import Profile as ProfileModel
 from girderformindlogger.models.pushNotification import PushNotification as PushNotificationModel, \
@@ -33,6 +34,8 @@ DEFAULT_STREAM_TIMEOUT = 300
 MIN_POLL_INTERVAL = 0.5
 # The interval increases when no new events are seen, capping at this value
 MAX_POLL_INTERVAL = 2
+# Seconds a stream waits on its subscription before checking the server state
+MAX_STREAM_WAIT = 10
 
 
 def sseMessage(event):
@@ -92,22 +95,38 @@ class Notification(Resource):
         if since is not None:
             since = datetime.datetime.utcfromtimestamp(since)
 
+        sort = [('updated', SortDir.ASCENDING)]
+
         def streamGen():
             lastUpdate = since
             start = time.time()
             wait = MIN_POLL_INTERVAL
-            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
-                wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
-                for event in NotificationModel().get(user, lastUpdate, token=token):
-                    if lastUpdate is None or event['updated'] > lastUpdate:
-                        lastUpdate = event['updated']
-                    wait = MIN_POLL_INTERVAL
-                    start = time.time()
-                    yield sseMessage(event)
-                if time.time() - start > timeout:
-                    break
-
-                time.sleep(wait)
+            with getNotificationHub().subscribe(user, token) as subscription:
+                # notifications from before the subscription are only in the
+                # database; later ones are handed to the subscription
+                events = NotificationModel().get(user, lastUpdate, token=token, sort=sort)
+                while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                    wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
+                    for event in events:
+                        if lastUpdate is None or event['updated'] > lastUpdate:
+                            lastUpdate = event['updated']
+                        wait = MIN_POLL_INTERVAL
+                        start = time.time()
+                        yield sseMessage(event)
+
+                    remaining = timeout - (time.time() - start)
+                    if remaining <= 0:
+                        break
+
+                    received = subscription.get(
+                        min(remaining, MAX_STREAM_WAIT) if subscription.hub.listening else wait)
+                    if received is None:
+                        events = NotificationModel().get(user, lastUpdate, token=token, sort=sort)
+                    else:
+                        events = [
+                            event for event in received
+                            if lastUpdate is None or event['updated'] > lastUpdate
+                        ]
 
         return streamGen
 
@@ -113,7 +113,7 @@ class ResponseItem(Resource):
         includeOldItems=True,
     ):
         from girderformindlogger.models.profile import Profile
-        from girderformindlogger.models.account_profile import AccountProfile
+        from girderformindlogger.models.tenant import getTenantRouter
         from girderformindlogger.utility.response import (
             delocalize, add_latest_daily_response, getOldVersions)
 
@@ -167,20 +167,16 @@ class ResponseItem(Resource):
         }
 
         # Get the responses for each users and generate the group responses data.
-        owner_account = AccountProfile().findOne({
-            'applets.owner': applet.get('_id')
-        })
-        if owner_account and owner_account.get('db', None):
-            self._model.reconnectToDb(db_uri=owner_account.get('db', None))
+        responseModel = getTenantRouter().forApplet(self._model, applet['_id'])
 
         for user in users:
-            responses = self._model.find(
+            responses = list(responseModel.find(
                 query={"created": { "$lte": toDate, "$gt": fromDate },
                        "meta.applet.@id": ObjectId(applet['_id']),
                        "meta.activity.@id": { "$in": activities },
                        "meta.subject.@id": user['_id']},
                 force=True,
-                sort=[("created", DESCENDING)])
+                sort=[("created", DESCENDING)]))
 
             # we need this to handle old responses
             for response in responses:
@@ -196,8 +192,6 @@ class ResponseItem(Resource):
 
             add_latest_daily_response(data, responses, tokens)
 
-        self._model.reconnectToDb()
-
         data.update(getOldVersions(data['responses'], applet))
 
         return data
@@ -379,7 +373,7 @@ class ResponseItem(Resource):
         params
     ):
         from girderformindlogger.models.profile import Profile
-        from girderformindlogger.models.account_profile import AccountProfile
+        from girderformindlogger.models.tenant import getTenantRouter
         try:
             # TODO: pending
             metadata['applet'] = {
@@ -434,15 +428,10 @@ class ResponseItem(Resource):
                 parent=UserAppletResponsesFolder, parentType='folder',
                 name=str(subject_id), reuseExisting=True, public=False)
 
-            owner_account = AccountProfile().findOne({
-                'applets.owner': applet.get('_id')
-            })
-
-            if owner_account and owner_account.get('db', None):
-                self._model.reconnectToDb(db_uri=owner_account.get('db', None))
+            responseModel = getTenantRouter().forApplet(self._model, applet['_id'])
 
             try:
-                newItem = self._model.createResponseItem(
+                newItem = responseModel.createResponseItem(
                     folder=AppletSubjectResponsesFolder,
                     name=now.strftime("%Y-%m-%d-%H-%M-%S-%Z"),
                     creator=informant,
@@ -508,11 +497,10 @@ class ResponseItem(Resource):
                             alert['message']
                         )
 
-                newItem = self._model.setMetadata(newItem, metadata)
+                newItem = responseModel.setMetadata(newItem, metadata)
 
             if not pending:
                 newItem['readOnly'] = True
-            self._model.reconnectToDb()
 
             # update profile activity
             profile = Profile()
@@ -533,6 +521,7 @@ class ResponseItem(Resource):
                 })
 
             data['updated'] = now
+            data['lastActivity'] = now
             profile.save(data, validate=False)
 
             return(newItem)
@@ -569,7 +558,7 @@ class ResponseItem(Resource):
     )
     def updateReponseHistory(self, applet, user, responses):
         from girderformindlogger.models.profile import Profile
-        from girderformindlogger.models.account_profile import AccountProfile
+        from girderformindlogger.models.tenant import getTenantRouter
 
         if not user:
             user = self.getCurrentUser()
@@ -590,12 +579,7 @@ class ResponseItem(Resource):
 
         now = datetime.utcnow()
 
-        owner_account = AccountProfile().findOne({
-            'applets.owner': applet.get('_id')
-        })
-
-        if owner_account and owner_account.get('db', None):
-            self._model.reconnectToDb(db_uri=owner_account.get('db', None))
+        responseModel = getTenantRouter().forApplet(self._model, applet['_id'])
 
         for responseId in responses['dataSources']:
             query = {
@@ -605,7 +589,7 @@ class ResponseItem(Resource):
             if not is_manager:
                 query["meta.subject.@id"] = profile['_id']
 
-            self._model.update(
+            responseModel.update(
                 query,
                 {
                     '$set': {
@@ -635,8 +619,6 @@ class ResponseItem(Resource):
 
             responseTokenModel.save(tokenUpdate)
 
-        self._model.reconnectToDb()
-
         if profile.get('refreshRequest', None):
             profile.pop('refreshRequest')
             Profile().save(profile, validate=False)
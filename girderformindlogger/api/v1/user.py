@@ -86,7 +86,7 @@ class User(Resource):
         .deprecated()
     )
     def getGroupInvites(self):
-        from girderformindlogger.utility.jsonld_expander import loadCache
+        from girderformindlogger.utility.jsonld_expander import loadCaches
 
         pending = self.getCurrentUser().get("groupInvites")
         output = []
@@ -131,8 +131,9 @@ class User(Resource):
                         ))
                     ]
 
+            caches = loadCaches([applet.get('cached') for applet in applets])
             for applet in applets:
-                applet['loadedCache'] = loadCache(applet['cached'])
+                applet['loadedCache'] = caches.get(str(applet.get('cached')), {})
 
             output.append({
                 '_id': groupId,
@@ -637,9 +638,6 @@ class User(Resource):
         groupByDateActivity=True,
         retrieveLastResponseTime=False,
     ):
-        from bson.objectid import ObjectId
-        from girderformindlogger.utility.jsonld_expander import loadCache
-
         from girderformindlogger.utility.response import responseDateList
 
         if retrieveAllEvents and retrieveSchedule and role != 'coordinator' and role != 'manager':
@@ -668,11 +666,46 @@ class User(Resource):
                 for applet in account.get('applets', {}).get(role, []):
                     applet_ids.append(applet)
 
-        applets = [AppletModel().load(ObjectId(applet_id), AccessType.READ) for applet_id in applet_ids]
+        applets = AppletModel().loadMany(applet_ids, AccessType.READ)
+
+        # without schedules, responses and users, the applets are formatted
+        # from their cache and update time, their groups and those of the
+        # user, and what the client has
+        if not (retrieveSchedule or retrieveResponses or retrieveLastResponseTime) and \
+                role not in ['coordinator', 'manager']:
+            self.checkETag(
+                reviewer['_id'],
+                role,
+                localInfo,
+                [
+                    (
+                        applet['_id'],
+                        applet['updated'],
+                        applet.get('cached'),
+                        applet.get('roles', {}).get(role, {}).get('groups')
+                    ) for applet in applets if applet
+                ],
+                [
+                    reviewer.get(field) for field in [
+                        'groups', 'formerGroups', 'groupInvites', 'declinedInvites'
+                    ]
+                ]
+            )
+
+        # load what the applets are formatted from with one query per collection
+        prefetched = AppletModel().prefetchFormatted(
+            applets,
+            reviewer,
+            retrieveSchedule=retrieveSchedule,
+            retrieveAllEvents=retrieveAllEvents,
+            retrieveResponses=retrieveResponses,
+            retrieveLastResponseTime=retrieveLastResponseTime,
+            localInfo=localInfo
+        )
 
         result = []
         for applet in applets:
-            if applet.get('cached'):
+            if applet and applet.get('cached'):
                 formatted = AppletModel().appletFormatted(applet=applet,
                                                             reviewer=reviewer,
                                                             role=role,
@@ -683,6 +716,7 @@ class User(Resource):
                                                             groupByDateActivity=groupByDateActivity,
                                                             retrieveLastResponseTime=retrieveLastResponseTime,
                                                             localInfo=localInfo.get(str(applet['_id']), {}) if localInfo else {},
+                                                            prefetched=prefetched.get(str(applet['_id']))
                                                             )
                 result.append(formatted)
 
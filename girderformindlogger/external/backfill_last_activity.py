@@ -0,0 +1,32 @@
+from pymongo import UpdateOne
+from girderformindlogger.models.profile import Profile
+
+BATCH_SIZE = 1000
+
+# lastActivity is set when a response is submitted; profiles that have not
+# responded since get it from their latest completed activity
+model = Profile()
+profiles = model.find({
+    'lastActivity': {'$exists': False},
+    'completed_activities.completed_time': {'$ne': None}
+}, fields=['completed_activities']).batch_size(BATCH_SIZE)
+
+updates = []
+updated = 0
+for profile in profiles:
+    times = [
+        activity['completed_time'] for activity in profile.get('completed_activities', [])
+        if activity.get('completed_time')
+    ]
+    if not times:
+        continue
+
+    updates.append(UpdateOne({'_id': profile['_id']}, {'$set': {'lastActivity': max(times)}}))
+    if len(updates) == BATCH_SIZE:
+        updated += model.collection.bulk_write(updates, ordered=False).modified_count
+        updates = []
+
+if updates:
+    updated += model.collection.bulk_write(updates, ordered=False).modified_count
+
+print(f'{updated} profiles were updated')
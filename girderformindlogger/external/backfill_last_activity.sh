@@ -0,0 +1,5 @@
+#!/bin/bash
+source /opt/python/run/venv/bin/activate
+source /opt/python/current/env
+cd /opt/python/current/app
+python girderformindlogger/external/backfill_last_activity.py
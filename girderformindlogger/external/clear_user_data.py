@@ -3,7 +3,7 @@ import datetime
 from bson import ObjectId
 from girderformindlogger.models.item import Item
 from girderformindlogger.models.applet import Applet
-from girderformindlogger.models.account_profile import AccountProfile
+from girderformindlogger.models.tenant import getTenantRouter
 
 
 RETENTION_SET = {
@@ -22,14 +22,7 @@ applets = Applet().find(query={
 
 for applet in applets:
 
-    owner_account = AccountProfile().findOne({
-        'applets.owner': applet.get('_id')
-    })
-
-    _item = Item()
-
-    if owner_account and not owner_account.get('db', None):
-        _item.reconnectToDb(db_uri=owner_account.get('db', None))
+    _item = getTenantRouter().forApplet(Item(), applet['_id'])
 
     retentionSettings = applet['meta'].get('retentionSettings', None)
 
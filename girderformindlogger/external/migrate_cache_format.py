@@ -0,0 +1,16 @@
+from girderformindlogger.models.cache import Cache, CACHE_FORMAT_BSON_ZLIB
+
+model = Cache()
+caches = model.find({
+    'format': {
+        '$ne': CACHE_FORMAT_BSON_ZLIB
+    }
+}, fields=['_id'])
+
+converted = 0
+for cache in caches:
+    document = model.findOne({'_id': cache['_id']})
+    if document and model.migrateFormat(document):
+        converted += 1
+
+print(f'{converted} caches were converted')
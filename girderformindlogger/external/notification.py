@@ -1,17 +1,155 @@
 import datetime
+import itertools
+import json
+import time
 
 from bson import ObjectId
 from pyfcm import FCMNotification
-from girderformindlogger.utility.notification import FirebaseNotification
+from girderformindlogger.utility import config
+from girderformindlogger.utility.notification import FirebaseNotification, FakeNotification
 from collections import defaultdict
 
+FCM_API_KEY = 'AAAAJOyOEz4:APA91bFudM5Cc1Qynqy7QGxDBa-2zrttoRw6ZdvE9PQbfIuAB9SFvPje7DcFMmPuX1IizR1NAa7eHC3qXmE6nmOpgQxXbZ0sNO_n1NITc1sE5NH3d8W9ld-cfN7sXNr6IAOuodtEwQy-'
 
-push_service = FirebaseNotification(
-        api_key='AAAAJOyOEz4:APA91bFudM5Cc1Qynqy7QGxDBa-2zrttoRw6ZdvE9PQbfIuAB9SFvPje7DcFMmPuX1IizR1NAa7eHC3qXmE6nmOpgQxXbZ0sNO_n1NITc1sE5NH3d8W9ld-cfN7sXNr6IAOuodtEwQy-',
-        proxy_dict={})
-
+# profiles delivered by one batch job
 AMOUNT_MESSAGES_PER_REQUEST = 1000
 
+# queue batch jobs are delivered from, see [notifications] in girder.dist.cfg
+DEFAULT_PUSH_QUEUE = 'notifications'
+
+# redis list keeping the metrics of the latest batch jobs
+PUSH_METRICS_KEY = 'notifications:metrics'
+PUSH_METRICS_SIZE = 1000
+
+_push_service = None
+
+
+def getPushService():
+    """
+    Get the service notifications are sent with, as set by `[notifications]
+    backend`: "fcm" (default) or "fake" for load tests.
+    """
+    global _push_service
+
+    if _push_service is None:
+        cfg = config.getConfig().get('notifications', {}) or {}
+        if cfg.get('backend', 'fcm') == 'fake':
+            _push_service = FakeNotification(
+                latency=float(cfg.get('fake_latency', 0)),
+                failureRate=float(cfg.get('fake_failure_rate', 0)))
+        else:
+            _push_service = FirebaseNotification(api_key=FCM_API_KEY, proxy_dict={})
+    return _push_service
+
+
+def getPushQueue():
+    """
+    Get the rq queue batch jobs are sent to, or None if `[notifications]
+    queue` is empty and batches are delivered by the job selecting them.
+    """
+    from rq import Queue
+    from girderformindlogger.models import getRedisConnection
+
+    cfg = config.getConfig().get('notifications', {}) or {}
+    name = cfg.get('queue', DEFAULT_PUSH_QUEUE)
+    return Queue(name, connection=getRedisConnection()) if name else None
+
+
+def deliver_push_batch(profiles, message, push_service=None):
+    """
+    Send a notification to a batch of profiles, one request per badge value.
+
+    :param profiles: profiles with `deviceId` and `badge`
+    :type profiles: list
+    :param message: keyword arguments of notify_multiple_devices, except
+        `registration_ids` and `badge`
+    :type message: dict
+    :returns: metrics of the batch
+    """
+    push_service = push_service or getPushService()
+    started = time.time()
+
+    # ordered by badge
+    message_requests = defaultdict(list)
+    for profile in profiles:
+        if profile.get('deviceId', None):
+            message_requests[profile.get('badge', 0)].append(profile['deviceId'])
+
+    success = failure = 0
+    for badge in message_requests:
+        result = push_service.notify_multiple_devices(
+            registration_ids=message_requests[badge],
+            badge=int(badge) + 1,
+            **message
+        )
+        success += result['success']
+        failure += result['failure']
+
+    elapsed = time.time() - started
+    return {
+        'profiles': len(profiles),
+        'devices': success + failure,
+        'requests': len(message_requests),
+        'success': success,
+        'failure': failure,
+        'seconds': round(elapsed, 3),
+        'throughput': round((success + failure) / elapsed, 1) if elapsed else None
+    }
+
+
+def record_push_metrics(metrics):
+    """
+    Log the metrics of a batch job and keep them in the job's meta and in
+    the `PUSH_METRICS_KEY` list in redis.
+    """
+    from rq import get_current_job
+    from girderformindlogger.models import getRedisConnection
+
+    print('notification batch - {devices} devices, {success} succeeded, '
+          '{failure} failed in {seconds}s ({throughput}/s)'.format(**metrics))
+
+    job = get_current_job()
+    if job:
+        job.meta['metrics'] = metrics
+        job.save_meta()
+
+    redis = getRedisConnection()
+    pipeline = redis.pipeline()
+    pipeline.lpush(PUSH_METRICS_KEY, json.dumps(metrics))
+    pipeline.ltrim(PUSH_METRICS_KEY, 0, PUSH_METRICS_SIZE - 1)
+    pipeline.execute()
+
+
+def get_push_metrics(count=100):
+    """
+    Get the metrics of the latest batch jobs, newest first.
+    """
+    from girderformindlogger.models import getRedisConnection
+
+    return [
+        json.loads(metrics)
+        for metrics in getRedisConnection().lrange(PUSH_METRICS_KEY, 0, count - 1)
+    ]
+
+
+def send_push_notification_batch(applet_id, event_id, profiles, message):
+    """
+    Batch job of send_push_notification: deliver to up to
+    AMOUNT_MESSAGES_PER_REQUEST profiles and raise their badges.
+    """
+    from girderformindlogger.models.profile import Profile
+
+    metrics = deliver_push_batch(profiles, message)
+    Profile().updateProfileBadgets(profiles)
+
+    metrics.update({
+        'applet_id': str(applet_id),
+        'event_id': str(event_id),
+        'time': datetime.datetime.utcnow().isoformat()
+    })
+    record_push_metrics(metrics)
+    return metrics
+
 
 # this handles notifications for activities
 def send_push_notification(applet_id, event_id, activity_id=None, send_time=None, reminder=False):
@@ -87,40 +225,50 @@ def send_push_notification(applet_id, event_id, activity_id=None, send_time=None
                 }
             }
 
-        profiles = list(Profile().find(query=query, fields=['deviceId', 'badge', 'userId']))
-
-        print('profiles ', profiles)
-        # ordered by badge
-        message_requests = defaultdict(list)
-        for profile in profiles:
-            message_requests[profile["badge"]].append(profile["deviceId"])
-
-        for badge in message_requests:
-            message_title = event['data']['title']
-            message_body  = event['data']['description']
-
-            if reminder:
-                message_title = f'This is a reminder to take {message_title}.'
-
-            result = push_service.notify_multiple_devices(
-                registration_ids=message_requests[badge],
-                message_title=message_title,
-                message_body=message_body,
-                time_to_live=0,
-                data_message={
-                    "event_id": str(event_id),
-                    "applet_id": str(applet_id),
-                    "activity_id": str(activity_id),
-                    "type": 'event-alert'
-                },
-                extra_kwargs={"apns_expiration": "0"},
-                badge=int(badge) +1
-            )
-
-            print(f'Notifications with failure status - {str(result["failure"])}')
-            print(f'Notifications with success status - {str(result["success"])}')
+        message_title = event['data']['title']
+        if reminder:
+            message_title = f'This is a reminder to take {message_title}.'
+
+        message = {
+            'message_title': message_title,
+            'message_body': event['data']['description'],
+            'time_to_live': 0,
+            'data_message': {
+                "event_id": str(event_id),
+                "applet_id": str(applet_id),
+                "activity_id": str(activity_id),
+                "type": 'event-alert'
+            },
+            'extra_kwargs': {"apns_expiration": "0"}
+        }
 
-        Profile().updateProfileBadgets(profiles)
+        # page through the profiles and hand them to the batch workers; in
+        # badge order, so that a batch mostly takes a single request to FCM
+        queue = getPushQueue()
+        profiles = Profile().find(
+            query=query,
+            fields=['deviceId', 'badge', 'userId'],
+            sort=[('badge', 1), ('_id', 1)]
+        ).batch_size(AMOUNT_MESSAGES_PER_REQUEST)
+
+        batches = 0
+        while True:
+            batch = [{
+                'userId': profile.get('userId'),
+                'deviceId': profile.get('deviceId'),
+                'badge': profile.get('badge', 0)
+            } for profile in itertools.islice(profiles, AMOUNT_MESSAGES_PER_REQUEST)]
+
+            if not batch:
+                break
+
+            if queue is None:
+                send_push_notification_batch(applet_id, event_id, batch, message)
+            else:
+                queue.enqueue(send_push_notification_batch, applet_id, event_id, batch, message)
+            batches += 1
+
+        print(f'Notification batches - {batches}')
 
         # if random time we will reschedule it in time between 23:45 and 23:59
         if not reminder and event['data']['notifications'][0]['random'] and now.hour == 23 and 59 >= now.minute >= 45:
@@ -139,7 +287,7 @@ def send_custom_notification(notification):
         user = UserModel().load(notification['userId'], force=True)
 
         if user['deviceId']:
-            push_service.notify_single_device(
+            getPushService().notify_single_device(
                 registration_id=user['deviceId'],
                 message_title=notification['data'].get('title', 'Response Alert'),
                 message_body=notification['data'].get('description', ''),
@@ -157,11 +305,10 @@ def send_applet_update_notification(applet, isDeleted=False, profiles=[]):
 
     profiles = Profile().get_profiles_by_applet_id(applet_id) if not profiles else profiles
 
-    # ordered by badge
-    message_requests = defaultdict(list)
-    for profile in profiles:
-        if (isDeleted or not profile.get('deactivated', False)) and profile.get('deviceId', None):
-            message_requests[profile['badge']].append(profile['deviceId'])
+    recipients = [
+        profile for profile in profiles
+        if isDeleted or not profile.get('deactivated', False)
+    ]
 
     message_title='Applet Update',
     message_body= f'Content of your applet ({appletName}) was updated by editor.',
@@ -175,14 +322,11 @@ def send_applet_update_notification(applet, isDeleted=False, profiles=[]):
         message_body = f'Your applet ({appletName}) was deleted by manager'
         data_message['type'] = 'applet-delete-alert'
 
-    for badge in message_requests:
-        result = push_service.notify_multiple_devices(
-            registration_ids=message_requests[badge],
-            message_title=message_title,
-            message_body= message_body,
-            time_to_live=0,
-            data_message=data_message,
-            badge=int(badge) +1
-        )
+    deliver_push_batch(recipients, {
+        'message_title': message_title,
+        'message_body': message_body,
+        'time_to_live': 0,
+        'data_message': data_message
+    })
 
     Profile().updateProfileBadgets(profiles)
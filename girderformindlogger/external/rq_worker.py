@@ -1,14 +1,46 @@
+import multiprocessing
+import sys
+
 from rq import SimpleWorker
 
-from girderformindlogger.utility import reconnect
+from girderformindlogger.utility import config, reconnect
 from girderformindlogger.models import getRedisConnection
-redis = getRedisConnection()
+from girderformindlogger.external.notification import DEFAULT_PUSH_QUEUE
+
+
+def queues():
+    cfg = config.getConfig().get('notifications', {}) or {}
+    name = cfg.get('queue', DEFAULT_PUSH_QUEUE)
+    # notification batches are drained before new jobs are picked up
+    return [name, 'default'] if name else ['default']
 
 
 @reconnect(name='Worker')
-def start():
-    SimpleWorker(['default'], connection=redis).work(with_scheduler=True)
+def work(with_scheduler=True):
+    SimpleWorker(queues(), connection=getRedisConnection()).work(with_scheduler=with_scheduler)
+
+
+def start(workers=None):
+    """
+    Start `workers` worker processes, `[notifications] workers` by default;
+    the first one also moves scheduled jobs to their queues.
+    """
+    if workers is None:
+        cfg = config.getConfig().get('notifications', {}) or {}
+        workers = int(cfg.get('workers', 1))
+
+    if workers <= 1:
+        return work()
+
+    processes = [
+        multiprocessing.Process(target=work, args=(index == 0, ), name=f'Worker-{index}')
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == '__main__':
-    start()
+    start(int(sys.argv[1]) if len(sys.argv) > 1 else None)
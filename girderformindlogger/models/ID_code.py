@@ -119,6 +119,30 @@ class IDCode(acl_mixin.AccessControlMixin, Model):
 
         return(idCodes)
 
+    def findIdCodesMany(self, profileIds):
+        """
+        findIdCodes for several profiles, with one query for the profiles
+        that have codes.
+
+        :param profileIds: IDs of the profiles
+        :type profileIds: list
+        :returns: dict of str(profile id) -> codes
+        """
+        idCodes = {str(profileId): [] for profileId in profileIds}
+
+        for i in self.find({'profileId': {'$in': [
+            *[str(profileId) for profileId in profileIds],
+            *[ObjectId(profileId) for profileId in profileIds]
+        ]}}):
+            if isinstance(i, dict) and 'code' in i:
+                idCodes[str(i['profileId'])].append(i['code'])
+
+        for profileId in idCodes:
+            if not len(idCodes[profileId]):
+                idCodes[profileId] = self.findIdCodes(profileId)
+
+        return(idCodes)
+
     def removeCode(self, profileId, code):
         from girderformindlogger.models.profile import Profile
         idCode = self.findOne({
@@ -6,6 +6,7 @@ from six.moves import urllib
 from girderformindlogger import logger, logprint
 from girderformindlogger.external.mongodb_proxy import MongoProxy
 from girderformindlogger.utility import config
+from girderformindlogger.utility.query_count import queryCountListener
 from bson.objectid import ObjectId
 
 _dbClients = {}
@@ -86,6 +87,8 @@ def getDbConnection(uri=None, replicaSet=None, autoRetry=True, quiet=False, **kw
 
     # Finally, kwargs take precedence
     clientOptions.update(kwargs)
+    clientOptions['event_listeners'] = list(
+        clientOptions.get('event_listeners') or []) + [queryCountListener]
     # if the connection URI overrides any option, honor it above our own
     # settings.
     uriParams = urllib.parse.parse_qs(urllib.parse.urlparse(uri).query)
@@ -11,6 +11,7 @@ from bson.objectid import ObjectId
 from girderformindlogger import events
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
+from girderformindlogger.models.index_catalog import ACCOUNT_PROFILE_INDICES
 from girderformindlogger.models.model_base import AccessControlledModel, Model
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
@@ -28,7 +29,8 @@ class AccountProfile(AccessControlledModel):
             (
                 'userId',
                 'accountId',
-                'accountName'
+                'accountName',
+                *ACCOUNT_PROFILE_INDICES
             )
         )
 
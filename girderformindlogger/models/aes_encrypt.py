@@ -1,15 +1,21 @@
 # -*- coding: utf-8 -*-
+import collections
 import copy
 import datetime
+import itertools
 import json
 import os
 import six
+import threading
 import cherrypy
 
+from concurrent.futures import ThreadPoolExecutor
+
 from bson.objectid import ObjectId
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.model_base import AccessControlledModel, Model
+from girderformindlogger.utility import config
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 from girderformindlogger import events
@@ -20,6 +26,85 @@ from Cryptodome.Cipher import AES
 import random
 import string
 
+# documents decrypted together while a cursor is iterated
+DEFAULT_DECRYPT_BATCH_SIZE = 100
+
+_decryptPool = None
+_decryptPoolLock = threading.Lock()
+
+
+def getDecryptPool():
+    """
+    Get the thread pool batches are decrypted in, or None if `[aes]
+    decrypt_workers` is unset or 0 and batches are decrypted in the calling
+    thread.
+    """
+    global _decryptPool
+
+    if _decryptPool is None:
+        with _decryptPoolLock:
+            if _decryptPool is None:
+                cfg = config.getConfig().get('aes', {}) or {}
+                workers = int(cfg.get('decrypt_workers', 0))
+                _decryptPool = ThreadPoolExecutor(workers) if workers > 1 else False
+    return _decryptPool or None
+
+
+class DecryptedCursor(object):
+    """
+    Wraps a pymongo cursor of encrypted documents. Documents are decrypted a
+    batch at a time while the cursor is iterated; other cursor methods are
+    passed through to the underlying cursor.
+    """
+
+    def __init__(self, model, cursor, batchSize=DEFAULT_DECRYPT_BATCH_SIZE):
+        self._model = model
+        self._cursor = cursor
+        self._batchSize = batchSize
+        self._batch = collections.deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._batch:
+            documents = list(itertools.islice(self._cursor, self._batchSize))
+            if not documents:
+                raise StopIteration
+            self._batch.extend(self._model.decryptMany(documents, getDecryptPool()))
+        return self._batch.popleft()
+
+    next = __next__
+
+    def __getitem__(self, index):
+        result = self._cursor[index]
+        if isinstance(index, slice):
+            return self
+        return self._model.decryptFields(result, self._model.fields)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # keep decrypting after chained calls like sort() or limit()
+            return self if result is self._cursor else result
+        return method
+
+    def rewind(self):
+        self._batch.clear()
+        self._cursor.rewind()
+        return self
+
+    def clone(self):
+        return DecryptedCursor(self._model, self._cursor.clone(), self._batchSize)
+
+
 class AESEncryption(AccessControlledModel):
     """
     This model is used for encrypting fields using AES
@@ -35,24 +120,31 @@ class AESEncryption(AccessControlledModel):
         self.fields = fields
         self.maxCount = maxCount
 
+    def getAESKey(self, document):
+        """
+        Key the fields of a document are encrypted with. Models deriving a
+        key per document override this; it must not modify the model, as
+        models are shared between threads.
+        """
+        return self.baseKey
+
     # basic function for aes-encryption
-    def encrypt(self, data, maxLength):
+    def encrypt(self, data, maxLength, key=None):
         length = len(data)
         if length < maxLength:
             # insert other characters at the end of text so that length of text won't be detected
             data = data + random.choice(string.ascii_letters+string.digits) * (maxLength - len(data))
         data = data + '%0{}d'.format(self.maxCount) % length
 
-        cipher = AES.new(self.AES_KEY, AES.MODE_EAX)
+        cipher = AES.new(key or self.baseKey, AES.MODE_EAX)
         ciphertext, tag = cipher.encrypt_and_digest(data.encode("utf-8"))
         return ciphertext + cipher.nonce + tag
 
     # basic function for aes-decryption
-    def decrypt(self, data):
+    def decrypt(self, data, key=None):
         try:
-            cipher = AES.new(self.AES_KEY, AES.MODE_EAX, nonce=data[-32:-16])
-            plaintext = cipher.decrypt(data[:-32])
-            cipher.verify(data[-16:])
+            cipher = AES.new(key or self.baseKey, AES.MODE_EAX, nonce=data[-32:-16])
+            plaintext = cipher.decrypt_and_verify(data[:-32], data[-16:])
 
             txt = plaintext.decode('utf-8')
             length = int(txt[-self.maxCount: ])
@@ -74,10 +166,7 @@ class AESEncryption(AccessControlledModel):
         if not document or not len(fields):
             return document
 
-        updateAESKey = getattr(self, 'updateAESKey', None)
-
-        if callable(updateAESKey):
-            updateAESKey(document, self.baseKey)
+        key = self.getAESKey(document)
 
         encodeDocument = getattr(self, 'encodeDocument', None)
         if callable(encodeDocument):
@@ -86,14 +175,13 @@ class AESEncryption(AccessControlledModel):
         for field in fields:
             path = field[0].split('.')
 
-            key = path.pop()
+            name = path.pop()
             data = self.navigate(document, path)
 
-            if data and data.get(key, None) and isinstance(data[key], str):
-                encrypted = self.encrypt(data[key], field[1])
-                data[key] = encrypted
+            if data and data.get(name, None) and isinstance(data[name], str):
+                encrypted = self.encrypt(data[name], field[1], key)
+                data[name] = encrypted
 
-        self.AES_KEY = self.baseKey
         return document
 
     # decrypt selected fields using AES
@@ -101,28 +189,46 @@ class AESEncryption(AccessControlledModel):
         if not document or not len(fields):
             return document
 
-        updateAESKey = getattr(self, 'updateAESKey', None)
-        if callable(updateAESKey):
-            updateAESKey(document, self.baseKey)
+        key = self.getAESKey(document)
 
         for field in fields:
             path = field[0].split('.')
 
-            key = path.pop()
+            name = path.pop()
             data = self.navigate(document, path)
 
-            if data and data.get(key, None) and isinstance(data[key], bytes):
-                status, decrypted = self.decrypt(data[key])
+            if data and data.get(name, None) and isinstance(data[name], bytes):
+                status, decrypted = self.decrypt(data[name], key)
                 if status == 'ok':
-                    data[key] = decrypted
+                    data[name] = decrypted
 
         decodeDocument = getattr(self, 'decodeDocument', None)
         if callable(decodeDocument):
             decodeDocument(document)
 
-        self.AES_KEY = self.baseKey
         return document
 
+    def decryptMany(self, documents, executor=None):
+        """
+        Decrypt a batch of documents in place.
+
+        :param documents: documents as read from the database
+        :type documents: list
+        :param executor: pool to spread the batch over, None to decrypt in
+            the calling thread.
+        :type executor: concurrent.futures.Executor or None
+        :returns: the documents
+        """
+        if executor is None or len(documents) < 2:
+            for document in documents:
+                self.decryptFields(document, self.fields)
+        else:
+            list(executor.map(
+                lambda document: self.decryptFields(document, self.fields),
+                documents
+            ))
+        return documents
+
     # overwrite functions which save data in mongodb
     def save(self, document, validate=True, triggerEvents=True):
         if validate and triggerEvents:
@@ -137,11 +243,16 @@ class AESEncryption(AccessControlledModel):
         return self.decryptFields(super().save(document, False, triggerEvents), self.fields)
 
     def find(self, *args, **kwargs):
-        documents = list(super().find(*args, **kwargs))
-        for document in documents:
-            self.decryptFields(document, self.fields)
-
-        return documents
+        """
+        Same as Model.find, but the returned cursor decrypts the documents
+        as they are iterated.
+
+        :param decryptBatchSize: number of documents decrypted at a time.
+        :type decryptBatchSize: int
+        :returns: DecryptedCursor
+        """
+        batchSize = kwargs.pop('decryptBatchSize', DEFAULT_DECRYPT_BATCH_SIZE)
+        return DecryptedCursor(self, super().find(*args, **kwargs), batchSize)
 
     def findOne(self, *args, **kwargs):
         document = super().findOne(*args, **kwargs)
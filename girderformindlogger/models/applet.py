@@ -34,14 +34,16 @@ from girderformindlogger.constants import AccessType, SortDir, USER_ROLES
 from girderformindlogger.exceptions import AccessException, GirderException, \
     ValidationException
 from girderformindlogger.models.collection import Collection as CollectionModel
-from girderformindlogger.models.folder import Folder as FolderModel
+from girderformindlogger.models.folder import Folder as FolderModel, \
+    renamedNamePatterns
 from girderformindlogger.models.group import Group as GroupModel
 from girderformindlogger.models.protoUser import ProtoUser as ProtoUserModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility.progress import noProgress,                   \
     setResponseTimeLimit
 from girderformindlogger.models.account_profile import AccountProfile
-from girderformindlogger.models.profile import Profile
+from girderformindlogger.models.profile import Profile, getDisplayCacheQueue
+from girderformindlogger.models.tenant import getTenantRouter
 from girderformindlogger.models.events import Events as EventsModel
 from girderformindlogger.models.item import Item as ItemModel
 from girderformindlogger.external.notification import send_applet_update_notification
@@ -57,6 +59,25 @@ RETENTION_SET = {
     'year': 365
 }
 
+# documents fetched per round trip when exporting response data
+RESPONSE_DATA_BATCH_SIZE = 500
+
+# fields of a response read for the export; `meta.items` and
+# `meta.responseStarted` are needed to decrypt `meta.responses`
+RESPONSE_DATA_FIELDS = [
+    'created',
+    'meta.activity',
+    'meta.subject.@id',
+    'meta.responses',
+    'meta.items',
+    'meta.subScales',
+    'meta.responseStarted',
+    'meta.responseCompleted',
+    'meta.scheduledTime',
+    'meta.timeout',
+    'meta.applet.version'
+]
+
 class Applet(FolderModel):
     """
     Applets are access-controlled Folders, each of which links to an
@@ -215,9 +236,9 @@ class Applet(FolderModel):
 
         return formatted
 
-    def getSchedule(self, applet, user, getAllEvents, eventFilter=None, localEvents=[]):
+    def getSchedule(self, applet, user, getAllEvents, eventFilter=None, localEvents=[], profile=None, events=None):
         if not getAllEvents:
-            schedule = EventsModel().getScheduleForUser(applet['_id'], user['_id'], eventFilter)
+            schedule = EventsModel().getScheduleForUser(applet['_id'], user['_id'], eventFilter, profile, events)
             events = schedule.get('events', {})
 
             for localEvent in localEvents:
@@ -552,7 +573,7 @@ class Applet(FolderModel):
 
             Profile().remove(user)
 
-        ResponseItem().removeWithQuery(
+        getTenantRouter().forApplet(ResponseItem(), applet['_id']).removeWithQuery(
             query={
                 "baseParentType": 'user',
                 "meta.applet.@id": applet['_id']
@@ -591,9 +612,12 @@ class Applet(FolderModel):
         if not n:
             name = appletName
 
+        # the name and those it could be renamed to, looked up at once
         query = {
             'parentId': appletsCollection['_id'],
-            'meta.applet.displayName': name,
+            'meta.applet.displayName': {
+                '$in': [name] + renamedNamePatterns([appletName])
+            },
             'parentCollection': 'collection'
         }
 
@@ -604,13 +628,13 @@ class Applet(FolderModel):
                 '$ne': currentApplet['_id']
             }
 
-        existing = self.findOne(query)
-        while existing:
+        taken = set(
+            applet.get('meta', {}).get('applet', {}).get('displayName')
+            for applet in self.find(query, fields=['meta.applet.displayName'])
+        )
+        while name in taken:
             n = n + 1
             name = '%s (%d)' % (appletName, n)
-            query['meta.applet.displayName'] = name
-
-            existing = self.findOne(query)
 
         return name
 
@@ -903,6 +927,7 @@ class Applet(FolderModel):
 
         metadata = applet.get('meta', {})
         protocolId = metadata.get('protocol', {}).get('_id', '/').split('/')[-1]
+        responseModel = getTenantRouter().forApplet(ResponseItem(), applet['_id'])
 
         if metadata.get('protocol', {}).get('url', None):
             if not protocolId:
@@ -928,7 +953,7 @@ class Applet(FolderModel):
                 for activity in activities:
                     activityIDRef[str(activity['duplicateOf'])] = activity['_id']
 
-                    ResponseItem().update({
+                    responseModel.update({
                         'meta.activity.@id': activity['duplicateOf'],
                         'meta.applet.@id': applet['_id']
                     }, {
@@ -1044,7 +1069,7 @@ class Applet(FolderModel):
                 jsonld_expander.convertObjectToSingleFileFormat(item, 'screen', user, '{}/{}'.format(str(activity['_id']), str(item['_id'])), True)
 
             for activity in activities:
-                ResponseItem().update({
+                responseModel.update({
                     'meta.activity.@id': activity['_id'],
                     'meta.applet.@id': applet['_id']
                 }, {
@@ -1101,18 +1126,32 @@ class Applet(FolderModel):
         """
         Function to collect response data available to given reviewer.
 
+        Access is checked right away, while the data itself is read lazily so
+        that memory use does not grow with the number of responses.
+
         :param appletId: ID of applet for which to get response data
         :type appletId: ObjectId or str
         :param reviewer: Reviewer making request
         :type reviewer: dict
-        :reutrns: TBD
+        :param users: IDs of profiles to restrict the data to, all if empty
+        :type users: list
+        :returns: generator of text chunks making up a JSON object with
+            `responses`, `dataSources`, `subScaleSources`, `keys` and the
+            history data of the items referred to by the responses.
         """
-        from girderformindlogger.models.ID_code import IDCode
-        from girderformindlogger.models.response_folder import ResponseItem
-        from girderformindlogger.models.user import User
-        from girderformindlogger.models.protocol import Protocol
-        from pymongo import DESCENDING
+        (applet, query, profileIDToData) = self._responseDataQuery(
+            appletId, reviewer, users)
+
+        return self._streamResponseData(applet, query, profileIDToData)
+
+    def _responseDataQuery(self, appletId, reviewer, users):
+        """
+        Check that the reviewer may see the responses of an applet, and build
+        the query for the responses in the retention window of the profiles
+        they review.
 
+        :returns: (applet, query, dict of str(profile id) -> profile)
+        """
         if not any([
             self.isReviewer(appletId, reviewer),
             self.isManager(appletId, reviewer)]):
@@ -1167,27 +1206,144 @@ class Applet(FolderModel):
                 '$gte': applet['created']
             }
 
-        responses = list(ResponseItem().find(
-            query=query,
-            user=reviewer,
-            sort=[("created", DESCENDING)]
-        ))
+        profileIDToData = {}
+        for profile in profiles:
+            profileIDToData[str(profile['_id'])] = profile
+
+        return (applet, query, profileIDToData)
 
-        user=getCurrentUser()
+    def _formatResponse(self, response, profile):
+        """
+        Convert a response item into a row of the response data export.
+
+        :param response: response item with the fields in RESPONSE_DATA_FIELDS
+        :type response: dict
+        :param profile: profile of the subject of the response
+        :type profile: dict
+        """
+        meta = response.get('meta', {})
 
-        schedule = EventsModel().getScheduleForUser(applet['_id'], user['_id'])
+        MRN = profile['MRN'] if profile.get('MRN', '') else f"None ({profile.get('userDefined', {}).get('email', '')})"
 
-        data = {
-            'dataSources': {},
-            'subScaleSources': {},
-            'keys': [],
-            'responses': []
+        times = {
+            'responseStarted': '',
+            'responseCompleted': '',
+            'scheduledTime': ''
         }
 
-        userKeys = {}
-        profileIDToData = {}
-        for profile in profiles:
-            profileIDToData[str(profile['_id'])] = profile
+        for key in times:
+            ts = meta.get(key, 0)
+            if not ts:
+                continue
+
+            secs, millis = divmod(ts, 1000)
+            date_time = dt.utcfromtimestamp(secs).replace(microsecond=millis * 1000)
+            times[key] = date_time.strftime("%Y-%m-%d %H:%M:%S")
+
+        return {
+            '_id': response['_id'],
+            'activity': meta.get('activity', {}),
+            'userId': str(profile['_id']),
+            'MRN': MRN,
+            'data': meta.get('responses', {}),
+            'subScales': meta.get('subScales', {}),
+            'created': response.get('created', None),
+            'responseStarted':times['responseStarted'],
+            'responseCompleted':times['responseCompleted'],
+            'responseScheduled':times['scheduledTime'],
+            'timeout': meta.get('timeout', 0),
+            'version': meta.get('applet', {}).get('version', '0.0.0')
+        }
+
+    def exportResponses(self, appletId, reviewer, users=[], activities=[],
+                        fromDate=None, toDate=None, after=None):
+        """
+        Iterate over the responses available to a reviewer in the order they
+        were stored, one export row at a time. Each row carries the encrypted
+        data sources of its response along with the public key of the user.
+
+        Rows are ordered by `_id`, so the `_id` of the last row received can
+        be passed as `after` to resume an interrupted export.
+
+        :param appletId: ID of applet for which to export responses
+        :type appletId: ObjectId or str
+        :param reviewer: Reviewer making request
+        :type reviewer: dict
+        :param users: IDs of profiles to restrict the export to, all if empty
+        :type users: list
+        :param activities: IDs of activities to restrict the export to
+        :type activities: list
+        :param fromDate: only export responses created at or after this time
+        :type fromDate: datetime or None
+        :param toDate: only export responses created before this time
+        :type toDate: datetime or None
+        :param after: resume token, the `_id` of the last row received
+        :type after: ObjectId or str or None
+        :returns: generator of dicts
+        """
+        (applet, query, profileIDToData) = self._responseDataQuery(
+            appletId, reviewer, users)
+
+        # `created` is stored as naive UTC
+        (fromDate, toDate) = (
+            date.astimezone(pytz.utc).replace(tzinfo=None) if date and date.tzinfo else date
+            for date in (fromDate, toDate)
+        )
+
+        if fromDate:
+            query['created'] = {'$gte': max(fromDate, query['created']['$gte'])}
+        if toDate:
+            query['created']['$lt'] = toDate
+        if activities:
+            query['meta.activity.@id'] = {
+                '$in': [ObjectId(activity) for activity in activities]
+            }
+        if after:
+            query['_id'] = {'$gt': ObjectId(after)}
+
+        return self._iterExportRows(applet, query, profileIDToData)
+
+    def _iterExportRows(self, applet, query, profileIDToData):
+        from girderformindlogger.models.response_folder import ResponseItem
+        from pymongo import ASCENDING
+
+        responseModel = getTenantRouter().forApplet(ResponseItem(), applet['_id'])
+
+        for response in responseModel.find(
+            query,
+            fields=RESPONSE_DATA_FIELDS + [
+                'meta.userPublicKey', 'meta.dataSource', 'meta.subScaleSource'
+            ],
+            sort=[("_id", ASCENDING)]
+        ).batch_size(RESPONSE_DATA_BATCH_SIZE):
+            meta = response.get('meta', {})
+
+            profile = profileIDToData.get(str(meta.get('subject', {}).get('@id', None)), None)
+
+            if not profile:
+                continue
+
+            row = self._formatResponse(response, profile)
+            for key in ('userPublicKey', 'dataSource', 'subScaleSource'):
+                row[key] = meta.get(key, None)
+
+            yield row
+
+    def _streamResponseData(self, applet, query, profileIDToData):
+        """
+        Write out the response data of an applet piece by piece. Responses are
+        read in batches with only the fields needed for the export; the
+        encrypted data sources are read in separate passes afterwards, so no
+        more than one batch of documents is held at a time.
+        """
+        from girderformindlogger.models.response_folder import ResponseItem
+        from girderformindlogger.models.protocol import Protocol
+        from girderformindlogger.utility import JsonEncoder
+        from pymongo import DESCENDING
+
+        encoder = JsonEncoder(sort_keys=True, allow_nan=False)
+        sort = [("created", DESCENDING)]
+        responseModel = getTenantRouter().forApplet(ResponseItem(), applet['_id'])
 
         IRIs = {}
         # IRIs refers to available versions for specified IRI
@@ -1198,8 +1354,19 @@ class Applet(FolderModel):
         #            }
 
         insertedIRI = {}
+        latest = None
+
+        yield '{"responses": ['
+
+        separator = ''
+        for response in responseModel.find(
+            query,
+            fields=RESPONSE_DATA_FIELDS,
+            sort=sort
+        ).batch_size(RESPONSE_DATA_BATCH_SIZE):
+            if latest is None:
+                latest = response['created']
 
-        for response in responses:
             meta = response.get('meta', {})
 
             profile = profileIDToData.get(str(meta.get('subject', {}).get('@id', None)), None)
@@ -1207,73 +1374,74 @@ class Applet(FolderModel):
             if not profile:
                 continue
 
-            MRN = profile['MRN'] if profile.get('MRN', '') else f"None ({profile.get('userDefined', {}).get('email', '')})"
-
-            times = {
-                'responseStarted': '',
-                'responseCompleted': '',
-                'scheduledTime': ''
-            }
-
-            for key in times:
-                ts = meta.get(key, 0)
-                if not ts:
-                    continue
-
-                secs, millis = divmod(ts, 1000)
-                date_time = dt.utcfromtimestamp(secs).replace(microsecond=millis * 1000)
-                times[key] = date_time.strftime("%Y-%m-%d %H:%M:%S")
-
-            data['responses'].append({
-                '_id': response['_id'],
-                'activity': meta.get('activity', {}),
-                'userId': str(profile['_id']),
-                'MRN': MRN,
-                'data': meta.get('responses', {}),
-                'subScales': meta.get('subScales', {}),
-                'created': response.get('created', None),
-                'responseStarted':times['responseStarted'],
-                'responseCompleted':times['responseCompleted'],
-                'responseScheduled':times['scheduledTime'],
-                'timeout': meta.get('timeout', 0),
-                'version': meta['applet'].get('version', '0.0.0')
-            })
+            yield separator + encoder.encode(self._formatResponse(response, profile))
+            separator = ', '
 
             for IRI in meta.get('responses', {}):
                 if IRI not in IRIs:
                     IRIs[IRI] = []
 
-                identifier = '{}/{}'.format(IRI, meta['applet'].get('version', '0.0.0'))
+                identifier = '{}/{}'.format(IRI, meta.get('applet', {}).get('version', '0.0.0'))
 
                 if identifier not in insertedIRI:
-                    IRIs[IRI].append(meta['applet'].get('version', '0.0.0'))
+                    IRIs[IRI].append(meta.get('applet', {}).get('version', '0.0.0'))
                     insertedIRI[identifier] = True
 
-            if 'userPublicKey' in meta:
+        yield ']'
+
+        keys = []
+        userKeys = {}
+
+        for (field, name) in (('dataSource', 'dataSources'), ('subScaleSource', 'subScaleSources')):
+            yield ', "{}": {{'.format(name)
+
+            # responses submitted after the first pass started are left out
+            if latest is None:
+                yield '}'
+                continue
+
+            sourceQuery = dict(query)
+            sourceQuery['created'] = dict(query['created'], **{'$lte': latest})
+            sourceQuery['meta.userPublicKey'] = {'$exists': True}
+            sourceQuery['meta.' + field] = {'$exists': True}
+
+            separator = ''
+            for response in responseModel.find(
+                sourceQuery,
+                fields=['meta.subject.@id', 'meta.userPublicKey', 'meta.' + field],
+                sort=sort
+            ).batch_size(RESPONSE_DATA_BATCH_SIZE):
+                meta = response.get('meta', {})
+
+                if str(meta.get('subject', {}).get('@id', None)) not in profileIDToData:
+                    continue
+
                 keyDump = json_util.dumps(meta['userPublicKey'])
                 if keyDump not in userKeys:
-                    userKeys[keyDump] = len(data['keys'])
-                    data['keys'].append(meta['userPublicKey'])
+                    userKeys[keyDump] = len(keys)
+                    keys.append(meta['userPublicKey'])
 
-                data['dataSources'][str(response['_id'])] = {
-                    'key': userKeys[keyDump],
-                    'data': meta['dataSource']
-                }
-
-                if 'subScaleSource' in meta:
-                    data['subScaleSources'][str(response['_id'])] = {
+                yield separator + '{}: {}'.format(
+                    encoder.encode(str(response['_id'])),
+                    encoder.encode({
                         'key': userKeys[keyDump],
-                        'data': meta['subScaleSource']
-                    }
+                        'data': meta[field]
+                    })
+                )
+                separator = ', '
 
-        data.update(
-            Protocol().getHistoryDataFromItemIRIs(
-                applet.get('meta', {}).get('protocol', {}).get('_id', '').split('/')[-1],
-                IRIs
-            )
+            yield '}'
+
+        yield ', "keys": ' + encoder.encode(keys)
+
+        history = Protocol().getHistoryDataFromItemIRIs(
+            applet.get('meta', {}).get('protocol', {}).get('_id', '').split('/')[-1],
+            IRIs
         )
+        for key in sorted(history):
+            yield ', {}: {}'.format(encoder.encode(key), encoder.encode(history[key]))
 
-        return data
+        yield '}'
 
     def updateRelationship(self, applet, relationship):
         """
@@ -1503,46 +1671,70 @@ class Applet(FolderModel):
         groupByDateActivity=True,
         startDate=None,
         retrieveLastResponseTime=False,
-        localInfo={}
+        localInfo={},
+        prefetched=None
     ):
+        """
+        :param prefetched: data loaded for several applets at once, see
+            prefetchFormatted.
+        :type prefetched: dict or None
+        """
         from girderformindlogger.utility import jsonld_expander
         from girderformindlogger.utility.response import responseDateList, last7Days
         from girderformindlogger.models.protocol import Protocol
 
         formatted = {}
+        prefetched = prefetched or {}
+
+        def formatApplet(responseDates):
+            # formatLdObject returns the cache of cached applets as is
+            if prefetched.get('cache') is not None:
+                return prefetched['cache']
+            return jsonld_expander.formatLdObject(
+                applet,
+                'applet',
+                reviewer,
+                refreshCache=False,
+                responseDates=responseDates
+            )
 
         if not localInfo.get('contentUpdateTime', None) or applet['updated'].isoformat() != localInfo['contentUpdateTime']:
             localVersion = localInfo.get('appletVersion', None)
             updates = None
+            isInitialVersion = False
+            delta = None
 
             if localVersion:
-                (isInitialVersion, updates) = Protocol().getProtocolChanges(
+                changes = Protocol().getProtocolChanges(
                     applet.get('meta', {}).get('protocol', {}).get('_id', '').split('/')[-1],
                     localVersion,
                     localInfo['contentUpdateTime']
                 )
+                if changes:
+                    (isInitialVersion, updates) = changes
 
-            formatted = {
-                **jsonld_expander.formatLdObject(
+            if updates and not isInitialVersion:
+                # only the changed activities and screens, without loading
+                # the cache of the whole applet
+                delta = jsonld_expander.formatAppletDelta(
                     applet,
-                    'applet',
                     reviewer,
-                    refreshCache=False,
-                    responseDates=False
-                ),
+                    updates['activity'].keys(),
+                    updates['screen'].keys()
+                )
+
+            def content(responseDates):
+                return delta if delta is not None else formatApplet(responseDates)
+
+            formatted = {
+                **content(False),
                 "users": self.getAppletUsers(applet, reviewer),
                 "groups": self.getAppletGroups(
                     applet,
                     arrayOfObjects=True
                 )
             } if role in ["coordinator", "manager"] else {
-                **jsonld_expander.formatLdObject(
-                    applet,
-                    'applet',
-                    reviewer,
-                    refreshCache=False,
-                    responseDates=(role == "user")
-                ),
+                **content(role == "user"),
                 "groups": [
                     group for group in self.getAppletGroups(applet).get(
                         role
@@ -1585,7 +1777,9 @@ class Applet(FolderModel):
                 reviewer,
                 retrieveAllEvents,
                 eventFilter if not retrieveAllEvents else None,
-                localInfo.get('localEvents', [])
+                localInfo.get('localEvents', []),
+                prefetched.get('profile'),
+                prefetched.get('events')
             )
 
             if schedule:
@@ -1602,11 +1796,13 @@ class Applet(FolderModel):
                 True,
                 groupByDateActivity,
                 localInfo.get('localItems', []),
-                localInfo.get('localActivities', [])
+                localInfo.get('localActivities', []),
+                prefetched.get('profile'),
+                prefetched.get('tokens')
             )
 
         if retrieveLastResponseTime:
-            profile = Profile().findOne({'appletId': applet['_id'], 'userId': reviewer['_id']})
+            profile = prefetched.get('profile') or Profile().findOne({'appletId': applet['_id'], 'userId': reviewer['_id']})
             activities = profile['completed_activities']
 
             formatted['lastResponses'] = {}
@@ -1658,13 +1854,15 @@ class Applet(FolderModel):
                 'pending': []
             }
 
-            for p in list(profileModel.find(query={'appletId': applet['_id'], 'userId': {'$exists': True}, 'profile': True, 'deactivated': {'$ne': True}})):
-                    profile = profileModel.displayProfileFields(
-                        p,
-                        user,
-                        forceManager=True
-                    )
+            profiles = list(profileModel.find(query={'appletId': applet['_id'], 'userId': {'$exists': True}, 'profile': True, 'deactivated': {'$ne': True}}))
+            displays = profileModel.displayProfileFieldsMany(
+                profiles,
+                user,
+                forceManager=True
+            )
 
+            for (p, profile) in zip(profiles, displays):
+                    profile = dict(profile)
                     if retrieveRoles:
                         profile['roles'] = p['roles']
                     if 'refreshRequest' in p and retrieveRequests:
@@ -1680,11 +1878,11 @@ class Applet(FolderModel):
                     })
 
 
-            missing = threading.Thread(
-                target=profileModel.generateMissing,
-                args=(applet,)
+            getDisplayCacheQueue().submit(
+                ('generateMissing', applet['_id']),
+                profileModel.generateMissing,
+                applet
             )
-            missing.start()
 
             if len(userDict['active']):
                 return(userDict)
@@ -1699,6 +1897,92 @@ class Applet(FolderModel):
             print(sys.exc_info())
             return({traceback.print_tb(sys.exc_info()[2])})
 
+    def getAppletUsersPage(
+        self,
+        applet,
+        user,
+        limit=50,
+        sort='created',
+        sortDir=SortDir.ASCENDING,
+        after=None,
+        search=None,
+        fields=None,
+        reviewerId=None,
+        retrieveRoles=False,
+        retrieveRequests=False,
+        pendingAfter=None
+    ):
+        """
+        Get a page of the users of an applet, see Profile.listAppletProfiles,
+        and a page of its pending invitations, see
+        Invitation.listAppletInvitations. Each list is paged with its own
+        token; a list is returned if its token is given or if no token is.
+
+        :param pendingAfter: token of the page of invitations to get
+        :type pendingAfter: str or None
+        :param fields: keys of the user entries to return, None for all
+        :type fields: list or None
+        :param reviewerId: only list the users of this reviewer's profile
+        :type reviewerId: ObjectId or None
+        :returns: dict with the `active` users, the `pending` invitations
+            and the tokens of their next pages, `next` and `pendingNext`
+            (None after the last page)
+        """
+        from girderformindlogger.models.invitation import Invitation
+
+        firstPages = not after and not pendingAfter
+
+        profileModel = Profile()
+        (profiles, nextPage) = profileModel.listAppletProfiles(
+            applet['_id'],
+            query={'reviewers': reviewerId} if reviewerId else None,
+            limit=limit,
+            sort=sort,
+            sortDir=sortDir,
+            after=after,
+            search=search
+        ) if after or firstPages else ([], None)
+
+        active = []
+        for (p, profile) in zip(profiles, profileModel.displayProfileFieldsMany(
+            profiles,
+            user,
+            forceManager=True
+        )):
+            profile = dict(profile)
+            if retrieveRoles:
+                profile['roles'] = p['roles']
+            if 'refreshRequest' in p and retrieveRequests:
+                profile['refreshRequest'] = p['refreshRequest']
+            active.append(profile)
+
+        (pending, pendingNextPage) = ([], None)
+        if (pendingAfter or firstPages) and not reviewerId:
+            (invitations, pendingNextPage) = Invitation().listAppletInvitations(
+                applet['_id'],
+                limit=limit,
+                sort=sort,
+                sortDir=sortDir,
+                after=pendingAfter,
+                search=search
+            )
+            pending = [
+                {key: value for (key, value) in p.items() if value}
+                for p in invitations
+            ]
+
+        if fields:
+            fields = set(fields) | {'_id'}
+            active = [{k: v for k, v in entry.items() if k in fields} for entry in active]
+            pending = [{k: v for k, v in entry.items() if k in fields} for entry in pending]
+
+        return {
+            'active': active,
+            'pending': pending,
+            'next': nextPage,
+            'pendingNext': pendingNextPage
+        }
+
     def getAppletInvitations(self, applet):
         from girderformindlogger.models.invitation import Invitation
 
@@ -1775,6 +2059,129 @@ class Applet(FolderModel):
                     "Invalid Applet ID."
                 )
 
+    def loadMany(self, ids, level=AccessType.READ, user=None):
+        """
+        Load several applets with one query, checking access as load does.
+        Applets in the "Applets" collection are checked against their parent
+        collection once rather than once per applet; other ones go through
+        load.
+
+        :param ids: IDs of the applets
+        :type ids: list
+        :param level: The required access type for the applets.
+        :type level: AccessType
+        :param user: The user to check access against.
+        :type user: dict or None
+        :returns: list of applets in the order of `ids`, None where load
+            would return None.
+        """
+        ids = [ObjectId(_id) for _id in ids]
+        docs = {
+            doc['_id']: doc for doc in self.find({'_id': {'$in': ids}})
+        }
+
+        parents = {}
+        applets = []
+        for _id in ids:
+            doc = docs.get(_id)
+
+            if doc is None or doc.get('parentCollection') != 'collection' or \
+                    'baseParentType' not in doc or 'lowerName' not in doc:
+                applets.append(self.load(_id, level=level, user=user) if doc else None)
+                continue
+
+            self.requireAccess(doc, user, level)
+            if doc['parentId'] not in parents:
+                parents[doc['parentId']] = CollectionModel().load(doc['parentId'], force=True)
+            parent = parents[doc['parentId']]
+
+            if parent is None:
+                raise ValidationException(
+                    "Invalid Applet ID."
+                )
+
+            if '_modelType' not in doc:
+                doc['_modelType'] = 'folder'
+
+            applets.append(doc if (
+                parent['name'] == "Applets" and
+                doc['baseParentType'] in {'collection', 'user', 'folder'}
+            ) else None)
+
+        return applets
+
+    def prefetchFormatted(
+        self,
+        applets,
+        reviewer,
+        retrieveSchedule=False,
+        retrieveAllEvents=False,
+        retrieveResponses=False,
+        retrieveLastResponseTime=False,
+        localInfo=None
+    ):
+        """
+        Load what appletFormatted needs for several applets with one query
+        per collection: the caches, the reviewer's profiles, their events
+        and their response tokens.
+
+        :param applets: applets to be formatted for the reviewer
+        :type applets: list
+        :param localInfo: str(applet id) -> localInfo passed to appletFormatted
+        :type localInfo: dict
+        :returns: dict of str(applet id) -> `prefetched` of appletFormatted
+        """
+        from girderformindlogger.models.response_tokens import ResponseTokens
+        from girderformindlogger.utility.jsonld_expander import loadCaches
+        from girderformindlogger.utility.response import last7DaysRange
+
+        localInfo = localInfo or {}
+        applets = [applet for applet in applets if applet]
+
+        def needsCache(applet):
+            # up to date applets are not formatted, and those of a known
+            # version are formatted from the changes since
+            info = localInfo.get(str(applet['_id']), {})
+            return not info.get('appletVersion') and (
+                not info.get('contentUpdateTime') or
+                applet['updated'].isoformat() != info['contentUpdateTime']
+            )
+
+        caches = loadCaches([
+            applet.get('cached') for applet in applets if needsCache(applet)
+        ])
+        prefetched = {
+            str(applet['_id']): {
+                'cache': caches.get(str(applet.get('cached')))
+            } for applet in applets
+        }
+
+        if not (retrieveSchedule or retrieveResponses or retrieveLastResponseTime):
+            return prefetched
+
+        profiles = list(Profile().find({
+            'appletId': {'$in': [applet['_id'] for applet in applets]},
+            'userId': reviewer['_id']
+        }))
+        for profile in profiles:
+            prefetched[str(profile['appletId'])]['profile'] = profile
+
+        if retrieveSchedule and not retrieveAllEvents:
+            events = EventsModel().getEventsForProfiles(profiles)
+            for (appletId, appletEvents) in events.items():
+                prefetched[appletId]['events'] = appletEvents
+
+        if retrieveResponses:
+            tokens = ResponseTokens().getResponseTokensMany(profiles, {
+                str(profile['appletId']): last7DaysRange(
+                    localInfo.get(str(profile['appletId']), {}).get('startDate', None)
+                )[0] for profile in profiles
+            }, False)
+            for (appletId, appletTokens) in tokens.items():
+                prefetched[appletId]['tokens'] = appletTokens
+
+        return prefetched
+
     def updateActivities(self, applet, obj):
         activities = [ObjectId(obj['activities'][activity]['_id'].split('/')[-1])
                       for activity in obj.get('activities', [])]
@@ -1,19 +1,151 @@
 # -*- coding: utf-8 -*-
+import collections
 import copy
 import datetime
 import json
 import os
+import pickle
 import six
+import threading
+import zlib
 
+from bson import BSON
+from bson.binary import Binary
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidDocument
 from bson.objectid import ObjectId
 from girderformindlogger import events
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.model_base import AccessControlledModel, Model
+from girderformindlogger.utility import config
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 from bson import json_util
 
+# default upper bound of the process-local document cache (128 MB)
+DEFAULT_DOCUMENT_CACHE_BYTES = 128 * 1024 * 1024
+
+# storage formats of `cache_data`, recorded in the `format` field
+# (documents without the field predate it and use CACHE_FORMAT_JSON)
+CACHE_FORMAT_JSON = 1
+CACHE_FORMAT_BSON_ZLIB = 2
+
+_BSON_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def encodeCacheData(cachedData):
+    """
+    Serialize formatted data for the `cache_data` field.
+
+    :param cachedData: formatted applet, protocol, activity or screen
+    :type cachedData: dict
+    :returns: (format, encoded data)
+    """
+    try:
+        return (
+            CACHE_FORMAT_BSON_ZLIB,
+            Binary(zlib.compress(BSON.encode(cachedData, codec_options=_BSON_OPTIONS)))
+        )
+    except (InvalidDocument, TypeError):
+        # not representable as a BSON document (ie, non-string keys)
+        return (CACHE_FORMAT_JSON, json_util.dumps(cachedData))
+
+
+def decodeCacheData(document):
+    """
+    Deserialize the `cache_data` field of a cache document.
+
+    :param document: cache document
+    :type document: dict
+    :returns: formatted data or None
+    """
+    data = document.get('cache_data')
+    if not data:
+        return None
+
+    if document.get('format', CACHE_FORMAT_JSON) == CACHE_FORMAT_BSON_ZLIB:
+        return BSON(zlib.decompress(data)).decode(codec_options=_BSON_OPTIONS)
+
+    return json_util.loads(data)
+
+
+class DocumentLRU(object):
+    """
+    Size-bounded, process-local LRU of decoded cache documents.
+
+    Entries are keyed by the cache ``_id`` and only returned while the stored
+    ``updated`` timestamp still matches the one in the database, so writes made
+    by other processes are picked up on the next read. Values are kept pickled:
+    the byte count is exact and every hit hands out an independent copy that
+    callers are free to mutate.
+    """
+
+    def __init__(self, maxBytes=DEFAULT_DOCUMENT_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, _id, updated):
+        key = str(_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != updated:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            blob = entry[1]
+        return pickle.loads(blob)
+
+    def put(self, _id, updated, data):
+        if data is None or self.maxBytes <= 0:
+            return
+
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.maxBytes:
+            return
+
+        key = str(_id)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (updated, blob)
+            self.bytes += len(blob)
+            while self.bytes > self.maxBytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, _id):
+        with self._lock:
+            self._discard(str(_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'maxBytes': self.maxBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': float(self.hits) / lookups if lookups else 0.0
+            }
+
 
 class Cache(Model):
     """
@@ -29,38 +161,155 @@ class Cache(Model):
             )
         )
 
+        cacheConfig = config.getConfig().get('cache', {}) or {}
+        self._documents = DocumentLRU(int(cacheConfig.get(
+            'document_cache_bytes',
+            DEFAULT_DOCUMENT_CACHE_BYTES
+        )))
+
     def validate(self, document):
         return document
 
     def insertCache(self, collection_name, source_id, model_type, cachedData):
+        dataFormat, data = encodeCacheData(cachedData)
+
         newCache = {
             'collection_name': collection_name,
             'source_id': source_id,
             'model_type': model_type,
             'updated': datetime.datetime.utcnow(),
-            'cache_data': json_util.dumps(cachedData)
+            'format': dataFormat,
+            'cache_data': data
         }
         return self.save(newCache)
 
+    def insertCaches(self, caches):
+        """
+        Insert the caches of several documents with one write.
+
+        :param caches: (collection name, source id, model type, cached data)
+            tuples
+        :type caches: list
+        :returns: list of the new cache ids, in the order of the caches.
+        """
+        now = datetime.datetime.utcnow()
+
+        documents = []
+        for (collection_name, source_id, model_type, cachedData) in caches:
+            dataFormat, data = encodeCacheData(cachedData)
+            documents.append({
+                'collection_name': collection_name,
+                'source_id': source_id,
+                'model_type': model_type,
+                'updated': now,
+                'format': dataFormat,
+                'cache_data': data
+            })
+
+        return [document['_id'] for document in self.insertMany(documents)]
+
     def updateCache(self, original_id, collection_name, source_id, model_type, cachedData):
+        self._documents.invalidate(original_id)
+
+        dataFormat, data = encodeCacheData(cachedData)
+
         return self.save({
             '_id': ObjectId(original_id),
             'collection_name': collection_name,
             'source_id': source_id,
             'model_type': model_type,
             'updated': datetime.datetime.utcnow(),
-            'cache_data': json_util.dumps(cachedData)
+            'format': dataFormat,
+            'cache_data': data
         })
-    
+
+    def removeCache(self, _id):
+        self._documents.invalidate(_id)
+
+        return self.removeWithQuery({'_id': ObjectId(_id)})
+
+    def _loadDocument(self, document):
+        data = decodeCacheData(document)
+
+        self._documents.put(document['_id'], document.get('updated'), data)
+        return data
+
     def getCacheData(self, _id):
-        document = self.findOne(query={'_id': ObjectId(_id)})
-        if document.get('cache_data'):
-            return json_util.loads(document.get('cache_data'))
-        return None
+        _id = ObjectId(_id)
+
+        current = self.findOne(query={'_id': _id}, fields=['updated'])
+        if not current:
+            self._documents.invalidate(_id)
+            return None
+
+        data = self._documents.get(_id, current.get('updated'))
+        if data is not None:
+            return data
+
+        document = self.findOne(query={'_id': _id})
+        return self._loadDocument(document) if document else None
+
+    def getCacheDataMany(self, ids):
+        """
+        Load several cache documents with one query for the documents missing
+        from the process-local cache.
+
+        :param ids: cache ids to load
+        :type ids: list of ObjectId or str
+        :returns: dict of str(cache id) -> decoded cache data
+        """
+        ids = list(set(ObjectId(_id) for _id in ids if _id))
+        if not ids:
+            return {}
+
+        result = {}
+        missing = []
+        for current in self.find({'_id': {'$in': ids}}, fields=['updated']):
+            data = self._documents.get(current['_id'], current.get('updated'))
+            if data is not None:
+                result[str(current['_id'])] = data
+            else:
+                missing.append(current['_id'])
+
+        if missing:
+            for document in self.find({'_id': {'$in': missing}}):
+                result[str(document['_id'])] = self._loadDocument(document)
+
+        return result
 
     def getFromSourceID(self, collection_name, source_id):
         document = self.findOne(query={'collection_name': collection_name, 'source_id': source_id})
-        if document.get('cache_data'):
-            return json_util.loads(document.get('cache_data'))
-        return None
+        return decodeCacheData(document) if document else None
+
+    def migrateFormat(self, document):
+        """
+        Re-encode a cache document stored in an older format. The `updated`
+        timestamp is kept, since the content does not change.
+
+        :param document: cache document
+        :type document: dict
+        :returns: True if the document was converted
+        """
+        if document.get('format', CACHE_FORMAT_JSON) == CACHE_FORMAT_BSON_ZLIB:
+            return False
+
+        dataFormat, data = encodeCacheData(decodeCacheData(document))
+        if dataFormat == document.get('format', CACHE_FORMAT_JSON):
+            return False
+
+        self.update({
+            '_id': document['_id'],
+            'updated': document.get('updated')
+        }, {
+            '$set': {
+                'format': dataFormat,
+                'cache_data': data
+            }
+        }, multi=False)
+        return True
 
+    def getStats(self):
+        """
+        Hit rate and memory usage of the process-local document cache.
+        """
+        return self._documents.stats()
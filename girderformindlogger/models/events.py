@@ -17,6 +17,7 @@ from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 from bson import json_util
 from girderformindlogger.models.profile import Profile as ProfileModel
+from girderformindlogger.models.schedule_index import ScheduleIndex
 from dateutil.relativedelta import relativedelta
 
 class Events(Model):
@@ -56,6 +57,8 @@ class Events(Model):
             push_notification.remove_schedules()
             self.removeWithQuery({'_id': ObjectId(event_id)})
 
+            ScheduleIndex().invalidate(event['applet_id'])
+
     def deleteEventsByAppletId(self, applet_id):
         events = self.find({'applet_id': ObjectId(applet_id)})
 
@@ -104,6 +107,8 @@ class Events(Model):
 
         newEvent = self.save(newEvent)
 
+        ScheduleIndex().invalidate(applet['_id'])
+
         return newEvent
 
     def updateIndividualSchedulesParameter(self, newEvent, oldEvent):
@@ -147,6 +152,42 @@ class Events(Model):
         else:
             events = list(self.find({'applet_id': ObjectId(applet_id), 'individualized': individualized, 'data.users': profile_id}, fields=['data', 'schedule', 'updated']))
 
+        return self._formatEvents(events)
+
+    def getEventsForProfiles(self, profiles):
+        """
+        getEvents for the profiles of a user in several applets, with one
+        query.
+
+        :param profiles: profiles of a single user
+        :type profiles: list
+        :returns: dict of str(applet id) -> events
+        """
+        byApplet = {}
+        if not profiles:
+            return byApplet
+
+        for event in self.find({
+            'applet_id': {'$in': [profile['appletId'] for profile in profiles]}
+        }, fields=['applet_id', 'individualized', 'data', 'schedule', 'updated']):
+            byApplet.setdefault(event.pop('applet_id'), []).append(event)
+
+        result = {}
+        for profile in profiles:
+            individualized = profile['individual_events'] > 0
+            result[str(profile['appletId'])] = self._formatEvents([
+                copy.deepcopy(event) for event in byApplet.get(profile['appletId'], [])
+                if event.get('individualized') == individualized and (
+                    not individualized or
+                    profile['_id'] in event.get('data', {}).get('users', [])
+                )
+            ])
+            for event in result[str(profile['appletId'])]:
+                event.pop('individualized', None)
+
+        return result
+
+    def _formatEvents(self, events):
         for event in events:
             if 'data' in event and 'users' in event['data']:
                 event['data'].pop('users')
@@ -281,13 +322,82 @@ class Events(Model):
             lastAvailableTime = endDate + timeDelta + timeout if endDate else None
             return ( (not endDate or lastAvailableTime >= date), lastAvailableTime )
 
-    def getScheduleForUser(self, applet_id, user_id, eventFilter=None):
-        profile = Profile().findOne({'appletId': ObjectId(applet_id), 'userId': ObjectId(user_id)})
+    def getEventCards(self, events, dayFilter):
+        """
+        Get the event cards shown on a day: the events active that day, the
+        latest past events still available and an invalid card for each other
+        activity.
+
+        :param events: events as returned by getEvents, with `id` set
+        :type events: list
+        :param dayFilter: the day, at midnight
+        :type dayFilter: datetime.datetime
+        :returns: list of dicts with the event `id` and whether it is `valid`
+        """
+        lastEvent = {}
+        activityEvents = {}
+
+        for event in events:
+            event['valid'], lastAvailableTime = self.dateMatch(event, dayFilter)
+
+            activityId = event.get('data', {}).get('activity_id', None)
+
+            if not activityId:
+                event['valid'] = False
+                continue
+
+            if not event['valid']:
+                if lastAvailableTime:
+                    if activityId not in lastEvent or (lastEvent[activityId] and lastAvailableTime > lastEvent[activityId][0]):
+                        lastEvent[activityId] = (lastAvailableTime, event)
+            else:
+                lastEvent[activityId] = None
+
+            activityEvents[activityId] = event
+
+        data = []
+        for event in events:
+            if event['valid']:
+                data.append(event)
+
+        for value in lastEvent.values():
+            if value and (value[1]['data'].get('completion', False) or not value[1]['data'].get('availability', False)):
+                data.append(value[1])
+
+            activityId = event.get('data', {}).get('activity_id', None)
+            if activityId in activityEvents:
+                activityEvents.pop(activityId)
+
+        for card in data:
+            activityId = event.get('data', {}).get('activity_id', None)
+            if activityId in activityEvents:
+                activityEvents.pop(activityId)
+
+        for event in activityEvents.values():
+            event['valid'] = False
+            data.append(event)
+
+        return [
+            {
+                'id': str(card['id']),
+                'valid': card['valid']
+            } for card in data
+        ]
+
+    def getScheduleForUser(self, applet_id, user_id, eventFilter=None, profile=None, events=None):
+        """
+        :param profile: the user's profile in the applet, if already loaded
+        :param events: the events of the profile as returned by getEvents,
+            if already loaded
+        """
+        if profile is None:
+            profile = Profile().findOne({'appletId': ObjectId(applet_id), 'userId': ObjectId(user_id)})
         if not profile:
             return {}
 
         individualized = profile['individual_events'] > 0
-        events = self.getEvents(applet_id, individualized, profile['_id'])
+        if events is None:
+            events = self.getEvents(applet_id, individualized, profile['_id'])
 
         result = {}
 
@@ -301,66 +411,34 @@ class Events(Model):
             result["events"] = {}
             result["data"] = {}
 
-            usedEventCards = {}
-
-            for i in range(0, eventFilter[1]):
-                lastEvent = {}
-                activityEvents = {}
-
-                for event in events:
-                    event['valid'], lastAvailableTime = self.dateMatch(event, dayFilter)
-
-                    activityId = event.get('data', {}).get('activity_id', None)
-
-                    if not activityId:
-                        event['valid'] = False
-                        continue
+            days = [
+                (dayFilter + relativedelta(days=i)) for i in range(0, eventFilter[1])
+            ]
+            dayKeys = [day.strftime('%Y/%m/%d') for day in days]
 
-                    if not event['valid']:
-                        if lastAvailableTime:
-                            if activityId not in lastEvent or (lastEvent[activityId] and lastAvailableTime > lastEvent[activityId][0]):
-                                lastEvent[activityId] = (lastAvailableTime, event)
-                    else:
-                        lastEvent[activityId] = None
+            # individualized schedules are indexed per profile
+            index = ScheduleIndex()
+            profileId = profile['_id'] if individualized else None
+            revision = index.revision(events)
+            indexed = index.getDays(applet_id, profileId, revision, dayKeys)
 
-                    activityEvents[activityId] = event
+            missing = {}
+            for (day, dayKey) in zip(days, dayKeys):
+                if dayKey not in indexed:
+                    missing[dayKey] = self.getEventCards(events, day)
+            index.setDays(applet_id, profileId, revision, missing)
+            indexed.update(missing)
 
-                data = []
-                for event in events:
-                    if event['valid']:
-                        data.append(event)
-
-                for value in lastEvent.values():
-                    if value and (value[1]['data'].get('completion', False) or not value[1]['data'].get('availability', False)):
-                        data.append(value[1])
-
-                    activityId = event.get('data', {}).get('activity_id', None)
-                    if activityId in activityEvents:
-                        activityEvents.pop(activityId)
-
-                for card in data:
-                    activityId = event.get('data', {}).get('activity_id', None)
-                    if activityId in activityEvents:
-                        activityEvents.pop(activityId)
-
-                for event in activityEvents.values():
-                    event['valid'] = False
-                    data.append(event)
-
-                for card in data:
-                    usedEventCards[str(card['id'])] = True
+            usedEventCards = {}
 
-                result['data'][dayFilter.strftime('%Y/%m/%d')] = [
-                    {
-                        'id': str(card['id']),
-                        'valid': card['valid']
-                    } for card in data
-                ]
+            for dayKey in dayKeys:
+                for card in indexed[dayKey]:
+                    usedEventCards[card['id']] = True
 
-                dayFilter = dayFilter + relativedelta(days=1)
+                result['data'][dayKey] = indexed[dayKey]
 
             for event in events:
-                event.pop('valid')
+                event.pop('valid', None)
 
                 if usedEventCards.get(str(event["id"]), False):
                     result["events"][str(event["id"])] = event
@@ -3,6 +3,7 @@ import copy
 import datetime
 import json
 import os
+import re
 import six
 
 from bson.objectid import ObjectId
@@ -14,6 +15,44 @@ from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 
 
+
+def renamedNamePatterns(names):
+    """
+    Patterns matching names and the names they are renamed to when taken,
+    ie. 'name (1)', to look up in one query all the names a batch could use.
+
+    :param names: requested names
+    :type names: iterable of str
+    :returns: list of compiled patterns, usable in a '$in' query.
+    """
+    return [
+        re.compile(r'^%s( \(\d+\))?$' % re.escape(name)) for name in set(names)
+    ]
+
+
+def allocateNames(requests, taken):
+    """
+    Give each requested name the first of 'name', 'name (1)', 'name (2)', ...
+    not taken in its scope, the way validate renames documents one at a time.
+
+    :param requests: (scope, name) pairs, scope being ie. the parent id.
+    :type requests: list
+    :param taken: (scope, name) pairs already in use; updated in place.
+    :type taken: set
+    :returns: list of the allocated names, in the order of the requests.
+    """
+    names = []
+    for (scope, name) in requests:
+        allocated = name
+        n = 0
+        while (scope, allocated) in taken:
+            n += 1
+            allocated = '%s (%d)' % (name, n)
+        taken.add((scope, allocated))
+        names.append(allocated)
+    return names
+
+
 class Folder(AccessControlledModel):
     """
     Folders are used to store items and can also store other folders in
@@ -91,36 +130,37 @@ class Folder(AccessControlledModel):
         # fail).  If the name is being changed, validate that it is probably
         # unique.
         checkName = '_id' not in doc or not self.findOne({'_id': doc['_id'], 'name': name})
-        n = 0
-        itemModel = Item()
-        while checkName:
+        if checkName:
+            # look up the name and those it could be renamed to at once, so
+            # that a rename costs one query per collection however many
+            # siblings are named alike
+            names = renamedNamePatterns([name]) if allowRename else [name]
             q = {
                 'parentId': doc['parentId'],
-                'name': name,
+                'name': {'$in': names},
                 'parentCollection': doc['parentCollection']
             }
             if '_id' in doc:
                 q['_id'] = {'$ne': doc['_id']}
-            dupFolder = self.findOne(q, fields=['_id'])
+            folderNames = set(folder['name'] for folder in self.find(q, fields=['name']))
             if doc['parentCollection'] == 'folder':
                 q = {
                     'folderId': doc['parentId'],
-                    'name': name
+                    'name': {'$in': names}
                 }
-                dupItem = itemModel.findOne(q, fields=['_id'])
+                itemNames = set(item['name'] for item in Item().find(q, fields=['name']))
             else:
-                dupItem = None
-            if dupItem is None and dupFolder is None:
-                doc['name'] = name
-                break
+                itemNames = set()
             if not allowRename:
-                if dupFolder:
+                if name in folderNames:
                     raise ValidationException('A folder with that name '
                                               'already exists here.', 'name')
-                raise ValidationException('An item with that name already '
-                                          'exists here.', 'name')
-            n += 1
-            name = '%s (%d)' % (doc['name'], n)
+                if name in itemNames:
+                    raise ValidationException('An item with that name already '
+                                              'exists here.', 'name')
+            else:
+                (doc['name'], ) = allocateNames([(None, name)], set(
+                    (None, taken) for taken in folderNames | itemNames))
         return doc
 
     def load(self, id, level=AccessType.ADMIN, user=None, objectId=True,
@@ -479,44 +519,14 @@ class Folder(AccessControlledModel):
 
         return iter(cursor)
 
-    def createFolder(self, parent, name, description='', parentType='folder',
-                     public=None, creator=None, allowRename=False, reuseExisting=False, accountId=None, validate=True):
+    def newFolderDocument(self, parent, name, description='', parentType='folder',
+                          public=None, creator=None, accountId=None):
         """
-        Create a new folder under the given parent.
+        Build the document of a new folder as createFolder does, without
+        validating or saving it. The parameters are those of createFolder.
 
-        :param parent: The parent document. Should be a folder, user, or
-                       collection.
-        :type parent: dict
-        :param name: The name of the folder.
-        :type name: str
-        :param description: Description for the folder.
-        :type description: str
-        :param parentType: What type the parent is:
-                           ('folder' | 'user' | 'collection')
-        :type parentType: str
-        :param public: Public read access flag.
-        :type public: bool or None to inherit from parent
-        :param creator: User document representing the creator of this folder.
-        :type creator: dict
-        :param allowRename: if True and a folder or item of this name exists,
-                            automatically rename the folder.
-        :type allowRename: bool
-        :param reuseExisting: If a folder with the given name already exists
-            under the given parent, return that folder rather than creating a
-            new one.
-        :type reuseExisting: bool
-        :returns: The folder document that was created.
+        :returns: the folder document.
         """
-        if reuseExisting:
-            existing = self.findOne({
-                'parentId': parent['_id'],
-                'name': name,
-                'parentCollection': parentType
-            })
-
-            if existing:
-                return existing
-
         parentType = parentType.lower()
         if parentType not in ('folder', 'user', 'collection'):
             raise ValidationException('The parentType must be folder, collection, or user.')
@@ -569,6 +579,81 @@ class Folder(AccessControlledModel):
         if public is not None and isinstance(public, bool):
             self.setPublic(folder, public, save=False)
 
+        return folder
+
+    def reserveNames(self, parent, parentType, names):
+        """
+        Get the names several new folders under the same parent would be
+        given by validate(allowRename=True) if created one after the other,
+        looking up the names in use with one query per collection.
+
+        :param parent: The parent document.
+        :type parent: dict
+        :param parentType: ('folder' | 'user' | 'collection')
+        :type parentType: str
+        :param names: requested names
+        :type names: list of str
+        :returns: list of unique names, in the order of the requests.
+        """
+        from girderformindlogger.models.item import Item
+
+        names = [name.strip() for name in names]
+        patterns = renamedNamePatterns(names)
+
+        taken = set((None, folder['name']) for folder in self.find({
+            'parentId': parent['_id'],
+            'parentCollection': parentType,
+            'name': {'$in': patterns}
+        }, fields=['name']))
+        if parentType == 'folder':
+            taken.update((None, item['name']) for item in Item().find({
+                'folderId': parent['_id'],
+                'name': {'$in': patterns}
+            }, fields=['name']))
+
+        return allocateNames([(None, name) for name in names], taken)
+
+    def createFolder(self, parent, name, description='', parentType='folder',
+                     public=None, creator=None, allowRename=False, reuseExisting=False, accountId=None, validate=True):
+        """
+        Create a new folder under the given parent.
+
+        :param parent: The parent document. Should be a folder, user, or
+                       collection.
+        :type parent: dict
+        :param name: The name of the folder.
+        :type name: str
+        :param description: Description for the folder.
+        :type description: str
+        :param parentType: What type the parent is:
+                           ('folder' | 'user' | 'collection')
+        :type parentType: str
+        :param public: Public read access flag.
+        :type public: bool or None to inherit from parent
+        :param creator: User document representing the creator of this folder.
+        :type creator: dict
+        :param allowRename: if True and a folder or item of this name exists,
+                            automatically rename the folder.
+        :type allowRename: bool
+        :param reuseExisting: If a folder with the given name already exists
+            under the given parent, return that folder rather than creating a
+            new one.
+        :type reuseExisting: bool
+        :returns: The folder document that was created.
+        """
+        if reuseExisting:
+            existing = self.findOne({
+                'parentId': parent['_id'],
+                'name': name,
+                'parentCollection': parentType
+            })
+
+            if existing:
+                return existing
+
+        folder = self.newFolderDocument(
+            parent, name, description, parentType, public, creator, accountId)
+
         if allowRename:
             self.validate(folder, allowRename=True)
 
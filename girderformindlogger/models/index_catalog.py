@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Compound indices of the queries run on most requests, and the canonical
+form of these queries.
+
+The models pass the indices to `ensureIndices` along with their own, and
+test/test_query_plans.py checks against a mongod that none of the
+queries in HOT_QUERIES needs a collection scan once they exist, so a
+query changed to filter on other fields is caught before it reaches
+production.
+"""
+import datetime
+
+from bson.objectid import ObjectId
+
+# responses, queried by applet and subject or by user and applet
+RESPONSE_INDICES = [
+    ([
+        ('meta.applet.@id', 1),
+        ('meta.subject.@id', 1),
+        ('created', 1)
+    ], {}),
+    ([
+        ('baseParentId', 1),
+        ('meta.applet.@id', 1),
+        ('created', 1)
+    ], {})
+]
+
+# accounts, queried by the applets they own or hold
+ACCOUNT_PROFILE_INDICES = [
+    'applets.owner',
+    ([
+        ('accountId', 1),
+        ('applets.user', 1)
+    ], {})
+]
+
+# applet profiles, queried by the scheduled notifications of a timezone
+PROFILE_INDICES = [
+    ([
+        ('appletId', 1),
+        ('timezone', 1),
+        ('profile', 1),
+        ('individual_events', 1)
+    ], {})
+]
+
+INDEX_CATALOG = {
+    'item': RESPONSE_INDICES,
+    'accountProfile': ACCOUNT_PROFILE_INDICES,
+    'appletProfile': PROFILE_INDICES
+}
+
+_id = ObjectId()
+_since = datetime.datetime(2020, 1, 1)
+
+# name -> (collection, query, sort) of the hot queries
+HOT_QUERIES = {
+    # utility.response.aggregate, for last7Days
+    'lastResponses': ('item', {
+        'baseParentType': 'user',
+        'baseParentId': _id,
+        'created': {'$gt': _since},
+        'meta.applet.@id': _id,
+        'meta.subject.@id': _id
+    }, [('created', 1)]),
+    # utility.response.responseDateList
+    'responseDates': ('item', {
+        'baseParentType': 'user',
+        'baseParentId': _id,
+        'meta.applet.@id': _id
+    }, [('created', -1)]),
+    # Applet.exportResponses
+    'responseExport': ('item', {
+        'baseParentType': 'user',
+        'meta.applet.@id': _id,
+        'creatorId': {'$in': [_id]},
+        'created': {'$gte': _since}
+    }, [('_id', 1)]),
+    # TenantRouter.databaseUri
+    'appletOwner': ('accountProfile', {
+        'applets.owner': _id
+    }, None),
+    # Applet.deactivateApplet and Applet.receiveOwnerShip
+    'appletUsers': ('accountProfile', {
+        'accountId': _id,
+        'applets.user': _id
+    }, None),
+    # external.notification.send_push_notification
+    'notifiedProfiles': ('appletProfile', {
+        'appletId': _id,
+        'timezone': 0.0,
+        'profile': True,
+        'individual_events': 0
+    }, None),
+    'notifiedIndividualProfiles': ('appletProfile', {
+        'appletId': _id,
+        'timezone': 0.0,
+        'profile': True,
+        'individual_events': {'$gte': 1},
+        '_id': {'$in': [_id]}
+    }, None)
+}
@@ -7,7 +7,7 @@ import six
 
 from bson.objectid import ObjectId
 from girderformindlogger import events
-from girderformindlogger.constants import AccessType, USER_ROLES
+from girderformindlogger.constants import AccessType, SortDir, USER_ROLES
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.aes_encrypt import AESEncryption, AccessControlledModel
 from girderformindlogger.models.account_profile import AccountProfile
@@ -17,6 +17,19 @@ from girderformindlogger.utility.progress import noProgress, \
     setResponseTimeLimit
 from girderformindlogger.i18n import t
 
+# invitation keys the sort keys of applet user lists map to; invitations have
+# no activity, so they stay in the order they were created in
+INVITATION_LIST_SORT_KEYS = {
+    'created': 'created',
+    'MRN': 'MRN',
+    'lastActivity': 'created'
+}
+# fields of invitations listed with the users of an applet
+INVITATION_LIST_FIELDS = [
+    '_id', 'firstName', 'lastName', 'role', 'MRN', 'created', 'lang'
+]
+
+
 class Invitation(AESEncryption):
     """
     Invitations store customizable information specific to both users and
@@ -25,7 +38,16 @@ class Invitation(AESEncryption):
 
     def initialize(self):
         self.name = 'invitation'
-        self.ensureIndices(('appletId', ([('appletId', 1)], {})))
+        self.ensureIndices((
+            'appletId',
+            ([('appletId', 1)], {}),
+            # pages of pending invitations, see listAppletInvitations
+            *[([
+                ('appletId', 1),
+                (key, 1),
+                ('_id', 1)
+            ], {}) for key in dict.fromkeys(INVITATION_LIST_SORT_KEYS.values())]
+        ))
 
         self.exposeFields(level=AccessType.READ, fields=(
             '_id', 'created', 'updated', 'meta', 'appletId',
@@ -73,6 +95,62 @@ class Invitation(AESEncryption):
         return doc
 
 
+    def listAppletInvitations(
+        self,
+        appletId,
+        limit=50,
+        sort='created',
+        sortDir=SortDir.ASCENDING,
+        after=None,
+        search=None
+    ):
+        """
+        Get a page of the pending invitations of an applet, other than
+        ownership transfers, paged like Profile.listAppletProfiles.
+
+        :param limit: maximum number of invitations, 0 for all of them
+        :type limit: int
+        :param sort: 'created', 'MRN' or 'lastActivity'
+        :type sort: str
+        :param after: token of the page to get, as returned for the previous one
+        :type after: str or None
+        :param search: text that the MRN or a name must contain
+        :type search: str or None
+        :returns: (invitations, token of the next page or None)
+        """
+        from girderformindlogger.models.profile import decodePageToken, \
+            encodePageToken, matchesSearch, pageQuery
+
+        if sort not in INVITATION_LIST_SORT_KEYS:
+            raise ValidationException('Invalid sort key.', 'sort')
+        key = INVITATION_LIST_SORT_KEYS[sort]
+
+        listQuery = {
+            'appletId': ObjectId(appletId),
+            'role': {'$ne': 'owner'}
+        }
+        if after:
+            listQuery = {'$and': [
+                listQuery,
+                pageQuery(key, sortDir, *decodePageToken(after, 'pendingAfter'))
+            ]}
+
+        invitations = []
+        for invitation in self.find(
+            listQuery,
+            limit=limit + 1 if limit and not search else 0,
+            fields=INVITATION_LIST_FIELDS,
+            sort=[(key, sortDir), ('_id', sortDir)]
+        ):
+            if search and not matchesSearch(invitation, search):
+                continue
+            if limit and len(invitations) == limit:
+                last = invitations[-1]
+                return (invitations, encodePageToken(last.get(key), last['_id']))
+            invitations.append(invitation)
+
+        return (invitations, None)
+
     def remove(self, invitation, progress=None, **kwargs):
         """
         Delete an invitation.
@@ -85,12 +85,9 @@ class Item(acl_mixin.AccessControlMixin, Model):
             value = str(value)
         return value.strip()
 
-    def reconnectToDb(self, db_uri=cherrypy.config['database']['uri']):
-        self.db_uri = db_uri
-        self.reconnect()
-
     def validate(self, doc):
-        from girderformindlogger.models.folder import Folder
+        from girderformindlogger.models.folder import Folder, allocateNames, \
+            renamedNamePatterns
 
         doc['name'] = self._validateString(doc.get('name', ''))
         doc['description'] = self._validateString(doc.get('description', ''))
@@ -110,28 +107,25 @@ class Item(acl_mixin.AccessControlMixin, Model):
         # fail).  If the name is being changed, validate that it is probably
         # unique.
         checkName = '_id' not in doc or not self.findOne({'_id': doc['_id'], 'name': name})
-        n = 0
-        while checkName:
+        if checkName:
+            # look up the name and those it could be renamed to at once
+            names = renamedNamePatterns([name])
             q = {
-                'name': name,
+                'name': {'$in': names},
                 'folderId': doc['folderId']
             }
             if '_id' in doc:
                 q['_id'] = {'$ne': doc['_id']}
-            dupItem = self.findOne(q, fields=['_id'])
+            taken = set((None, item['name']) for item in self.find(q, fields=['name']))
 
             q = {
                 'parentId': doc['folderId'],
-                'name': name,
+                'name': {'$in': names},
                 'parentCollection': 'folder'
             }
-            dupFolder = Folder().findOne(q, fields=['_id'])
-            if dupItem is None and dupFolder is None:
-                doc['name'] = name
-                checkName = False
-            else:
-                n += 1
-                name = '%s (%d)' % (doc['name'], n)
+            taken.update((None, folder['name']) for folder in Folder().find(q, fields=['name']))
+
+            (doc['name'], ) = allocateNames([(None, name)], taken)
 
         doc['lowerName'] = doc['name'].lower()
         return doc
@@ -305,6 +299,18 @@ class Item(acl_mixin.AccessControlMixin, Model):
             if existing:
                 return existing
 
+        return self.save(
+            self.newItemDocument(name, creator, folder, description),
+            validate=validate
+        )
+
+    def newItemDocument(self, name, creator, folder, description=''):
+        """
+        Build the document of a new item as createItem does, without
+        validating or saving it. The parameters are those of createItem.
+
+        :returns: the item document.
+        """
         now = datetime.datetime.utcnow()
 
         if not isinstance(creator, dict) or '_id' not in creator:
@@ -318,7 +324,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
             folder['baseParentType'] = pathFromRoot[0]['type']
             folder['baseParentId'] = pathFromRoot[0]['object']['_id']
 
-        return self.save({
+        return {
             'name': self._validateString(name),
             'description': self._validateString(description),
             'folderId': ObjectId(folder['_id']),
@@ -329,7 +335,42 @@ class Item(acl_mixin.AccessControlMixin, Model):
             'updated': now,
             'size': 0,
             'meta': {}
-        }, validate=validate)
+        }
+
+    def reserveNames(self, requests):
+        """
+        Get the names several new items would be given by validate if
+        created one after the other, looking up the names in use in all
+        their folders with one query per collection.
+
+        :param requests: (folder id, requested name) pairs
+        :type requests: list
+        :returns: list of unique names, in the order of the requests.
+        """
+        from girderformindlogger.models.folder import Folder, allocateNames, \
+            renamedNamePatterns
+
+        requests = [
+            (ObjectId(folderId), self._validateString(name))
+            for (folderId, name) in requests
+        ]
+        if not requests:
+            return []
+
+        folderIds = list(set(folderId for (folderId, name) in requests))
+        patterns = renamedNamePatterns(name for (folderId, name) in requests)
+
+        taken = set((item['folderId'], item['name']) for item in self.find({
+            'folderId': {'$in': folderIds},
+            'name': {'$in': patterns}
+        }, fields=['folderId', 'name']))
+        taken.update((folder['parentId'], folder['name']) for folder in Folder().find({
+            'parentId': {'$in': folderIds},
+            'parentCollection': 'folder',
+            'name': {'$in': patterns}
+        }, fields=['parentId', 'name']))
+
+        return allocateNames(requests, taken)
 
     def updateItem(self, item, folder=None):
         """
@@ -8,7 +8,7 @@ import six
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from pymongo.errors import WriteError
+from pymongo.errors import BulkWriteError, WriteError
 from dictdiffer import diff
 from girderformindlogger import events, logprint, logger, auditLogger
 from girderformindlogger.constants import ACCESS_FLAGS, AccessType,            \
@@ -647,6 +647,33 @@ class Model(object):
 
         return document
 
+    def insertMany(self, documents):
+        """
+        Insert several new documents with one write. Unlike save, this does
+        not validate the documents nor trigger the save events, so callers
+        must pass documents as validate() would leave them.
+
+        :param documents: new documents; an _id is assigned to those without.
+        :type documents: list
+        :returns: the documents
+        """
+        if not documents:
+            return documents
+
+        try:
+            self.collection.insert_many(documents, ordered=True)
+        except BulkWriteError as e:
+            raise ValidationException('Database save failed: %s' % e.details)
+
+        for document in documents:
+            auditLogger.info('document.create', extra={
+                'details': {
+                    'collection': self.name,
+                    'id': document['_id']
+                }
+            })
+        return documents
+
     def update(self, query, update, multi=True):
         """
         This method should be used for updating multiple documents in the
@@ -40,6 +40,16 @@ class Notification(Model):
     def validate(self, doc):
         return doc
 
+    def save(self, document, *args, **kwargs):
+        """
+        Save a notification and publish it to the notification streams.
+        """
+        from girderformindlogger.models.notification_hub import getNotificationHub
+
+        document = super(Notification, self).save(document, *args, **kwargs)
+        getNotificationHub().publish(document)
+        return document
+
     def createNotification(self, type, data, user, expires=None, token=None):
         """
         Create a generic notification.
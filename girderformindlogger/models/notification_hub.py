@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Fan-out of saved notifications to the notification streams of a process.
+
+Every saved notification is published on a Redis channel. Each process
+serving streams runs one thread listening on the channel and hands the
+notifications to the subscriptions of their recipient, so that connected
+clients wait on their subscription instead of polling the database. While
+Redis is unreachable, subscriptions report that the notifications must be
+read from the database, and streams fall back to polling.
+"""
+import collections
+import queue
+import threading
+import time
+
+from bson import json_util
+from bson.json_util import JSONOptions
+from girderformindlogger import logger
+from girderformindlogger.utility import config
+
+DEFAULT_STREAM_CHANNEL = 'notifications:stream'
+
+# notifications kept for a subscription before it has to read the database
+DEFAULT_SUBSCRIPTION_QUEUE_SIZE = 100
+
+# seconds between attempts to listen on the channel again after an error
+MAX_RECONNECT_INTERVAL = 30
+
+_JSON_OPTIONS = JSONOptions(tz_aware=False)
+
+
+def recipientKey(userId=None, tokenId=None):
+    """
+    Key of the recipient of a notification: its user, or its token if it
+    has none.
+    """
+    if userId is not None:
+        return 'user:{}'.format(userId)
+    return 'token:{}'.format(tokenId)
+
+
+class Subscription(object):
+    """
+    Notifications of one recipient received while the subscription is open.
+    """
+
+    def __init__(self, hub, key, maxSize):
+        self.hub = hub
+        self.key = key
+        self.overflowed = False
+        # listener run the notifications were last read from the database in
+        self.generation = hub.generation
+        self._queue = queue.Queue(maxSize)
+
+    def put(self, notification):
+        try:
+            self._queue.put_nowait(notification)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        Wait for notifications.
+
+        :param timeout: seconds to wait for the first one.
+        :type timeout: float
+        :returns: the notifications received, or None if they must be read
+            from the database because some were dropped or the hub is not
+            listening.
+        """
+        if not self.hub.listening:
+            time.sleep(timeout)
+            return None
+        if self.generation != self.hub.generation:
+            # notifications published before the listener (re)started are
+            # only in the database
+            self.generation = self.hub.generation
+            return None
+
+        notifications = []
+        try:
+            notifications.append(self._queue.get(timeout=timeout))
+            while True:
+                notifications.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.overflowed or not self.hub.listening:
+            self.overflowed = False
+            return None
+        return notifications
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NotificationHub(object):
+    """
+    Publishes notifications on a Redis channel and hands the ones published
+    by any process to the local subscriptions of their recipient.
+
+    :param connectionFactory: returns the Redis connection to use.
+    :type connectionFactory: callable
+    :param channel: name of the channel.
+    :type channel: str
+    :param queueSize: notifications kept per subscription.
+    :type queueSize: int
+    """
+
+    def __init__(self, connectionFactory, channel=DEFAULT_STREAM_CHANNEL,
+                 queueSize=DEFAULT_SUBSCRIPTION_QUEUE_SIZE):
+        self.connectionFactory = connectionFactory
+        self.channel = channel
+        self.queueSize = queueSize
+        self.listening = False
+        self.generation = 0
+        self._subscriptions = collections.defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, notification):
+        """
+        Publish a saved notification. Failures are logged, not raised, as
+        the notification is in the database anyway.
+        """
+        try:
+            self.connectionFactory().publish(
+                self.channel, json_util.dumps(notification))
+        except Exception:
+            logger.exception('Could not publish notification %s', notification.get('_id'))
+
+    def subscribe(self, user=None, token=None):
+        """
+        Open a subscription to the notifications of a user, or of a token.
+
+        :returns: Subscription, to close once done with it.
+        """
+        self._startListener()
+
+        subscription = Subscription(self, recipientKey(
+            user['_id'] if user else None,
+            token['_id'] if token else None
+        ), self.queueSize)
+        with self._lock:
+            self._subscriptions[subscription.key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.key]
+
+    def deliver(self, notification):
+        """
+        Hand a notification to the subscriptions of its recipient.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(recipientKey(
+                notification.get('userId'), notification.get('tokenId')), ()))
+
+        for subscription in subscriptions:
+            # streams add fields to the notifications they send
+            subscription.put(dict(notification))
+
+    def _startListener(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        interval = 1
+        while True:
+            try:
+                pubsub = self.connectionFactory().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.generation += 1
+                self.listening = True
+                interval = 1
+
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self.deliver(json_util.loads(message['data'], json_options=_JSON_OPTIONS))
+            except Exception:
+                logger.exception('Notification hub stopped listening on %s', self.channel)
+
+            self.listening = False
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_RECONNECT_INTERVAL)
+
+
+_hub = None
+_hubLock = threading.Lock()
+
+
+def getNotificationHub():
+    """
+    Get the process-wide notification hub, configured from the
+    ``[notifications]`` config section.
+    """
+    global _hub
+
+    if _hub is None:
+        with _hubLock:
+            if _hub is None:
+                from girderformindlogger.models import getRedisConnection
+
+                cfg = config.getConfig().get('notifications', {}) or {}
+                _hub = NotificationHub(
+                    getRedisConnection,
+                    channel=cfg.get('stream_channel', DEFAULT_STREAM_CHANNEL),
+                    queueSize=int(cfg.get(
+                        'stream_queue_size', DEFAULT_SUBSCRIPTION_QUEUE_SIZE))
+                )
+    return _hub
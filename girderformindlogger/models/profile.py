@@ -1,14 +1,221 @@
 # -*- coding: utf-8 -*-
+import base64
+import collections
+import copy
 import datetime
 import json
 import os
+import threading
 
+from bson import json_util
 from bson.objectid import ObjectId
-from girderformindlogger.constants import AccessType, DEFINED_RELATIONS, PROFILE_FIELDS
+from girderformindlogger.constants import AccessType, DEFINED_RELATIONS, PROFILE_FIELDS, SortDir
 from girderformindlogger.exceptions import ValidationException, AccessException
 from girderformindlogger.models.aes_encrypt import AESEncryption, AccessControlledModel
+from girderformindlogger.models.index_catalog import PROFILE_INDICES
 from girderformindlogger.utility.progress import noProgress
 from girderformindlogger.constants import USER_ROLES
+from girderformindlogger import logger
+from girderformindlogger.utility import config
+from pymongo import UpdateMany, UpdateOne
+
+# users whose badges are raised by one update of a bulk write
+BADGE_UPDATE_CHUNK_SIZE = 1000
+
+# sort keys of listAppletProfiles -> profile fields
+PROFILE_LIST_SORT_KEYS = {
+    'created': 'created',
+    'MRN': 'MRN',
+    'lastActivity': 'lastActivity'
+}
+# fields of profiles read to display them in a user list
+PROFILE_LIST_FIELDS = [
+    *PROFILE_FIELDS, 'appletId', 'userId', 'created', 'lastActivity',
+    'cachedDisplay', 'coordinatorDefined', 'userDefined', 'email',
+    'email_encrypted', 'profile', 'code', 'invitedBy', 'roles',
+    'refreshRequest'
+]
+# fields of profiles read by getProfileData
+PROFILE_DATA_FIELDS = [
+    'appletId', 'updated', 'roles', 'firstName', 'lastName', 'email', 'MRN',
+    'userDefined', 'pinnedBy', 'deactivated', 'reviewers', 'individual_events',
+    'refreshRequest', 'completed_activities'
+]
+
+# display caches waiting to be stored, see [profiles] in girder.dist.cfg
+DEFAULT_DISPLAY_QUEUE_SIZE = 10000
+# display caches stored by one bulk write
+DISPLAY_STORE_BATCH_SIZE = 500
+
+
+def encodePageToken(value, lastId):
+    """
+    Token of the page following a profile with the given sort value and ID.
+    """
+    return base64.urlsafe_b64encode(
+        json_util.dumps([value, lastId]).encode('utf8')).decode('ascii')
+
+
+def decodePageToken(token, field='after'):
+    """
+    :param field: parameter the token was given in, for errors
+    :returns: (sort value, profile ID) encoded by encodePageToken
+    :raises ValidationException: if the token is malformed.
+    """
+    try:
+        (value, lastId) = json_util.loads(
+            base64.urlsafe_b64decode(token.encode('ascii')),
+            json_options=json_util.JSONOptions(tz_aware=False))
+    except (ValueError, TypeError):
+        raise ValidationException('Invalid page token.', field)
+    return (value, lastId)
+
+
+def pageQuery(key, sortDir, value, lastId):
+    """
+    Condition on the documents following (value, lastId) in the order of
+    key and _id; missing values sort before all others.
+    """
+    op = '$gt' if sortDir == SortDir.ASCENDING else '$lt'
+
+    if value is None:
+        conditions = [{key: None, '_id': {op: lastId}}]
+        if sortDir == SortDir.ASCENDING:
+            conditions.append({key: {'$ne': None}})
+    else:
+        conditions = [
+            {key: {op: value}},
+            {key: value, '_id': {op: lastId}}
+        ]
+        if sortDir == SortDir.DESCENDING:
+            conditions.append({key: None})
+
+    return {'$or': conditions}
+
+
+def matchesSearch(document, search):
+    """
+    Whether the MRN or a name of a profile or invitation contains the
+    searched text, ignoring case.
+    """
+    search = search.lower()
+    values = [
+        document.get('MRN'),
+        document.get('firstName'),
+        document.get('lastName'),
+        document.get('userDefined', {}).get('displayName'),
+        document.get('coordinatorDefined', {}).get('displayName')
+    ]
+    return any(
+        isinstance(value, str) and search in value.lower()
+        for value in values
+    )
+
+
+class DisplayCacheQueue(object):
+    """
+    Work left over from listing profiles, done by one background thread:
+    storing the display caches built for a response, and other tasks such
+    as generating missing profiles.
+
+    Displays are keyed by profile and role and tasks by a caller-given key,
+    so work already waiting is not queued twice. Once `maxSize` entries
+    wait, new ones are dropped; a later request builds them again.
+
+    :param store: stores a list of (profile id, role, display)
+    :type store: callable
+    """
+
+    def __init__(self, store, maxSize=DEFAULT_DISPLAY_QUEUE_SIZE,
+                 batchSize=DISPLAY_STORE_BATCH_SIZE):
+        self.maxSize = maxSize
+        self.batchSize = batchSize
+        self.dropped = 0
+        self._store = store
+        self._displays = collections.OrderedDict()
+        self._tasks = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._displays) + len(self._tasks)
+
+    def put(self, profileId, role, display):
+        """
+        Queue a display cache to be stored.
+
+        :returns: whether it was queued.
+        """
+        return self._add(self._displays, (profileId, role), display)
+
+    def submit(self, key, fun, *args):
+        """
+        Queue a call of `fun`, unless one with the same key is waiting.
+
+        :returns: whether it was queued.
+        """
+        return self._add(self._tasks, key, (fun, args))
+
+    def _add(self, entries, key, value):
+        with self._condition:
+            if key not in entries and len(self._displays) + len(self._tasks) >= self.maxSize:
+                self.dropped += 1
+                return False
+
+            entries[key] = value
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='DisplayCacheQueue', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return True
+
+    def _next(self):
+        with self._condition:
+            while not self._displays and not self._tasks:
+                self._condition.wait()
+
+            if self._tasks:
+                return (None, [self._tasks.popitem(last=False)[1]])
+
+            displays = [
+                self._displays.popitem(last=False)
+                for _ in range(min(self.batchSize, len(self._displays)))
+            ]
+            return ([key + (display, ) for (key, display) in displays], [])
+
+    def _run(self):
+        while True:
+            (displays, tasks) = self._next()
+            try:
+                if displays:
+                    self._store(displays)
+                for (fun, args) in tasks:
+                    fun(*args)
+            except Exception:
+                logger.exception('Error in profile display queue')
+
+
+_displayCacheQueue = None
+_displayCacheQueueLock = threading.Lock()
+
+
+def getDisplayCacheQueue():
+    """
+    Get the process-wide queue of profile display work, sized by
+    `[profiles] display_queue_size`.
+    """
+    global _displayCacheQueue
+
+    if _displayCacheQueue is None:
+        with _displayCacheQueueLock:
+            if _displayCacheQueue is None:
+                cfg = config.getConfig().get('profiles', {}) or {}
+                _displayCacheQueue = DisplayCacheQueue(
+                    lambda displays: Profile().storeDisplays(displays),
+                    maxSize=int(cfg.get('display_queue_size', DEFAULT_DISPLAY_QUEUE_SIZE)))
+    return _displayCacheQueue
 
 
 class Profile(AESEncryption, dict):
@@ -33,7 +240,14 @@ class Profile(AESEncryption, dict):
                     ('appletId', 1),
                     ('roles', 1),
                     ('MRN', 1),
-                ], {})
+                ], {}),
+                # pages of applet users, see listAppletProfiles
+                *[([
+                    ('appletId', 1),
+                    (key, 1),
+                    ('_id', 1)
+                ], {}) for key in PROFILE_LIST_SORT_KEYS.values()],
+                *PROFILE_INDICES
             )
         )
 
@@ -160,20 +374,22 @@ class Profile(AESEncryption, dict):
                     )
                 )
 
-    def cycleDefinitions(self, userProfile, showEmail=False, showIDCode=False):
+    def cycleDefinitions(self, userProfile, showEmail=False, showIDCode=False, idCodes=None):
         """
         :param userProfile: Profile or Invitation
         :type userProfile: dict
         :param showEmail: Show email in profile?
         :type showEmail: bool
+        :param idCodes: ID codes of the profile, if already loaded
+        :type idCodes: list or None
         :returns dict: display profile
         """
-        profileFields = PROFILE_FIELDS
+        profileFields = list(PROFILE_FIELDS)
 
         if showEmail and not userProfile.get('email_encrypted', False):
             profileFields.append('email')
 
-        displayProfile = userProfile.get("coordinatorDefined", {})
+        displayProfile = dict(userProfile.get("coordinatorDefined", {}))
         displayProfile.update(userProfile.get("userDefined", {}))
 
         displayProfile.update({
@@ -188,7 +404,7 @@ class Profile(AESEncryption, dict):
             profileFields.append('idCode')
             if userProfile.get('profile', False):
                 displayProfile.update({
-                    "idCodes": IDCode().findIdCodes(
+                    "idCodes": idCodes if idCodes is not None else IDCode().findIdCodes(
                         userProfile['_id']
                     )
                 })
@@ -234,31 +450,105 @@ class Profile(AESEncryption, dict):
         :type user: dict
         :returns dict: display profile
         """
-        import threading
-
-        loadingMessage = '{loading}…'
-        if 'cachedDisplay' in profile:
-            if forceManager:
-                if 'manager' in profile['cachedDisplay']:
-                    return(profile['cachedDisplay']['manager'])
-            if forceReviewer:
-                if 'reviewer' in profile['cachedDisplay']:
-                    return(profile['cachedDisplay']['reviewer'])
-        else:
-            profile['cachedDisplay'] = {}
+        return self.displayProfileFieldsMany(
+            [profile],
+            user,
+            forceManager,
+            forceReviewer
+        )[0]
+
+    def displayProfileFieldsMany(
+        self,
+        profiles,
+        user=None,
+        forceManager=False,
+        forceReviewer=False
+    ):
+        """
+        Display several profiles, e.g. a page of an applet's users. Displays
+        missing from `cachedDisplay` are built together, with one query per
+        collection, and stored in the background.
 
-        thread = threading.Thread(
-            target=self._cacheProfileDisplay,
-            args=(profile, user, forceManager, forceReviewer)
-        )
-        thread.start()
-        return({
-            '_id': profile['_id'],
-            'displayName': loadingMessage,
-            'email': None,
-            'idCodes': [loadingMessage]
-        })
+        :param profiles: Profiles or Invitations
+        :type profiles: list
+        :param user: user requesting the profiles
+        :type user: dict
+        :returns list: display profiles, in the order of `profiles`
+        """
+        role = self._displayRole(forceManager, forceReviewer)
+
+        displays = [
+            profile.get('cachedDisplay', {}).get(role) if role else None
+            for profile in profiles
+        ]
+        missing = [
+            profile for (profile, display) in zip(profiles, displays)
+            if display is None
+        ]
+        if not missing:
+            return displays
+
+        built = iter(self._buildDisplays(missing, user, forceManager, forceReviewer))
+        queue = getDisplayCacheQueue()
+        for (i, profile) in enumerate(profiles):
+            if displays[i] is None:
+                displays[i] = next(built)
+                if role:
+                    profile.setdefault('cachedDisplay', {})[role] = displays[i]
+                    # callers may add request-specific keys to the returned display
+                    queue.put(profile['_id'], role, copy.deepcopy(displays[i]))
+
+        return displays
+
+    def _displayRole(self, forceManager=False, forceReviewer=False):
+        if forceReviewer:
+            return 'reviewer'
+        if forceManager:
+            return 'manager'
+        return None
+
+    def _buildDisplays(
+        self,
+        profiles,
+        user,
+        forceManager=False,
+        forceReviewer=False
+    ):
+        from girderformindlogger.models.applet import Applet
+        from girderformindlogger.models.ID_code import IDCode
+
+        isCoordinator = {}
+        for profile in profiles:
+            appletId = profile.get('appletId')
+            if appletId not in isCoordinator and not (forceManager and forceReviewer):
+                isCoordinator[appletId] = Applet().isCoordinator(appletId, user)
+
+        showEmail = lambda profile: forceManager or isCoordinator[profile.get('appletId')]
+        showIDCode = lambda profile: forceReviewer or isCoordinator[profile.get('appletId')]
+
+        idCodes = IDCode().findIdCodesMany([
+            profile['_id'] for profile in profiles
+            if showIDCode(profile) and profile.get('profile', False)
+        ])
+
+        displays = []
+        for profile in profiles:
+            profileDefinitions = self.cycleDefinitions(
+                profile,
+                showEmail=showEmail(profile),
+                showIDCode=showIDCode(profile),
+                idCodes=idCodes.get(str(profile['_id']))
+            )
+
+            if 'invitedBy' in profile:
+                profileDefinitions['invitedBy'] = self.cycleDefinitions(
+                    profile['invitedBy'],
+                    showEmail=False
+                )
 
+            displays.append(profileDefinitions)
+
+        return displays
 
     def _cacheProfileDisplay(
         self,
@@ -267,29 +557,40 @@ class Profile(AESEncryption, dict):
         forceManager=False,
         forceReviewer=False
     ):
-        from girderformindlogger.models.applet import Applet
-        profileDefinitions = self.cycleDefinitions(
-            profile,
-            showEmail=forceManager if forceManager else Applet(
-            ).isCoordinator(profile['appletId'], user),
-            showIDCode=forceReviewer if forceReviewer else Applet(
-            ).isCoordinator(profile['appletId'], user)
-        )
+        profileDefinitions = self._buildDisplays(
+            [profile],
+            user,
+            forceManager,
+            forceReviewer
+        )[0]
+
+        role = self._displayRole(forceManager, forceReviewer)
+        if role:
+            profile.setdefault('cachedDisplay', {})[role] = profileDefinitions
+            self.storeDisplays([(profile['_id'], role, profileDefinitions)])
+        return(profileDefinitions)
 
-        if 'invitedBy' in profile:
-            profileDefinitions['invitedBy'] = self.cycleDefinitions(
-                profile['invitedBy'],
-                showEmail=False
-            )
+    def storeDisplays(self, displays):
+        """
+        Store display caches with one bulk write.
 
-        if forceManager and not forceReviewer:
-            profile['cachedDisplay']['manager'] = profileDefinitions
-            self.save(profile, validate=False)
-        elif forceReviewer:
-            profile['cachedDisplay']['reviewer'] = profileDefinitions
-            self.save(profile, validate=False)
-        print(profileDefinitions)
-        return(profileDefinitions)
+        :param displays: (profile id, 'manager' or 'reviewer', display)
+        :type displays: list
+        """
+        if not displays:
+            return
+
+        updates = []
+        for (profileId, role, display) in displays:
+            # encrypts the display name of manager displays, as save does
+            document = self.encryptFields({
+                'cachedDisplay': {role: copy.deepcopy(display)}
+            }, self.fields)
+            updates.append(UpdateOne({'_id': profileId}, {'$set': {
+                'cachedDisplay.%s' % role: document['cachedDisplay'][role]
+            }}))
+
+        self.collection.bulk_write(updates, ordered=False)
 
     def getProfile(self, id, user):
         from girderformindlogger.models.applet import Applet as AppletModel
@@ -390,11 +691,26 @@ class Profile(AESEncryption, dict):
             print("Error  while updating Profile")
 
     def updateProfileBadgets(self, profiles):
-        self.increment(query={
-            'userId': {
-                '$in': [profile['userId'] for profile in profiles if 'userId' in profile]
-            }
-        }, field='badge', amount=1)
+        """
+        Raise the badge of every profile of the users of the given profiles
+        in a single bulk write.
+
+        :param profiles: profiles with `userId`
+        :type profiles: iterable
+        """
+        userIds = list({
+            profile['userId'] for profile in profiles if profile.get('userId')
+        })
+        if not userIds:
+            return
+
+        self.collection.bulk_write([
+            UpdateMany({
+                'userId': {'$in': userIds[i:i + BADGE_UPDATE_CHUNK_SIZE]}
+            }, {
+                '$inc': {'badge': 1}
+            }) for i in range(0, len(userIds), BADGE_UPDATE_CHUNK_SIZE)
+        ], ordered=False)
 
     def updateRelations(self, profileId):
         relations = list(self.find({
@@ -787,61 +1103,148 @@ class Profile(AESEncryption, dict):
 
     # isMRNList - if true, content of users array is mrn list
     def updateReviewerList(self, reviewer, users=None, operation='replace', isMRNList=False):
-        profiles = self.find({'appletId': reviewer['appletId']})
-
+        """
+        Update the profiles of an applet a reviewer can view, with one bulk
+        write.
+
+        :param reviewer: profile of the reviewer
+        :type reviewer: dict
+        :param users: IDs (or MRNs if isMRNList) of the profiles to add,
+            replace or delete; None for all profiles of the applet.
+        :type users: list or None
+        :param operation: 'add', 'replace' or 'delete'
+        :type operation: str
+        :returns: number of profiles modified
+        """
         if isMRNList and users:
-            MrnToProfileId = {}
-            for profile in profiles:
-                if 'MRN' in profile:
-                    MrnToProfileId[profile['MRN']] = profile['_id']
-
             users = [
-                MrnToProfileId[MRN] for MRN in users if MRN in MrnToProfileId
+                profile['_id'] for profile in self.find({
+                    'appletId': reviewer['appletId'],
+                    'MRN': {'$in': users}
+                }, fields=['_id'])
             ]
 
-        for profile in profiles:
-            if reviewer['_id'] == profile['_id']:
+        reviewerId = reviewer['_id']
+        updates = []
+
+        if operation == 'delete':
+            if users:
+                updates.append(UpdateMany({
+                    'appletId': reviewer['appletId'],
+                    '_id': {'$in': users, '$ne': reviewerId},
+                    'reviewers': reviewerId
+                }, {
+                    '$pull': {'reviewers': reviewerId}
+                }))
+
+        else:   # add/replace
+            if users is None:
+                updates.append(UpdateMany({
+                    'appletId': reviewer['appletId'],
+                    '_id': {'$ne': reviewerId}
+                }, {
+                    '$addToSet': {'reviewers': reviewerId}
+                }))
+            else:
+                if operation and users:
+                    updates.append(UpdateMany({
+                        'appletId': reviewer['appletId'],
+                        '_id': {'$in': users, '$ne': reviewerId}
+                    }, {
+                        '$addToSet': {'reviewers': reviewerId}
+                    }))
+
+                if operation == 'replace':
+                    updates.append(UpdateMany({
+                        'appletId': reviewer['appletId'],
+                        '_id': {'$nin': [*users, reviewerId]},
+                        'reviewers': reviewerId
+                    }, {
+                        '$pull': {'reviewers': reviewerId}
+                    }))
+
+        if not updates:
+            return 0
+
+        return self.collection.bulk_write(updates, ordered=False).modified_count
+
+    def listAppletProfiles(
+        self,
+        appletId,
+        query=None,
+        limit=50,
+        sort='created',
+        sortDir=SortDir.ASCENDING,
+        after=None,
+        search=None
+    ):
+        """
+        Get a page of the active profiles of an applet.
+
+        Pages are ordered by a sort key and the profile ID, so a page picks
+        up after the last profile of the previous one however profiles are
+        added or removed in between. Display names are encrypted, so search
+        is applied to the profiles as they are read rather than in the query.
+
+        :param appletId: ID of the applet
+        :param query: additional conditions on the profiles
+        :type query: dict or None
+        :param limit: maximum number of profiles, 0 for all of them
+        :type limit: int
+        :param sort: 'created', 'MRN' or 'lastActivity'
+        :type sort: str
+        :param sortDir: SortDir.ASCENDING or SortDir.DESCENDING
+        :type sortDir: int
+        :param after: token of the page to get, as returned for the previous one
+        :type after: str or None
+        :param search: text that the MRN or a name must contain
+        :type search: str or None
+        :returns: (profiles, token of the next page or None)
+        """
+        if sort not in PROFILE_LIST_SORT_KEYS:
+            raise ValidationException('Invalid sort key.', 'sort')
+        key = PROFILE_LIST_SORT_KEYS[sort]
+
+        listQuery = {
+            'appletId': ObjectId(appletId),
+            'userId': {'$exists': True},
+            'profile': True,
+            'deactivated': {'$ne': True},
+            **(query or {})
+        }
+        if after:
+            listQuery = {'$and': [
+                listQuery,
+                pageQuery(key, sortDir, *decodePageToken(after))
+            ]}
+
+        profiles = []
+        for profile in self.find(
+            listQuery,
+            limit=limit + 1 if limit and not search else 0,
+            fields=PROFILE_LIST_FIELDS,
+            sort=[(key, sortDir), ('_id', sortDir)]
+        ):
+            if search and not matchesSearch(profile, search):
                 continue
+            if limit and len(profiles) == limit:
+                last = profiles[-1]
+                return (profiles, encodePageToken(last.get(key), last['_id']))
+            profiles.append(profile)
 
-            if operation == 'delete': # delete
-                if users and profile['_id'] in users and reviewer['_id'] in profile['reviewers']:
-                    profile['reviewers'].remove(reviewer['_id'])
-                    self.update({
-                        '_id': profile['_id']
-                    }, {
-                        '$set': {
-                            'reviewers': profile['reviewers']
-                        }
-                    })
-
-            else:   # add/replace
-                if reviewer['_id'] not in profile.get('reviewers', []):
-                    if users is None or profile['_id'] in users and operation:
-                        self.update({
-                            '_id': profile['_id']
-                        }, {
-                            '$push': {
-                                'reviewers': reviewer['_id']
-                            }
-                        }, multi=False)
-
-                elif operation == 'replace':
-                    if users is not None and profile['_id'] not in users:
-                        profile['reviewers'].remove(reviewer['_id'])
-                        self.update({
-                            '_id': profile['_id']
-                        }, {
-                            '$set': {
-                                'reviewers': profile['reviewers']
-                            }
-                        })
+        return (profiles, None)
 
     def getReviewerListForUser(self, appletId, userProfile, user):
-        reviewers = []
-        for reviewer in userProfile['reviewers']:
-            reviewers.append(self.displayProfileFields(self.findOne({'_id': reviewer}), user, forceManager=True))
+        reviewers = {
+            reviewer['_id']: reviewer for reviewer in self.find({
+                '_id': {'$in': userProfile['reviewers']}
+            })
+        }
 
-        return reviewers
+        return self.displayProfileFieldsMany([
+            reviewers[reviewerId] for reviewerId in userProfile['reviewers']
+            if reviewerId in reviewers
+        ], user, forceManager=True)
 
     def createProfile(self, applet, user, role="user"):
         """
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import bisect
 import copy
 import datetime
 import itertools
@@ -33,6 +34,67 @@ from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 
+def versionKey(version):
+    """
+    Key ordering version strings numerically part by part, so that 1.10.0
+    comes after 1.9.0; trailing zero parts are ignored, so 1.0 equals 1.0.0.
+    """
+    key = [
+        (0, int(part)) if part.isdigit() else (1, part)
+        for part in str(version or '').split('.')
+    ]
+    while key and key[-1] == (0, 0):
+        key.pop()
+    return tuple(key)
+
+
+def referenceIndexEntries(history):
+    """
+    Get the [version, reference] pairs of the referenceIndex of an item from
+    entries of its history.
+    """
+    return [
+        [entry['version'], entry['reference']]
+        for entry in history if entry.get('reference', None)
+    ]
+
+
+def buildReferenceIndex(meta):
+    """
+    Build the lookup index of the references of an item's history.
+
+    :param meta: metadata of the history reference item, with the
+        `referenceIndex` maintained by `insertHistoryData` or, for items
+        written before it, the `history` to derive it from.
+    :returns: (keys, references) where keys[i] is the greatest version key
+        among the first i + 1 references.
+    """
+    entries = meta.get('referenceIndex')
+    if entries is None:
+        entries = referenceIndexEntries(meta.get('history', []))
+
+    keys = []
+    references = []
+    for (version, reference) in entries:
+        key = versionKey(version)
+        keys.append(max(key, keys[-1]) if keys else key)
+        references.append(reference)
+    return (keys, references)
+
+
+def findReference(index, version):
+    """
+    Find the reference holding an item as it was in a version: the first
+    reference recorded at or after that version.
+
+    :param index: index returned by buildReferenceIndex
+    :returns: the reference, or None if the item has not changed since.
+    """
+    (keys, references) = index
+    position = bisect.bisect_left(keys, versionKey(version))
+    return references[position] if position < len(references) else None
+
+
 class Protocol(FolderModel):
     def importUrl(self, url, user=None, refreshCache=False):
         """
@@ -276,6 +338,7 @@ class Protocol(FolderModel):
         currentVersion = schemaVersion[0].get('@value', '0.0.0') if schemaVersion else '0.0.0'
 
         activityIdToHistoryObj = {}
+        references = []
         for activity in activities:
             identifier = activity['meta'].get('activity', {}).get('url', None)
             if identifier:
@@ -284,7 +347,7 @@ class Protocol(FolderModel):
                     activity['_id'] = activityIDRef[activityId]
                     activityId = str(activityIDRef[activityId])
 
-                activityIdToHistoryObj[activityId] = jsonld_expander.insertHistoryData(activity, identifier, 'activity', currentVersion, historyFolder, referencesFolder, user)
+                activityIdToHistoryObj[activityId] = jsonld_expander.insertHistoryData(activity, identifier, 'activity', currentVersion, historyFolder, referencesFolder, user, references=references)
 
         for item in items:
             identifier = item['meta'].get('screen', {}).get('url', None)
@@ -302,21 +365,32 @@ class Protocol(FolderModel):
                     'activityId': activityHistoryObj['_id']
                 })
 
-                jsonld_expander.insertHistoryData(item, identifier, 'screen', currentVersion, historyFolder, referencesFolder, user)
+                jsonld_expander.insertHistoryData(item, identifier, 'screen', currentVersion, historyFolder, referencesFolder, user, references=references)
+
+        jsonld_expander.insertHistoryReferences(references, referencesFolder, user)
 
     def compareVersions(self, version1, version2):
-        vs1 = version1.split('.')
-        vs2 = version2.split('.')
+        key1 = versionKey(version1)
+        key2 = versionKey(version2)
 
-        for i in range(0, len(vs1)):
-            if vs1[i] < vs2[i]:
-                return -1
-            if vs1[i] > vs2[i]:
-                return 1
+        if key1 < key2:
+            return -1
+        if key1 > key2:
+            return 1
 
         return 0
 
     def getHistoryDataFromItemIRIs(self, protocolId, IRIGroup):
+        """
+        Get the items and activities of the old versions responses refer to.
+
+        :param protocolId: ID of the protocol
+        :param IRIGroup: dict of item IRI -> list of versions
+        :type IRIGroup: dict
+        :returns: dict with the cached 'items' and 'activities' by id, and
+            'itemReferences' of version -> IRI -> item reference, None for
+            items unchanged since that version.
+        """
         from girderformindlogger.models.item import Item as ItemModel
         from girderformindlogger.utility import jsonld_expander
 
@@ -331,59 +405,82 @@ class Protocol(FolderModel):
             'itemReferences': itemReferences
         }
 
-        if 'historyId' not in protocol.get('meta', {}):
+        if 'historyId' not in protocol.get('meta', {}) or not IRIGroup:
             return result
 
         historyFolder = FolderModel().load(protocol['meta']['historyId'], force=True)
         if 'referenceId' not in historyFolder.get('meta', {}):
             return result
 
-        referencesFolder = FolderModel().load(historyFolder['meta']['referenceId'], force=True)
-        itemModel = ItemModel()
-
-        for IRI in IRIGroup:
-            reference = itemModel.findOne({ 'folderId': referencesFolder['_id'], 'meta.identifier': IRI })
-            if not reference:
-                continue
-
-            history = reference['meta']['history']
-
-            for version in IRIGroup[IRI]:
-                if version not in itemReferences:
-                    itemReferences[version] = {}
-
-                inserted = False
-                for i in range(0, len(history)):
-                    if self.compareVersions(version, history[i]['version']) <= 0:
-                        if not history[i].get('reference', None):
-                            continue
+        references = ItemModel().find({
+            'folderId': ObjectId(historyFolder['meta']['referenceId']),
+            'meta.identifier': {'$in': list(IRIGroup)}
+        }, fields=[
+            'meta.identifier', 'meta.referenceIndex', 'meta.history.version',
+            'meta.history.reference'
+        ])
 
-                        if history[i]['reference'] not in items:
-                            (modelType, referenceId) = history[i]['reference'].split('/')
-                            model = MODELS()[modelType]().findOne({
-                                '_id': ObjectId(referenceId)
-                            })
-                            items[history[i]['reference']] = jsonld_expander.loadCache(model['cached'])
-
-                            activityId = str(model['meta']['activityId'])
-
-                            if activityId not in activities:
-                                activities[activityId] = jsonld_expander.loadCache(
-                                    FolderModel().load(activityId, force=True)['cached']
-                                )
-                        if history[i]['reference']:
-                            itemReferences[version][IRI] = history[i]['reference']
-                        inserted = True
-
-                        break
-
-                if not inserted:
-                    itemReferences[version][IRI] = None # this is same as latest version
+        for reference in references:
+            meta = reference['meta']
+            IRI = meta['identifier']
+            index = buildReferenceIndex(meta)
+
+            for version in IRIGroup.get(IRI, []):
+                itemReferences.setdefault(version, {})[IRI] = findReference(
+                    index, version)
+
+        # load the referenced documents and their caches a model at a time
+        documentIds = {}
+        for references in itemReferences.values():
+            for reference in references.values():
+                if reference:
+                    (modelType, referenceId) = reference.split('/')
+                    documentIds.setdefault(modelType, set()).add(ObjectId(referenceId))
+
+        documents = {}
+        for modelType in documentIds:
+            for document in MODELS()[modelType]().find({
+                '_id': {'$in': list(documentIds[modelType])}
+            }, fields=['cached', 'meta.activityId']):
+                documents['{}/{}'.format(modelType, document['_id'])] = document
+
+        caches = jsonld_expander.loadCaches(
+            document.get('cached') for document in documents.values())
+
+        activityIds = set()
+        for (reference, document) in documents.items():
+            items[reference] = caches.get(str(document.get('cached')))
+            activityId = document.get('meta', {}).get('activityId')
+            if activityId:
+                activityIds.add(ObjectId(activityId))
+
+        if activityIds:
+            activityFolders = list(FolderModel().find({
+                '_id': {'$in': list(activityIds)}
+            }, fields=['cached']))
+            caches = jsonld_expander.loadCaches(
+                folder.get('cached') for folder in activityFolders)
+
+            for folder in activityFolders:
+                activities[str(folder['_id'])] = caches.get(str(folder.get('cached')))
 
         return result
 
     def getProtocolChanges(self, protocolId, localVersion, localUpdateTime):
+        """
+        Get the activities and screens changed since the version a client
+        has, from the change log of the protocol when it covers that
+        version, or else from the history references.
+
+        :param localVersion: version of the client.
+        :type localVersion: str
+        :param localUpdateTime: isoformatted time the client got it.
+        :type localUpdateTime: str
+        :returns: (whether an identifier is an url, {modelType: {identifier:
+            'created' or 'updated'}}), or None without a history.
+        """
         from girderformindlogger.models.item import Item as ItemModel
+        from girderformindlogger.models.protocol_change import ProtocolChange
 
         changeInfo = { 'screen': {}, 'activity': {} }
         hasUrl = False
@@ -404,6 +501,24 @@ class Protocol(FolderModel):
 
         referencesFolder = FolderModel().load(historyFolder['meta']['referenceId'], force=True)
 
+        localUpdateTime = datetime.datetime.fromisoformat(localUpdateTime)
+        if localUpdateTime.tzinfo is not None:
+            localUpdateTime = localUpdateTime.astimezone(
+                datetime.timezone.utc).replace(tzinfo=None)
+
+        changeLogSince = referencesFolder.get('meta', {}).get('changeLogSince')
+        if changeLogSince and changeLogSince <= localUpdateTime:
+            for change in ProtocolChange().getChanges(
+                    referencesFolder['_id'], localVersion, localUpdateTime):
+                identifier = str(change['identifier'])
+                if identifier.startswith('https://'):
+                    hasUrl = True
+
+                changeInfo[change['modelType']][identifier] = 'updated' if self.compareVersions(
+                    change['firstVersion'], localVersion) < 0 else 'created'
+
+            return (hasUrl, changeInfo)
+
         itemModel = ItemModel()
 
         references = list(itemModel.find({
@@ -414,7 +529,7 @@ class Protocol(FolderModel):
         updates = itemModel.find({ 
             'folderId': referencesFolder['_id'], 
             'updated': {
-                '$gt': datetime.datetime.fromisoformat(localUpdateTime)
+                '$gt': localUpdateTime
             }
         })
 
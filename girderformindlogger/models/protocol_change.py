@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from bson.objectid import ObjectId
+from girderformindlogger.models.model_base import Model
+
+
+class ProtocolChange(Model):
+    """
+    Append-only log of the activities and screens changed by each save of a
+    protocol, written along with its history references.
+
+    Entries are keyed by the history references folder of the protocol and
+    record the version the changes were made from, so that the changes made
+    since a version a client has are read from a few small documents rather
+    than from the history of every item. The references folder records in
+    `meta.changeLogSince` when its log started.
+    """
+
+    def initialize(self):
+        self.name = 'protocolChange'
+        self.ensureIndices(
+            (
+                ([
+                    ('referencesId', 1),
+                    ('version', 1)
+                ], {}),
+                ([
+                    ('referencesId', 1),
+                    ('created', 1)
+                ], {})
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    def record(self, referencesId, version, changes, created=None):
+        """
+        Log the changes of one save.
+
+        :param referencesId: id of the history references folder
+        :param version: version the changes were made from
+        :type version: str
+        :param changes: dicts with the identifier and modelType of the changed
+            documents, and the first version in their history.
+        :type changes: list
+        """
+        if not changes:
+            return None
+
+        return self.save({
+            'referencesId': ObjectId(referencesId),
+            'version': version,
+            'created': created or datetime.datetime.utcnow(),
+            'changes': changes
+        })
+
+    def getChanges(self, referencesId, version, since):
+        """
+        Get the changes made from a version or after a time.
+
+        :param version: version of the client
+        :type version: str
+        :param since: time the client got the version
+        :type since: datetime
+        :returns: list of the logged changes, oldest first.
+        """
+        changes = []
+        for entry in self.find({
+            'referencesId': ObjectId(referencesId),
+            '$or': [
+                {'version': version},
+                {'created': {'$gt': since}}
+            ]
+        }, sort=[('created', 1)], fields=['changes']):
+            changes.extend(entry['changes'])
+        return changes
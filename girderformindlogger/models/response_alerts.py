@@ -12,7 +12,8 @@ from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.model_base import AccessControlledModel, Model
 from girderformindlogger.models.aes_encrypt import AESEncryption
-from girderformindlogger.models.profile import Profile
+from girderformindlogger.models.profile import Profile, PROFILE_DATA_FIELDS, \
+    decodePageToken, encodePageToken
 from girderformindlogger.models.user import User
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
@@ -22,6 +23,9 @@ from girderformindlogger.utility import mail_utils
 from bson import json_util
 from pymongo import DESCENDING, ASCENDING
 
+# days for which alerts are listed
+RESPONSE_ALERT_DAYS = 30
+
 class ResponseAlerts(AESEncryption):
     """
     collection for manage schedule and notification.
@@ -36,6 +40,7 @@ class ResponseAlerts(AESEncryption):
                     ('reviewerId', 1),
                     ('accountId', 1),
                     ('created', 1),
+                    ('_id', 1),
                 ], {})
             )
         )
@@ -91,61 +96,83 @@ class ResponseAlerts(AESEncryption):
                     reviewerEmail
                 )
 
-    def getResponseAlerts(self, reviewerId, accountId):
-        alerts = list(
-            self.find({
-                'reviewerId': ObjectId(reviewerId),
-                'accountId': ObjectId(accountId),
-                "created": {
-                  "$gte": (datetime.utcnow() - timedelta(days=30)),
-                }
-            }, fields=[
-                'itemId',
-                'itemSchema',
-                'alertMessage',
-                'appletId',
-                'profileId',
-                'created',
-                'viewed'
-            ], sort=[('created', DESCENDING)])
-        )
+    def getResponseAlerts(self, reviewerId, accountId, limit=0, after=None, since=None):
+        """
+        Get the alerts of the last RESPONSE_ALERT_DAYS days for a reviewer,
+        newest first, with the data of the profiles they are about.
+
+        :param reviewerId: ID of the reviewing user
+        :param accountId: ID of the account
+        :param limit: number of alerts per page, 0 for all.
+        :type limit: int
+        :param after: token of the page to get, as returned in 'next'.
+        :type after: str
+        :param since: only get the alerts created after this time.
+        :type since: datetime
+        :returns: dict with the 'profiles' by id, the 'list' of alerts and
+            the token of the 'next' page, None on the last one.
+        """
+        query = {
+            'reviewerId': ObjectId(reviewerId),
+            'accountId': ObjectId(accountId),
+            'created': {
+                '$gte': (datetime.utcnow() - timedelta(days=RESPONSE_ALERT_DAYS)),
+            }
+        }
+        if since is not None:
+            query['created']['$gt'] = since
+        if after:
+            (created, lastId) = decodePageToken(after)
+            query['$or'] = [
+                {'created': {'$lt': created}},
+                {'created': created, '_id': {'$lt': lastId}}
+            ]
 
-        userProfiles = {}
-        viewerProfiles = {}
-        for alert in alerts:
-            alert['id'] = alert.pop('_id')
+        alerts = list(self.find(query, fields=[
+            'itemId',
+            'itemSchema',
+            'alertMessage',
+            'appletId',
+            'profileId',
+            'created',
+            'viewed'
+        ], sort=[('created', DESCENDING), ('_id', DESCENDING)], limit=limit))
+
+        nextToken = None
+        if limit and len(alerts) == limit:
+            nextToken = encodePageToken(alerts[-1]['created'], alerts[-1]['_id'])
+
+        profiles = list(Profile().find({
+            '_id': {'$in': list(set(alert['profileId'] for alert in alerts))},
+            'deactivated': {'$ne': True}
+        }, fields=PROFILE_DATA_FIELDS))
 
-            if str(alert['profileId']) not in userProfiles:
-                profile = Profile().findOne({
-                    '_id': alert['profileId'],
-                    'deactivated': {'$ne': True}
-                })
+        viewerProfiles = {}
+        for viewerProfile in Profile().find({
+            'appletId': {'$in': list(set(profile['appletId'] for profile in profiles))},
+            'userId': ObjectId(reviewerId)
+        }, fields=['appletId', 'roles']):
+            viewerProfiles.setdefault(viewerProfile['appletId'], viewerProfile)
 
-                if not profile:
-                    continue
+        userProfiles = {}
+        for profile in profiles:
+            viewerProfile = viewerProfiles.get(profile['appletId'])
+            data = Profile().getProfileData(profile, viewerProfile) if viewerProfile else None
 
-                appletId = str(profile['appletId'])
-                if appletId not in viewerProfiles:
-                    viewerProfile = Profile().findOne({
-                        'appletId': alert['appletId'],
-                        'userId': ObjectId(reviewerId)
-                    })
-                    viewerProfiles[appletId] = viewerProfile
-                else:
-                    viewerProfile = viewerProfiles[appletId]
+            if data:
+                userProfiles[str(profile['_id'])] = data
 
-                data = Profile().getProfileData(profile, viewerProfile)
+        for alert in alerts:
+            alert['id'] = alert.pop('_id')
 
-                if data:
-                    userProfiles[str(alert['profileId'])] = data
         return {
             'profiles': userProfiles,
             'list': [
                 alert for alert in alerts if str(alert['profileId']) in userProfiles
-            ]
+            ],
+            'next': nextToken
         }
 
-        return alerts
     def validate(self, document):
         return document
 
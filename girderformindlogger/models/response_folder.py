@@ -18,6 +18,7 @@
 ###############################################################################
 
 import datetime
+import functools
 import itertools
 
 import cherrypy
@@ -26,18 +27,30 @@ from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import GirderException
 from girderformindlogger.models.assignment import Assignment
 from girderformindlogger.models.folder import Folder
+from girderformindlogger.models.index_catalog import RESPONSE_INDICES
 from girderformindlogger.models.item import Item
 from girderformindlogger.models.roles import getUserCipher
 from girderformindlogger.models.aes_encrypt import AESEncryption
 
 from bson import json_util
 
+# derived keys of recent responses, keyed by their start time in seconds
+RESPONSE_KEY_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=RESPONSE_KEY_CACHE_SIZE)
+def _responseKey(baseKey, responseStartSeconds):
+    timestamp = datetime.datetime.fromtimestamp(responseStartSeconds).isoformat()[-32:].encode('utf-8')
+    length = len(timestamp)
+    return bytes( (baseKey[i] ^ timestamp[i%length] ^ 0x34) for i in range(0, 32))
+
 
 class ResponseItem(AESEncryption, Item):
     def initialize(self):
         self.name = 'item'
         self.ensureIndices(('folderId', 'name', 'lowerName', 'created',
-                            ([('folderId', 1), ('name', 1)], {})))
+                            ([('folderId', 1), ('name', 1)], {}),
+                            *RESPONSE_INDICES))
         self.ensureTextIndex({
             'name': 1,
             'description': 1
@@ -55,10 +68,6 @@ class ResponseItem(AESEncryption, Item):
             ('meta.last7Days.responses', 1024),
         ], 6)
 
-    def reconnectToDb(self, db_uri=cherrypy.config['database']['uri']):
-        self.db_uri = db_uri
-        self.reconnect()
-
     def decodeDocument(self, document):
         metadata = document.get('meta', None)
         if metadata:
@@ -81,12 +90,11 @@ class ResponseItem(AESEncryption, Item):
 
         return document
 
-    def updateAESKey(self, document, baseKey):
+    def getAESKey(self, document):
         responseStartTime = document.get('meta', {}).get('responseStarted', None)
         if responseStartTime:
-            timestamp = datetime.datetime.fromtimestamp(responseStartTime//1000).isoformat()[-32:].encode('utf-8')
-            length = len(timestamp)
-            self.AES_KEY = bytes( (baseKey[i] ^ timestamp[i%length] ^ 0x34) for i in range(0, 32))
+            return _responseKey(self.baseKey, responseStartTime//1000)
+        return self.baseKey
 
 
     def createResponseItem(self, name, creator, folder, description='',
@@ -112,6 +112,62 @@ class ResponseTokens(AESEncryption, dict):
             sort=[("created", ASCENDING)]
         ))
 
+        return self._formatTokens(profile, cumulativeToken, tokenUpdates)
+
+    def getResponseTokensMany(self, profiles, startDates=None, retrieveUserKeys=True):
+        """
+        getResponseTokens for the profiles of one user in several applets,
+        with one query for the cumulative tokens and one for the updates.
+
+        :param profiles: profiles of a single user
+        :type profiles: list
+        :param startDates: str(applet id) -> earliest update to include
+        :type startDates: dict
+        :returns: dict of str(applet id) -> tokens
+        """
+        startDates = startDates or {}
+        if not profiles:
+            return {}
+
+        query = {
+            'userId': profiles[0]['userId'],
+            'appletId': {'$in': [profile['appletId'] for profile in profiles]}
+        }
+
+        cumulativeTokens = {
+            token.pop('appletId'): token for token in self.find({
+                **query,
+                'isCumulative': True
+            }, fields=['appletId', 'data', 'userPublicKey'] if retrieveUserKeys else ['appletId', 'data'])
+        }
+
+        query['isCumulative'] = False
+        # only bound the updates if every applet is bounded
+        if all(startDates.get(str(profile['appletId'])) for profile in profiles):
+            query['created'] = {
+                '$gte': min(startDates[str(profile['appletId'])] for profile in profiles)
+            }
+
+        tokenUpdates = {}
+        for tokenUpdate in self.find(
+            query,
+            fields=['appletId', 'created', 'data', 'userPublicKey'] if retrieveUserKeys else ['appletId', 'created', 'data'],
+            sort=[("created", ASCENDING)]
+        ):
+            appletId = tokenUpdate.pop('appletId')
+            startDate = startDates.get(str(appletId))
+            if not startDate or tokenUpdate['created'] >= startDate:
+                tokenUpdates.setdefault(appletId, []).append(tokenUpdate)
+
+        return {
+            str(profile['appletId']): self._formatTokens(
+                profile,
+                cumulativeTokens.get(profile['appletId']),
+                tokenUpdates.get(profile['appletId'], [])
+            ) for profile in profiles
+        }
+
+    def _formatTokens(self, profile, cumulativeToken, tokenUpdates):
         if cumulativeToken:
             cumulativeToken.pop('_id')
 
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+
+from bson.objectid import ObjectId
+from girderformindlogger.models.model_base import Model
+from pymongo import UpdateOne
+
+# days after which an entry is dropped whether or not it was superseded
+SCHEDULE_INDEX_LIFETIME = 30
+
+
+class ScheduleIndex(Model):
+    """
+    Materialized event cards of a schedule, one document per day.
+
+    Entries are keyed by the applet, the profile for individualized
+    schedules (None for the applet-wide one) and a revision computed from
+    the ids and update times of the events, so a change to the events never
+    matches entries built from the previous ones. Entries of an applet are
+    dropped whenever its events change and are rebuilt a day at a time on
+    the next read.
+    """
+
+    def initialize(self):
+        self.name = 'scheduleIndex'
+        self.ensureIndices(
+            (
+                'appletId',
+                ([
+                    ('appletId', 1),
+                    ('profileId', 1),
+                    ('revision', 1),
+                    ('day', 1)
+                ], {}),
+                ('expires', {'expireAfterSeconds': 0})
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    def revision(self, events):
+        """
+        Revision of a set of events as returned by Events.getEvents.
+        """
+        content = '|'.join(sorted(
+            '{}:{}'.format(event.get('_id', event.get('id')), event.get('updated', ''))
+            for event in events
+        ))
+        return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+    def getDays(self, appletId, profileId, revision, days):
+        """
+        Get the indexed event cards of several days.
+
+        :param days: days formatted as '%Y/%m/%d'
+        :type days: list
+        :returns: dict of day -> list of cards for the days in the index
+        """
+        return {
+            entry['day']: entry['cards'] for entry in self.find({
+                'appletId': ObjectId(appletId),
+                'profileId': profileId,
+                'revision': revision,
+                'day': {'$in': list(days)}
+            }, fields=['day', 'cards'])
+        }
+
+    def setDays(self, appletId, profileId, revision, cardsByDay):
+        """
+        Store the event cards of several days.
+
+        :param cardsByDay: dict of day -> list of cards
+        :type cardsByDay: dict
+        """
+        now = datetime.datetime.utcnow()
+        expires = now + datetime.timedelta(days=SCHEDULE_INDEX_LIFETIME)
+
+        if not cardsByDay:
+            return
+
+        self.collection.bulk_write([
+            UpdateOne({
+                'appletId': ObjectId(appletId),
+                'profileId': profileId,
+                'revision': revision,
+                'day': day
+            }, {
+                '$set': {
+                    'cards': cards,
+                    'created': now,
+                    'expires': expires
+                }
+            }, upsert=True) for (day, cards) in cardsByDay.items()
+        ], ordered=False)
+
+    def invalidate(self, appletId):
+        """
+        Drop the entries of an applet, once its events have changed.
+        """
+        self.removeWithQuery({'appletId': ObjectId(appletId)})
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Routing of applet data to the database of the account owning the applet.
+
+Accounts may keep their response data in their own MongoDB (`db` in the
+account profile). Rather than pointing a shared model singleton at another
+database, callers ask for a copy of the model bound to the tenant's
+collection; copies are cheap and never touch the singleton, so concurrent
+requests for different tenants cannot interfere with each other.
+"""
+import copy
+import threading
+import time
+
+from bson.objectid import ObjectId
+from girderformindlogger.utility import config
+
+# seconds for which the database of an applet's account is remembered
+DEFAULT_ACCOUNT_CACHE_TTL = 60
+
+
+class TenantRouter(object):
+    """
+    Resolves the database of an applet and hands out models bound to it.
+
+    :param ttl: seconds for which applet -> database lookups are cached.
+    :type ttl: int
+    """
+
+    def __init__(self, ttl=DEFAULT_ACCOUNT_CACHE_TTL):
+        self.ttl = ttl
+        self._uris = {}
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def databaseUri(self, appletId):
+        """
+        Get the database URI of the account owning an applet.
+
+        :param appletId: ID of the applet
+        :type appletId: ObjectId or str
+        :returns: the URI, or None for the default database.
+        """
+        from girderformindlogger.models.account_profile import AccountProfile
+
+        key = str(appletId)
+        now = time.time()
+
+        with self._lock:
+            cached = self._uris.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        account = AccountProfile().findOne({
+            'applets.owner': ObjectId(appletId)
+        }, fields=['db'])
+        uri = account.get('db', None) if account else None
+
+        with self._lock:
+            self._uris[key] = (now + self.ttl, uri or None)
+        return uri or None
+
+    def invalidate(self, appletId=None):
+        """
+        Forget the cached database of an applet, or of all applets.
+        """
+        with self._lock:
+            if appletId is None:
+                self._uris.clear()
+            else:
+                self._uris.pop(str(appletId), None)
+
+    def bind(self, model, uri):
+        """
+        Get a copy of a model reading and writing the given database. The
+        client and collection handles are created once per database, along
+        with the model's indices.
+
+        :param model: model singleton
+        :type model: Model
+        :param uri: database URI, None for the model itself.
+        :type uri: str or None
+        """
+        if not uri or uri == model.db_uri:
+            return model
+
+        key = (uri, model.name)
+        with self._lock:
+            handles = self._collections.get(key)
+
+        bound = copy.copy(model)
+        bound.db_uri = uri
+
+        if handles is None:
+            # connects and ensures the indices on the tenant's collection
+            bound.reconnect()
+            with self._lock:
+                self._collections[key] = (
+                    bound._dbserver_version, bound.database, bound.collection)
+        else:
+            (bound._dbserver_version, bound.database, bound.collection) = handles
+
+        return bound
+
+    def forApplet(self, model, appletId):
+        """
+        Get a copy of a model bound to the database holding an applet's data.
+
+        :param model: model singleton
+        :type model: Model
+        :param appletId: ID of the applet
+        :type appletId: ObjectId or str
+        """
+        return self.bind(model, self.databaseUri(appletId))
+
+
+_router = None
+
+
+def getTenantRouter():
+    """
+    Get the process-wide tenant router, configured from the ``[tenants]``
+    config section.
+    """
+    global _router
+
+    if _router is None:
+        cfg = config.getConfig().get('tenants', {}) or {}
+        _router = TenantRouter(
+            ttl=int(cfg.get('account_cache_ttl', DEFAULT_ACCOUNT_CACHE_TTL)))
+    return _router
@@ -11,6 +11,7 @@ import re
 import requests
 import string
 import six
+import threading
 import time
 
 import girderformindlogger
@@ -116,13 +117,29 @@ def firstLower(value):
     return("".join([value[0].lower(), value[1:]]))
 
 
+# keep-alive connections of the documents loaded while importing, one session
+# per thread as requests sessions are not thread-safe
+_jsonSessions = threading.local()
+
+
+def _jsonSession():
+    session = getattr(_jsonSessions, 'session', None)
+    if session is None:
+        session = _jsonSessions.session = requests.Session()
+    return session
+
+
 def loadJSON(url, urlType='protocol'):
     from girderformindlogger.exceptions import ValidationException
 
     print("Loading {} from {}".format(urlType, url))
     try:
-        r = requests.get(url)
-        data = json5.loads(r.text)
+        r = _jsonSession().get(url)
+        try:
+            # most documents are plain JSON, which parses much faster than JSON5
+            data = json.loads(r.text)
+        except ValueError:
+            data = json5.loads(r.text)
     except:
         return({})
         raise ValidationException(
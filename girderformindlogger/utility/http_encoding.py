@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Content coding of REST responses and matching of their entity tags.
+
+JSON bodies of at least ``[server] compress_min_size`` bytes are compressed
+with brotli, where it is installed (``pip install
+girderformindlogger[brotli]``), or gzip, whichever the client accepts
+first by quality. Since a strong entity tag must differ between the
+codings of a response, the coding is appended to the tag of a compressed
+response, and stripped again when matching ``If-None-Match``.
+"""
+import gzip
+import hashlib
+import json
+
+from cherrypy.lib import httputil
+from girderformindlogger.utility import config, toBool, JsonEncoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _encodings():
+    """
+    The codings responses can be compressed with, preferred first.
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compressionSettings():
+    """
+    :returns: whether responses are compressed, and the size in bytes from
+        which they are.
+    :rtype: tuple
+    """
+    server = config.getConfig().get('server', {}) or {}
+    return (
+        toBool(server.get('compress_responses', True)),
+        int(server.get('compress_min_size', 1024))
+    )
+
+
+def negotiateEncoding(acceptEncoding):
+    """
+    Choose the coding of a response.
+
+    :param acceptEncoding: the Accept-Encoding header of the request.
+    :type acceptEncoding: str or None
+    :returns: 'br', 'gzip' or None for no compression.
+    """
+    if not acceptEncoding:
+        return None
+
+    qualities = {}
+    for element in httputil.header_elements('Accept-Encoding', acceptEncoding):
+        qualities[element.value.lower()] = element.qvalue
+
+    best = None
+    for encoding in _encodings():
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(body, encoding):
+    """
+    :type body: bytes
+    :param encoding: 'br' or 'gzip'.
+    :rtype: bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def makeETag(*validators):
+    """
+    Make a strong entity tag from values that change whenever the response
+    they validate does.
+
+    :returns: the quoted tag.
+    :rtype: str
+    """
+    digest = hashlib.sha1(json.dumps(
+        validators, sort_keys=True, cls=JsonEncoder).encode('utf8')).hexdigest()
+    return '"%s"' % digest
+
+
+def encodedETag(etag, encoding):
+    """
+    The tag of a response sent with a content coding.
+    """
+    return '"%s-%s"' % (etag.strip('"'), encoding) if encoding else etag
+
+
+def etagMatches(ifNoneMatch, etag):
+    """
+    Whether an If-None-Match header matches a tag made by `makeETag`, in
+    any of its codings.
+
+    :param ifNoneMatch: the If-None-Match header of the request.
+    :type ifNoneMatch: str or None
+    :type etag: str
+    :rtype: bool
+    """
+    if not ifNoneMatch:
+        return False
+
+    etag = etag.strip('"')
+    for candidate in ifNoneMatch.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for encoding in ('br', 'gzip'):
+            if candidate.endswith('-' + encoding):
+                candidate = candidate[:-len(encoding) - 1]
+        if candidate == etag:
+            return True
+    return False
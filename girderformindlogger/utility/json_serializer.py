@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Serialization of REST responses to JSON.
+
+Responses are encoded with orjson where it is installed (``pip install
+girderformindlogger[json]``), and with the standard library and
+`JsonEncoder` otherwise or when ``[server] json_serializer`` is "json".
+Values orjson has no native encoding for, and datetimes, go through
+`JsonEncoder.default`, so both give the same JSON for the same values,
+whitespace and the escaping of non-ASCII characters aside. orjson encodes
+NaN as null where the standard library raises.
+
+Keys are sorted only if ``[server] json_sort_keys`` is set.
+"""
+import json
+
+from girderformindlogger.utility import config, toBool, JsonEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JsonEncoder(allow_nan=False)
+
+
+def dumpsJson(val, sortKeys=False):
+    """
+    Encode a value with the standard library.
+
+    :returns: UTF-8 encoded JSON.
+    :rtype: bytes
+    """
+    return json.dumps(val, sort_keys=sortKeys, allow_nan=False,
+                      cls=JsonEncoder).encode('utf8')
+
+
+def dumpsOrjson(val, sortKeys=False):
+    """
+    Encode a value with orjson, or with the standard library if orjson
+    cannot encode it (ie. integers beyond 64 bits).
+
+    :returns: UTF-8 encoded JSON.
+    :rtype: bytes
+    """
+    option = (
+        orjson.OPT_NON_STR_KEYS |
+        orjson.OPT_PASSTHROUGH_DATETIME |
+        orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+    if sortKeys:
+        option |= orjson.OPT_SORT_KEYS
+
+    try:
+        return orjson.dumps(val, default=_encoder.default, option=option)
+    except orjson.JSONEncodeError:
+        return dumpsJson(val, sortKeys)
+
+
+def getSerializer():
+    """
+    Get the function REST responses are encoded with, as configured.
+    """
+    serializer = (config.getConfig().get('server', {}) or {}).get('json_serializer', 'auto')
+    if orjson is not None and serializer != 'json':
+        return dumpsOrjson
+    return dumpsJson
+
+
+def dumps(val, sortKeys=None):
+    """
+    Encode a REST response.
+
+    :param sortKeys: whether to sort the keys of objects, by default the
+        ``[server] json_sort_keys`` setting.
+    :type sortKeys: bool or None
+    :returns: UTF-8 encoded JSON.
+    :rtype: bytes
+    """
+    if sortKeys is None:
+        sortKeys = toBool((config.getConfig().get('server', {}) or {}).get(
+            'json_sort_keys', False))
+
+    return getSerializer()(val, sortKeys)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Caching layer for JSON-LD expansion.
+
+Remote ``@context`` documents are resolved through a document loader backed by
+an on-disk cache with a TTL, falling back to the stale cached copy when the
+remote is unreachable. Expanded nodes are memoized by a hash of their content,
+so the many items of a protocol sharing the same definitions are expanded once.
+"""
+import collections
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+from girderformindlogger import logprint
+from girderformindlogger.utility import config, mkdir
+from pyld import jsonld
+
+REPROSCHEMA_CONTEXT = 'https://raw.githubusercontent.com/jj105/reproschema-context/master/context.json'
+
+DEFAULT_CONTEXT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.girderformindlogger', 'jsonld_contexts')
+DEFAULT_CONTEXT_TTL = 24 * 60 * 60
+DEFAULT_EXPANSION_MEMO_SIZE = 4096
+
+
+class CachingDocumentLoader(object):
+    """
+    pyld document loader keeping fetched documents in memory and on disk.
+
+    :param cacheDir: directory for cached documents, None to disable.
+    :type cacheDir: str or None
+    :param ttl: seconds after which a cached document is fetched again.
+    :type ttl: int
+    :param remote: loader used to fetch documents, defaults to pyld's.
+    :type remote: callable
+    """
+
+    def __init__(self, cacheDir=DEFAULT_CONTEXT_CACHE_DIR, ttl=DEFAULT_CONTEXT_TTL,
+                 remote=None):
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        self._remote = remote or jsonld.requests_document_loader()
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, options=None):
+        return {
+            'contentType': 'application/ld+json',
+            'contextUrl': None,
+            'documentUrl': url,
+            'document': copy.deepcopy(self.load(url))
+        }
+
+    def load(self, url):
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(url)
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+
+        path = self._cachePath(url)
+        if path and os.path.exists(path) and now - os.path.getmtime(path) < self.ttl:
+            document = self._read(path)
+            if document is not None:
+                return self._remember(url, os.path.getmtime(path), document)
+
+        try:
+            document = self._remote(url, {})['document']
+        except Exception:
+            document = self._read(path) if path else None
+            if document is None:
+                raise
+            logprint.warning('Using cached copy of unreachable context %s' % url)
+            return self._remember(url, now, document)
+
+        self._write(path, document)
+        return self._remember(url, now, document)
+
+    def _remember(self, url, fetched, document):
+        with self._lock:
+            self._memory[url] = (fetched, document)
+        return document
+
+    def _cachePath(self, url):
+        if not self.cacheDir:
+            return None
+        return os.path.join(
+            self.cacheDir, hashlib.sha1(url.encode('utf8')).hexdigest() + '.json')
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, path, document):
+        if not path:
+            return
+        try:
+            mkdir(self.cacheDir)
+            tmpPath = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmpPath, 'w') as f:
+                json.dump(document, f)
+            os.replace(tmpPath, path)
+        except (IOError, OSError, TypeError):
+            pass
+
+
+class ExpansionMemo(object):
+    """
+    Bounded LRU of expanded JSON-LD nodes keyed by a hash of the unexpanded
+    node. Copies are handed out, since callers modify expanded nodes in place.
+    """
+
+    def __init__(self, maxEntries=DEFAULT_EXPANSION_MEMO_SIZE):
+        self.maxEntries = maxEntries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data):
+        try:
+            content = json.dumps(data, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+    def expand(self, data, options):
+        key = self.key(data) if self.maxEntries > 0 else None
+
+        if key is not None:
+            with self._lock:
+                expanded = self._entries.get(key)
+                if expanded is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+            if expanded is not None:
+                return copy.deepcopy(expanded)
+
+        with _pyldLock:
+            expanded = jsonld.expand(data, options)
+
+        if key is not None:
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = copy.deepcopy(expanded)
+                while len(self._entries) > self.maxEntries:
+                    self._entries.popitem(last=False)
+
+        return expanded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_documentLoader = None
+_expansionMemo = ExpansionMemo()
+# pyld's shared context cache is not thread-safe
+_pyldLock = threading.RLock()
+
+
+def getDocumentLoader():
+    """
+    Get the document loader used to resolve JSON-LD contexts, creating it from
+    the ``[jsonld]`` config section on first use.
+    """
+    global _documentLoader
+
+    if _documentLoader is None:
+        cfg = config.getConfig().get('jsonld', {}) or {}
+        _documentLoader = CachingDocumentLoader(
+            cacheDir=os.path.expanduser(
+                cfg.get('context_cache_dir', DEFAULT_CONTEXT_CACHE_DIR)),
+            ttl=int(cfg.get('context_ttl', DEFAULT_CONTEXT_TTL))
+        )
+    return _documentLoader
+
+
+def setDocumentLoader(loader):
+    """
+    Replace the document loader used to resolve JSON-LD contexts.
+
+    :param loader: pyld-compatible document loader, or None to restore the
+        default one.
+    :type loader: callable
+    """
+    global _documentLoader
+    _documentLoader = loader
+
+
+def setExpansionMemo(memo):
+    """
+    Replace the memo of expanded nodes; pass ``ExpansionMemo(0)`` to disable it.
+
+    :type memo: ExpansionMemo
+    """
+    global _expansionMemo
+    _expansionMemo = memo
+
+
+def expandDocument(data):
+    """
+    Expand a JSON-LD document, reusing the result of an earlier expansion of
+    identical content.
+
+    :param data: unexpanded JSON-LD document
+    :type data: dict or list
+    :returns: expanded JSON-LD (list)
+    """
+    return _expansionMemo.expand(data, {'documentLoader': getDocumentLoader()})
@@ -1,6 +1,7 @@
 from bson import json_util
 from copy import deepcopy
 from datetime import datetime
+from girderformindlogger import logger
 from girderformindlogger.constants import AccessType, PREFERRED_NAMES, DEFINED_RELATIONS,       \
     HIERARCHY, KEYS_TO_DELANGUAGETAG, KEYS_TO_DEREFERENCE, KEYS_TO_EXPAND,     \
     MODELS, NONES, REPROLIB_CANONICAL, REPROLIB_PREFIXES
@@ -11,15 +12,23 @@ from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.collection import Collection as CollectionModel
 from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.item import Item as ItemModel
-from girderformindlogger.models.protocol import Protocol as ProtocolModel
+from girderformindlogger.models.protocol import Protocol as ProtocolModel, \
+    referenceIndexEntries
+from girderformindlogger.models.protocol_change import ProtocolChange
 from girderformindlogger.models.screen import Screen as ScreenModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility import loadJSON
+from girderformindlogger.utility.jsonld_context import REPROSCHEMA_CONTEXT, \
+    expandDocument
+from girderformindlogger.utility.progress import ProgressContext
 from girderformindlogger.utility.response import responseDateList
 from girderformindlogger.models.cache import Cache as CacheModel
 from bson.objectid import ObjectId
 from pyld import jsonld
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+# maximum number of activities or items imported concurrently from URLs
+IMPORT_WORKERS = 8
 
 
 def getModelCollection(modelType):
@@ -96,8 +105,10 @@ def convertObjectToSingleFileFormat(obj, modelType, user, identifier=None, refre
 
         createCache(obj, formatted, modelType, user)
 
-# insert historical data in the database
-def insertHistoryData(obj, identifier, modelType, baseVersion, historyFolder, historyReferenceFolder, user):
+# insert historical data in the database; the entry of its history reference
+# is written right away or, given a `references` list, appended to it to be
+# written by insertHistoryReferences along with others
+def insertHistoryData(obj, identifier, modelType, baseVersion, historyFolder, historyReferenceFolder, user, references=None):
     if modelType not in ['activity', 'screen']:
         return
 
@@ -162,55 +173,166 @@ def insertHistoryData(obj, identifier, modelType, baseVersion, historyFolder, hi
 
         obj = createCache(obj, formatted, modelClass.name, user)
 
+    entry = (
+        identifier,
+        modelType,
+        baseVersion,
+        '{}/{}'.format(modelType, str(obj['_id'])) if obj else None
+    )
+    if references is None:
+        insertHistoryReferences([entry], historyReferenceFolder, user)
+    else:
+        references.append(entry)
+
+    return obj
+
+def insertHistoryReferences(references, historyReferenceFolder, user):
+    """
+    Record entries in the history references of several items, with one
+    query for the existing reference items and one write each to create the
+    missing ones and update the others.
+
+    :param references: (identifier, modelType, version, reference) tuples
+        collected by insertHistoryData; reference is None for new items.
+    :type references: list
+    :param historyReferenceFolder: references folder of the protocol history
+    :type historyReferenceFolder: dict
+    :param user: user saving the protocol
+    :type user: dict
+    """
+    if not references:
+        return
+
     itemModel = ItemModel()
+    now = datetime.utcnow()
+
+    entries = {}
+    for (identifier, modelType, version, reference) in references:
+        entries.setdefault(identifier, (modelType, []))[1].append({
+            'version': version,
+            'reference': reference,
+            'updated': now
+        })
 
-    # update references
-    referenceObj = itemModel.findOne({
+    existing = {}
+    for referenceObj in itemModel.find({
         'folderId': historyReferenceFolder['_id'],
-        'meta.identifier': identifier
-    })
-    if not referenceObj:
-        referenceObj = itemModel.setMetadata(itemModel.createItem(
-            name='history of {}'.format(identifier),
-            creator=user,
-            folder=historyReferenceFolder,
-            reuseExisting=False
-        ), {
+        'meta.identifier': {'$in': list(entries)}
+    }, fields=[
+        'meta.identifier', 'meta.referenceIndex', 'meta.history.version',
+        'meta.history.reference'
+    ]):
+        existing.setdefault(referenceObj['meta']['identifier'], referenceObj)
+
+    missing = [identifier for identifier in entries if identifier not in existing]
+    names = itemModel.reserveNames([
+        (historyReferenceFolder['_id'], 'history of {}'.format(identifier))
+        for identifier in missing
+    ])
+
+    documents = []
+    for (identifier, name) in zip(missing, names):
+        (modelType, history) = entries[identifier]
+
+        document = itemModel.newItemDocument(name, user, historyReferenceFolder)
+        document['lowerName'] = document['name'].lower()
+        document['meta'] = {
             'identifier': identifier,
             'modelType': modelType,
-            'history': []
-        })
+            'history': history,
+            'referenceIndex': referenceIndexEntries(history),
+            'lastVersion': history[-1]['version']
+        }
+        documents.append(document)
+    itemModel.insertMany(documents)
 
-    now = datetime.utcnow()
+    updates = []
+    for (identifier, referenceObj) in existing.items():
+        history = entries[identifier][1]
 
-    itemModel.update({'_id': referenceObj['_id']}, {
-        '$push': {
-            'meta.history': {
-                'version': baseVersion,
-                'reference': '{}/{}'.format(modelType, str(obj['_id'])) if obj else None,
-                'updated': now
-            }
-        },
-        '$set': {
+        push = {'meta.history': {'$each': history}}
+        update = {
             'updated': now,
-            'meta.lastVersion': baseVersion
+            'meta.lastVersion': history[-1]['version']
         }
-    })
 
-    return obj
+        # version -> reference pairs read by Protocol.getHistoryDataFromItemIRIs,
+        # built from the history for items created before the index was kept
+        if 'referenceIndex' not in referenceObj['meta']:
+            update['meta.referenceIndex'] = referenceIndexEntries(
+                referenceObj['meta'].get('history', []) + history)
+        else:
+            push['meta.referenceIndex'] = {'$each': referenceIndexEntries(history)}
+
+        updates.append(UpdateOne({'_id': referenceObj['_id']}, {
+            '$push': push,
+            '$set': update
+        }))
+    if updates:
+        itemModel.collection.bulk_write(updates, ordered=False)
+
+    recordProtocolChanges(references, {
+        identifier: (
+            existing[identifier]['meta'].get('history') if identifier in existing else None
+        ) or history for (identifier, (modelType, history)) in entries.items()
+    }, historyReferenceFolder, now)
+
+def recordProtocolChanges(references, histories, historyReferenceFolder, now):
+    """
+    Append the entries recorded by insertHistoryReferences to the change log
+    of the protocol, one log entry per version.
 
-def createProtocolFromExpandedDocument(protocol, user, editExisting=False, removed={}, baseVersion=None):
+    :param histories: identifier -> history of the item, from its first
+        entry.
+    :type histories: dict
+    """
+    referencesId = historyReferenceFolder['_id']
+    if not historyReferenceFolder.get('meta', {}).get('changeLogSince'):
+        # changes made before are only in the history of the items
+        FolderModel().update({'_id': referencesId}, {
+            '$set': {'meta.changeLogSince': now}
+        }, multi=False)
+        historyReferenceFolder.setdefault('meta', {})['changeLogSince'] = now
+
+    changes = {}
+    for (identifier, modelType, version, reference) in references:
+        changes.setdefault(version, {})[identifier] = {
+            'identifier': identifier,
+            'modelType': modelType,
+            'firstVersion': histories[identifier][0]['version']
+        }
+
+    for (version, versionChanges) in changes.items():
+        ProtocolChange().record(
+            referencesId, version, list(versionChanges.values()), created=now)
+
+def createProtocolFromExpandedDocument(protocol, user, editExisting=False, removed={}, baseVersion=None, bulk=True):
+    """
+    Create or update the protocol, activities and screens of a protocol
+    loaded from a single file.
+
+    :param bulk: create the new activities and screens in bulk with
+        materializeDocuments rather than one at a time.
+    :type bulk: bool
+    :returns: the protocol id
+    """
     protocolId = None
     historyFolder = None
     historyReferenceFolder = None
+    references = []
 
     for modelType in ['protocol', 'activity', 'screen']:
         modelClass = MODELS()[modelType]()
         docCollection = getModelCollection(modelType)
+        created = []
 
         for model in protocol[modelType].values():
             prefName = modelClass.preferredName(model['expanded'])
 
+            if bulk and _isMaterializedInBulk(model, modelType, prefName, editExisting):
+                created.append(model)
+                continue
+
             if modelClass.name in ['folder', 'item']:
                 docFolder = None
                 item = None
@@ -231,7 +353,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                             docFolder = FolderModel().load(model['ref2Document']['_id'], force=True)
 
                             if 'identifier' in docFolder['meta'] and modelType == 'activity':
-                                model['historyObj'] = insertHistoryData(deepcopy(docFolder), docFolder['meta']['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user)
+                                model['historyObj'] = insertHistoryData(deepcopy(docFolder), docFolder['meta']['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                             docFolder['name'] = prefName
 
@@ -251,7 +373,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                                         'activityId': protocol[model['parentKey']][model['parentId']]['historyObj']['_id']
                                     })
 
-                                insertHistoryData(clonedItem, item['meta']['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user)
+                                insertHistoryData(clonedItem, item['meta']['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                             docFolder = FolderModel().findOne({'_id': item['folderId']})
 
@@ -278,7 +400,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                         metadata['identifier'] = docFolder['_id']
 
                         if editExisting:
-                            insertHistoryData(None, metadata['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user)
+                            insertHistoryData(None, metadata['identifier'], modelType, baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                 if modelClass.name=='folder':
                     newModel = modelClass.setMetadata(
@@ -322,7 +444,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                         metadata['identifier'] = '{}/{}'.format(metadata['activityId'], str(item['_id']))
 
                         if editExisting:
-                            insertHistoryData(None, '{}/{}'.format(metadata['activityId'], str(item['_id'])), modelType, baseVersion, historyFolder, historyReferenceFolder, user)
+                            insertHistoryData(None, '{}/{}'.format(metadata['activityId'], str(item['_id'])), modelType, baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                     newModel = modelClass.setMetadata(
                         item,
@@ -379,7 +501,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
 
                                 if 'identifier' in activity['meta']:
                                     activityId = str(activity['_id'])
-                                    activityIdToHistoryObj[activityId] = insertHistoryData(activity, activity['meta']['identifier'], 'activity', baseVersion, historyFolder, historyReferenceFolder, user)
+                                    activityIdToHistoryObj[activityId] = insertHistoryData(activity, activity['meta']['identifier'], 'activity', baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                         # handle deleted items
                         if 'items' in removed:
@@ -404,7 +526,7 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                                     if not historyObj:
 
                                         activity = FolderModel().load(activityId, force=True)
-                                        historyObj = insertHistoryData(activity, activity['meta']['identifier'], 'activity', baseVersion, historyFolder, historyReferenceFolder, user)
+                                        historyObj = insertHistoryData(activity, activity['meta']['identifier'], 'activity', baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                                         activityIdToHistoryObj[activityId] = historyObj
 
@@ -413,12 +535,152 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
                                         'activityId': historyObj['_id']
                                     })
 
-                                    insertHistoryData(item, item['meta']['identifier'], 'screen', baseVersion, historyFolder, historyReferenceFolder, user)
+                                    insertHistoryData(item, item['meta']['identifier'], 'screen', baseVersion, historyFolder, historyReferenceFolder, user, references=references)
 
                 model['ref2Document']['_id'] = newModel['_id']
 
+        materializeDocuments(
+            created, modelType, protocol, user,
+            references if editExisting else None, baseVersion
+        )
+
+    insertHistoryReferences(references, historyReferenceFolder, user)
+
     return protocolId
 
+
+def _isMaterializedInBulk(model, modelType, prefName, editExisting):
+    """
+    Whether an activity or screen is new and named so that
+    materializeDocuments creates it as the document by document path would.
+    """
+    return (
+        modelType in ('activity', 'screen') and
+        bool(prefName) and prefName == prefName.strip() and
+        not (model['ref2Document'].get('_id', None) and editExisting)
+    )
+
+
+def materializeDocuments(models, modelType, protocol, user, references=None, baseVersion=None):
+    """
+    Create new activities or screens of a protocol in bulk, as
+    createProtocolFromExpandedDocument does one at a time: the names are
+    reserved with one query per collection, then the documents and their
+    caches are inserted with one write each.
+
+    :param models: entries of protocol[modelType] to create; their '_id' is
+        set to the id of the new document.
+    :type models: list
+    :param modelType: 'activity' or 'screen'
+    :type modelType: str
+    :param protocol: expanded protocol, for the ids of the parents
+    :type protocol: dict
+    :param user: user saving the protocol
+    :type user: dict
+    :param references: list to append the history entries of the new
+        documents to, None if the protocol has no history to record.
+    :type references: list or None
+    :param baseVersion: version the history entries are recorded for
+    :type baseVersion: str
+    """
+    if not models:
+        return
+
+    modelClass = MODELS()[modelType]()
+    docCollection = getModelCollection(modelType)
+    prefNames = [modelClass.preferredName(model['expanded']) for model in models]
+
+    if modelClass.name == 'folder':
+        names = FolderModel().reserveNames(docCollection, 'collection', prefNames)
+        documents = [
+            FolderModel().newFolderDocument(
+                parent=docCollection,
+                name=name,
+                parentType='collection',
+                public=True,
+                creator=user
+            ) for name in names
+        ]
+    else:
+        # screens are kept in a folder per name, shared by screens of the
+        # same name
+        folders = {}
+        for folder in FolderModel().find({
+            'parentId': docCollection['_id'],
+            'parentCollection': 'collection',
+            'name': {'$in': list(set(prefNames))}
+        }):
+            folders.setdefault(folder['name'], folder)
+
+        newFolders = []
+        for name in prefNames:
+            if name not in folders:
+                folders[name] = FolderModel().newFolderDocument(
+                    parent=docCollection,
+                    name=name,
+                    parentType='collection',
+                    public=True,
+                    creator=user
+                )
+                folders[name]['lowerName'] = name.lower()
+                newFolders.append(folders[name])
+        FolderModel().insertMany(newFolders)
+
+        names = modelClass.reserveNames([
+            (folders[name]['_id'], name) for name in prefNames
+        ])
+        documents = [
+            modelClass.newItemDocument(name, user, folders[prefName])
+            for (name, prefName) in zip(names, prefNames)
+        ]
+
+    caches = []
+    for (model, document) in zip(models, documents):
+        document['_id'] = ObjectId()
+        document['lowerName'] = document['name'].lower()
+
+        metadata = {modelType: model['expanded']}
+
+        tmp = model
+        while tmp.get('parentId', None):
+            key = tmp['parentKey']
+            tmp = protocol[key][tmp['parentId']]
+
+            metadata['{}Id'.format(key)] = tmp['_id']
+
+        if modelType == 'activity':
+            metadata['identifier'] = document['_id']
+        else:
+            metadata['identifier'] = '{}/{}'.format(metadata['activityId'], str(document['_id']))
+
+        modelClass.validateKeys(metadata)
+        document['meta'] = metadata
+
+        formatted = _fixUpFormat(formatLdObject(
+            document,
+            mesoPrefix=modelType,
+            user=user,
+            refreshCache=True
+        ))
+        caches.append((modelClass.name, document['_id'], modelType, formatted))
+
+        document['loadedFromSingleFile'] = True
+        document['lastUpdatedBy'] = user['_id']
+        if 'duplicateOf' in model['ref2Document']:
+            document['duplicateOf'] = ObjectId(model['ref2Document']['duplicateOf'])
+
+        if references is not None:
+            references.append((metadata['identifier'], modelType, baseVersion, None))
+
+    for (document, cacheId) in zip(documents, CacheModel().insertCaches(caches)):
+        document['cached'] = cacheId
+    modelClass.insertMany(documents)
+
+    for (model, document) in zip(models, documents):
+        model['_id'] = document['_id']
+        model['ref2Document']['_id'] = document['_id']
+
+
 def getUpdatedContent(updates, document):
     # document: previous version of protocol data
     # updates: contains only changes
@@ -534,7 +796,13 @@ def cacheProtocolContent(protocol, document, user, editExisting=False):
 
         ItemModel().save(item)
 
-def loadFromSingleFile(document, user, editExisting=False):
+def expandSingleFile(document, editExisting=False):
+    """
+    Expand the protocol, activities and items of a protocol in the single
+    file format, as taken by createProtocolFromExpandedDocument.
+
+    :returns: dict of model type -> key -> expanded document and its parent
+    """
     if 'protocol' not in document or 'data' not in document['protocol']:
         raise ValidationException(
             'should contain protocol field in the json file.',
@@ -554,7 +822,6 @@ def loadFromSingleFile(document, user, editExisting=False):
         'ref2Document': document['protocol']['data']
     }
 
-    protocolId = None
     for activity in document['protocol']['activities'].values():
         expandedActivity = expandObj(contexts, activity['data'])
         protocol['activity'][expandedActivity['@id']] = {
@@ -579,6 +846,10 @@ def loadFromSingleFile(document, user, editExisting=False):
                     'ref2Document': item
                 }
 
+    return protocol
+
+def loadFromSingleFile(document, user, editExisting=False):
+    protocol = expandSingleFile(document, editExisting)
     protocolId = createProtocolFromExpandedDocument(protocol, user, editExisting, document.get('removed', {}), document.get('baseVersion', None))
     protocol = ProtocolModel().load(protocolId, force=True)
 
@@ -777,18 +1048,16 @@ def childByParent(parent, applet, parentProfile=None):
         user=parent
     ) if parentProfile is None else parentProfile
     parentKnows = parentProfile.get('schema:knows', {})
-    children = [Profile().displayProfileFields(
+    children = Profile().displayProfileFieldsMany([
         Profile().load(
             p,
             force=True
-        ),
-        parent
-    ) for p in list(
+        ) for p in list(
             set(parentKnows.get('rel:parentOf', {})).union(
                 set(parentKnows.get('schema:children', {}))
             )
         )
-    ]
+    ], parent)
     return([
         formatChildApplet(child, deepcopy(applet)) for child in children
     ])
@@ -1027,16 +1296,16 @@ def expandOneLevel(obj):
 
                 if '@context' in data:
                     if isinstance(data['@context'], list):
-                        data['@context'][0] = 'https://raw.githubusercontent.com/jj105/reproschema-context/master/context.json'
+                        data['@context'][0] = REPROSCHEMA_CONTEXT
                     if isinstance(data['@context'], str):
-                        data['@context'] = 'https://raw.githubusercontent.com/jj105/reproschema-context/master/context.json'
+                        data['@context'] = REPROSCHEMA_CONTEXT
 
-                newObj = jsonld.expand(data)
+                newObj = expandDocument(data)
             else:
                 print("Invalid Url: ", obj)
                 return (obj)
         else:
-            newObj = jsonld.expand(obj)
+            newObj = expandDocument(obj)
     except jsonld.JsonLdError as e: # 👮 Catch illegal JSON-LD
         if e.cause.type == "jsonld.ContextUrlError":
             invalidContext = e.cause.details.get("url")
@@ -1266,6 +1535,17 @@ def createCache(obj, formatted, modelType, user = None):
 
     if obj.get('cached'):
         cache_id = obj['cached']
+
+        # the ETags of applets are made from their update time and cache id
+        if modelType == 'applet':
+            obj['updated'] = datetime.utcnow()
+            formatted['updated'] = obj['updated']
+            MODELS()[modelType]().update({
+                '_id': ObjectId(obj['_id'])
+            }, {
+                '$set': {'updated': obj['updated']}
+            }, False)
+
         CacheModel().updateCache(cache_id, MODELS()[modelType]().name, obj['_id'], modelType, formatted)
     else:
         obj['updated'] = datetime.utcnow()
@@ -1298,13 +1578,23 @@ def clearCache(obj, modelType):
         cache_id = obj['cached']
         obj['cached'] = None
         MODELS()[modelType]().update({'_id': ObjectId(obj['_id'])}, {'$set': {'cached': None}}, False)
-        CacheModel().removeWithQuery({'_id': ObjectId(cache_id)})
+        CacheModel().removeCache(cache_id)
     return obj
 
 def loadCache(id):
     cache = CacheModel().getCacheData(id)
     return cache
 
+def loadCaches(ids):
+    """
+    Load several caches at once.
+
+    :param ids: cache ids
+    :type ids: list
+    :returns: dict of str(cache id) -> cached data
+    """
+    return CacheModel().getCacheDataMany(ids)
+
 def _fixUpFormat(obj):
     if isinstance(obj, dict):
         newObj = {}
@@ -1354,6 +1644,127 @@ def fixUpOrderList(obj, modelType, dictionary):
 
     return updated
 
+def _formatAppletContent(obj, protocol):
+    """
+    Format an applet from its formatted protocol, which is emptied.
+
+    :param obj: applet
+    :type obj: dict
+    :param protocol: formatted protocol
+    :type protocol: dict
+    :returns: dict
+    """
+    applet = {}
+    applet['activities'] = protocol.pop('activities', {})
+    applet['items'] = protocol.pop('items', {})
+    applet['protocol'] = {
+        key: protocol.get(
+            'protocol',
+            protocol.get(
+                'activitySet',
+                {}
+            )
+        ).pop(
+            key
+        ) for key in [
+            '@type',
+            '_id',
+            'http://schema.org/url',
+            'schema:url',
+            'url'
+        ] if key in list(protocol.get('protocol', {}).keys())
+    }
+    applet['applet'] = {
+        **protocol.pop('protocol', {}),
+        **obj.get('meta', {}).get('applet', {}),
+        'encryption': obj.get('meta', {}).get('encryption', {}),
+        'retentionSettings': obj.get('meta', {}).get('retentionSettings', {}),
+        '_id': "/".join(['applet', str(obj['_id'])]),
+        'url': "#".join([
+            obj.get('meta', {}).get('protocol', {}).get("url", "")
+        ])
+    }
+
+    if len(obj.get('meta', {}).get('applet', {}).get('displayName', '')):
+        inserted = False
+
+        candidates = ['prefLabel', 'altLabel']
+        for candidate in candidates:
+            for key in applet['applet']:
+                if not inserted and str(key).endswith(candidate) and len(applet['applet'][key]) and len(applet['applet'][key][0].get('@value', '')):
+                    applet['applet'][key][0]['@value'] = obj['meta']['applet']['displayName']
+
+                    inserted = True
+
+    return applet
+
+
+def formatAppletDelta(obj, user, activityIds, itemIds):
+    """
+    Format an applet as formatLdObject does, but with only some of its
+    activities and screens, loaded from their own caches rather than from
+    the cache of the whole applet.
+
+    :param obj: applet
+    :type obj: dict
+    :param activityIds: ids of the activities to include
+    :type activityIds: iterable of str
+    :param itemIds: '<activity id>/<screen id>' keys of the screens to include
+    :type itemIds: iterable of str
+    :returns: the formatted applet, or None if its protocol is not loaded
+        from a single file.
+    """
+    protocolId = obj.get('meta', {}).get('protocol', {}).get('_id', '').split('/')[-1]
+    if not ObjectId.is_valid(protocolId):
+        return None
+
+    protocolObj = ProtocolModel().load(protocolId, force=True)
+    if not protocolObj or not protocolObj.get('loadedFromSingleFile', False):
+        return None
+
+    activityIds = set(str(activityId) for activityId in activityIds)
+    itemIds = set(str(itemId) for itemId in itemIds)
+
+    activities = list(ActivityModel().find({
+        'meta.protocolId': protocolObj['_id'],
+        '_id': {'$in': [
+            ObjectId(activityId) for activityId in activityIds if ObjectId.is_valid(activityId)
+        ]}
+    }))
+    screenIds = [itemId.split('/')[-1] for itemId in itemIds]
+    items = list(ScreenModel().find({
+        'meta.protocolId': protocolObj['_id'],
+        '_id': {'$in': [
+            ObjectId(screenId) for screenId in screenIds if ObjectId.is_valid(screenId)
+        ]}
+    }))
+    caches = loadCaches([document.get('cached') for document in activities + items])
+
+    def formatted(document, modelType):
+        cache = caches.get(str(document.get('cached')))
+        return cache if cache is not None else formatLdObject(document, modelType, user)
+
+    newObj = dict(protocolObj.get('meta', {}).get('protocol', {}))
+    newObj['_id'] = 'protocol/{}'.format(str(protocolObj['_id']))
+
+    protocol = {
+        'protocol': newObj,
+        'activities': {
+            str(activity['_id']): formatted(activity, 'activity') for activity in activities
+        },
+        'items': {}
+    }
+    for item in items:
+        key = '{}/{}'.format(str(item['meta']['activityId']), str(item['_id']))
+        if key in itemIds:
+            protocol['items'][key] = formatted(item, 'screen')
+
+    applet = _formatAppletContent(obj, _fixUpFormat(protocol))
+    if 'updated' in obj:
+        applet['updated'] = obj['updated']
+    return applet
+
+
 def formatLdObject(
     obj,
     mesoPrefix='folder',
@@ -1471,47 +1882,7 @@ def formatLdObject(
                 refreshCache=refreshCache
             )
 
-            applet = {}
-            applet['activities'] = protocol.pop('activities', {})
-            applet['items'] = protocol.pop('items', {})
-            applet['protocol'] = {
-                key: protocol.get(
-                    'protocol',
-                    protocol.get(
-                        'activitySet',
-                        {}
-                    )
-                ).pop(
-                    key
-                ) for key in [
-                    '@type',
-                    '_id',
-                    'http://schema.org/url',
-                    'schema:url',
-                    'url'
-                ] if key in list(protocol.get('protocol', {}).keys())
-            }
-            applet['applet'] = {
-                **protocol.pop('protocol', {}),
-                **obj.get('meta', {}).get(mesoPrefix, {}),
-                'encryption': obj.get('meta', {}).get('encryption', {}),
-                'retentionSettings': obj.get('meta', {}).get('retentionSettings', {}),
-                '_id': "/".join([snake_case(mesoPrefix), objID]),
-                'url': "#".join([
-                    obj.get('meta', {}).get('protocol', {}).get("url", "")
-                ])
-            }
-
-            if len(obj.get('meta', {}).get('applet', {}).get('displayName', '')):
-                inserted = False
-
-                candidates = ['prefLabel', 'altLabel']
-                for candidate in candidates:
-                    for key in applet['applet']:
-                        if not inserted and str(key).endswith(candidate) and len(applet['applet'][key]) and len(applet['applet'][key][0].get('@value', '')):
-                            applet['applet'][key][0]['@value'] = obj['meta']['applet']['displayName']
-
-                            inserted = True
+            applet = _formatAppletContent(obj, protocol)
 
             createCache(obj, applet, 'applet', user)
             if responseDates:
@@ -1565,85 +1936,13 @@ def formatLdObject(
                     if fixUpOrderList(obj, 'protocol', activityIDMapping):
                         ProtocolModel().setMetadata(obj, obj['meta'])
             else:
-                try:
-                    protocol = componentImport(
-                        newObj,
-                        deepcopy(protocol),
-                        user,
-                        refreshCache=refreshCache,
-                        meta={'protocolId': ObjectId(obj['_id'])}
-                    )
-                except:
-                    print("636")
-                    protocol = componentImport(
-                        newObj,
-                        deepcopy(protocol),
-                        user,
-                        refreshCache=True
-                    )
-
-                newActivities = protocol.get('activities', {}).keys()
-                newItems = protocol.get('items', {}).keys()
-
-                while(any([len(newActivities), len(newItems)])):
-                    activitiesNow = set(
-                        protocol.get('activities', {}).keys()
-                    )
-                    itemsNow = set(protocol.get('items', {}).keys())
-                    for activityURL in newActivities:
-                        activity = protocol['activities'][activityURL]
-                        activity = activity.get(
-                            'meta',
-                            {}
-                        ).get('activity', activity)
-                        try:
-                            protocol = componentImport(
-                                deepcopy(activity),
-                                deepcopy(protocol),
-                                user,
-                                refreshCache=refreshCache,
-                                meta={'protocolId': ObjectId(obj['_id']), 'activityId': ObjectId(protocol['activities'][activityURL]['_id'].split('/')[-1])}
-                            )
-                        except:
-                            print("670")
-                            protocol = componentImport(
-                                deepcopy(activity),
-                                deepcopy(protocol),
-                                user,
-                                refreshCache=True,
-                                meta={'protocolId': obj['_id'], 'activityId': activity['_id']}
-                            )
-                    for itemURL in newItems:
-                        activity = protocol['items'][itemURL]
-                        activity = activity.get(
-                            'meta',
-                            {}
-                        ).get('screen', activity)
-                        try:
-                            protocol = componentImport(
-                                deepcopy(activity),
-                                deepcopy(protocol),
-                                user,
-                                refreshCache=refreshCache
-                            )
-                        except:
-                            print("691")
-                            protocol = componentImport(
-                                deepcopy(activity),
-                                deepcopy(protocol),
-                                user,
-                                refreshCache=True
-                            )
-                    newActivities = list(
-                        set(
-                            protocol.get('activities', {}).keys()
-                        ) - activitiesNow
-                    )
-                    newItems = list(
-                        set(
-                            protocol.get('items', {}).keys()
-                        ) - itemsNow
-                    )
+                importComponents(
+                    protocol,
+                    newObj,
+                    ObjectId(obj['_id']),
+                    user,
+                    refreshCache=refreshCache
+                )
 
             formatted = _fixUpFormat(protocol)
 
@@ -1667,6 +1966,177 @@ def formatLdObject(
         print(traceback.print_tb(sys.exc_info()[2]))
 
 
+def _componentIRIs(obj):
+    """
+    :param obj: protocol or activity
+    :type obj: dict
+    :returns: list of IRIs listed in the order of the given component
+    """
+    expanded = expand(deepcopy(obj))
+    if not isinstance(expanded, dict):
+        return []
+
+    IRIs = []
+    for order in expanded.get("reprolib:terms/order") or []:
+        for child in order.get("@list", []):
+            IRI = child.get('url', child.get('@id'))
+            if IRI is not None and not IRI.startswith("Document not found"):
+                IRIs.append(IRI)
+    return IRIs
+
+
+def _importComponent(IRI, user=None, refreshCache=False, meta={}):
+    """
+    Import a single activity or item by IRI.
+
+    :returns: (collection key, canonical IRI, formatted component) or None
+    """
+    from girderformindlogger.models import pluralize, smartImport
+    from girderformindlogger.utility import firstLower
+
+    activityComponent, activityContent, canonicalIRI = smartImport(
+        IRI,
+        user=user,
+        refreshCache=refreshCache,
+        meta=meta
+    )
+    activityComponent = pluralize(firstLower(
+        activityContent.get(
+            '@type',
+            ['']
+        )[0].split('/')[-1].split(':')[-1]
+    )) if (activityComponent is None and isinstance(
+        activityContent,
+        dict
+    )) else activityComponent
+    if activityComponent is None:
+        return None
+
+    return (
+        pluralize(activityComponent) if activityComponent != 'screen' else 'items',
+        canonicalIRI,
+        formatLdObject(
+            activityContent,
+            activityComponent,
+            user,
+            refreshCache=refreshCache
+        )
+    )
+
+
+def _isImported(IRI, protocol):
+    return any(
+        key in protocol.get(mt, {}) for key in {
+            IRI,
+            reprolibPrefix(IRI),
+            reprolibCanonize(IRI)
+        } for mt in ['activities', 'items']
+    )
+
+
+def importComponents(protocol, obj, protocolId, user=None, refreshCache=False,
+                     workers=IMPORT_WORKERS):
+    """
+    Import all activities and items of a protocol loaded by URL, one level of
+    the hierarchy at a time. The components of each level are fetched and
+    expanded in a bounded thread pool and merged into `protocol` once the
+    whole level is done. An IRI shared by several parents is imported once.
+
+    Wall-clock time and peak memory are reported through a progress record.
+
+    :param protocol: {'protocol': ..., 'activities': {}, 'items': {}},
+        updated in place
+    :type protocol: dict
+    :param obj: expanded protocol
+    :type obj: dict
+    :param protocolId: ID of the protocol
+    :type protocolId: ObjectId
+    :param workers: maximum number of concurrent imports
+    :type workers: int
+    :returns: protocol
+    """
+    import psutil
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    def importOne(task):
+        IRI, meta = task
+        try:
+            return _importComponent(IRI, user, refreshCache, meta)
+        except Exception:
+            pass
+        # retry without caches; a component that still fails is skipped
+        # rather than failing the whole protocol
+        try:
+            return _importComponent(IRI, user, True, meta)
+        except Exception:
+            logger.exception('Could not import %s' % IRI)
+            return None
+
+    process = psutil.Process()
+    started = time.time()
+    peakMemory = process.memory_info().rss
+    imported = 0
+
+    def summary():
+        return 'Imported {} components in {:.1f}s, peak memory {} MB'.format(
+            imported,
+            time.time() - started,
+            peakMemory // (1024 * 1024)
+        )
+
+    parents = [(obj, {'protocolId': protocolId})]
+    with ProgressContext(
+        user is not None,
+        user=user,
+        title='Importing {}'.format(obj.get('url', obj.get('@id', 'protocol'))),
+        message='Loading activities'
+    ) as progress, ThreadPoolExecutor(max_workers=workers) as pool:
+        while parents:
+            children = pool.map(lambda parent: _componentIRIs(parent[0]), parents)
+
+            tasks = {}
+            for (parent, meta), IRIs in zip(parents, children):
+                for IRI in IRIs:
+                    if IRI not in tasks and not _isImported(IRI, protocol):
+                        tasks[IRI] = meta
+
+            parents = []
+            for result in pool.map(importOne, tasks.items()):
+                if result is None:
+                    continue
+                components, canonicalIRI, formatted = result
+                protocol.setdefault(components, {})[canonicalIRI] = formatted
+                imported += 1
+
+                if not isinstance(formatted, dict):
+                    continue
+                if components == 'activities':
+                    parents.append((
+                        formatted.get('meta', {}).get('activity', formatted),
+                        {
+                            'protocolId': protocolId,
+                            'activityId': ObjectId(formatted['_id'].split('/')[-1])
+                        }
+                    ))
+                elif components == 'items':
+                    parents.append((
+                        formatted.get('meta', {}).get('screen', formatted),
+                        {}
+                    ))
+
+            peakMemory = max(peakMemory, process.memory_info().rss)
+            progress.update(
+                current=imported,
+                total=imported + len(parents),
+                message=summary()
+            )
+
+        progress.update(force=True, current=imported, total=imported, message=summary())
+
+    return protocol
+
+
 def componentImport(
     obj,
     protocol,
@@ -1680,67 +2150,14 @@ def componentImport(
     :type modelType: str or iterable
     :returns: protocol (updated)
     """
-    import itertools
-    from girderformindlogger.models import pluralize, smartImport
-    from girderformindlogger.utility import firstLower
-
     updatedProtocol = deepcopy(protocol)
-    obj2 = {k: v for k, v in expand(deepcopy(obj)).items() if v is not None}
     try:
-        for order in obj2.get(
-            "reprolib:terms/order",
-            {}
-        ):
-            for activity in order.get("@list", []):
-                IRI = activity.get(
-                    'url',
-                    activity.get('@id')
-                )
-                if reprolibPrefix(IRI) not in list(
-                    itertools.chain.from_iterable([
-                        protocol.get(mt, {}).keys() for mt in [
-                            "activities",
-                            "items"
-                        ]
-                    ])
-                ):
-                    result =         \
-                        smartImport(
-                            IRI,
-                            user=user,
-                            refreshCache=refreshCache,
-                            meta=meta
-                        ) if (IRI is not None and not IRI.startswith(
-                            "Document not found"
-                        )) else (None, None, None)
-                    activityComponent, activityContent, canonicalIRI = result
-
-                    activity["url"] = activity["schema:url"] = canonicalIRI if(
-                        canonicalIRI is not None
-                    ) else IRI
-                    activityComponent = pluralize(firstLower(
-                        activityContent.get(
-                            '@type',
-                            ['']
-                        )[0].split('/')[-1].split(':')[-1]
-                    )) if (activityComponent is None and isinstance(
-                        activityContent,
-                        dict
-                    )) else activityComponent
-                    if activityComponent is not None:
-                        activityComponents = (
-                            pluralize(
-                                activityComponent
-                            ) if activityComponent != 'screen' else 'items'
-                        )
-                        updatedProtocol[activityComponents][
-                            canonicalIRI
-                        ] = deepcopy(formatLdObject(
-                            activityContent,
-                            activityComponent,
-                            user,
-                            refreshCache=refreshCache
-                        ))
+        for IRI in _componentIRIs(obj):
+            if not _isImported(IRI, protocol):
+                result = _importComponent(IRI, user, refreshCache, meta)
+                if result is not None:
+                    components, canonicalIRI, formatted = result
+                    updatedProtocol[components][canonicalIRI] = deepcopy(formatted)
         return(updatedProtocol.get(
             'meta',
             updatedProtocol
@@ -1,3 +1,4 @@
+import threading
 import time
 
 from pyfcm import FCMNotification
@@ -18,3 +19,44 @@ class FirebaseNotification(FCMNotification):
         with ThreadPoolExecutor(max_workers=2) as executor:
             response = executor.map(self.do_request, payloads)
             executor.map(self.send_request_responses.append, response)
+
+
+class FakeNotification(object):
+    """
+    Stand-in for FirebaseNotification in load tests. Nothing is sent; every
+    request to FCM (up to 1000 devices) takes `latency` seconds and a share
+    `failureRate` of the devices is reported as failed.
+    """
+    FCM_MAX_RECIPIENTS = 1000
+
+    def __init__(self, latency=0.0, failureRate=0.0):
+        self.latency = latency
+        self.failureRate = failureRate
+        self.requests = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def notify_multiple_devices(self, registration_ids=None, **kwargs):
+        count = len(registration_ids or [])
+        requests = -(-count // self.FCM_MAX_RECIPIENTS)
+
+        if self.latency:
+            time.sleep(self.latency * requests)
+
+        with self._lock:
+            self.requests += requests
+            self.messages += count
+
+        failure = int(round(count * self.failureRate))
+        return {
+            'multicast_ids': list(range(requests)),
+            'success': count - failure,
+            'failure': failure,
+            'canonical_ids': 0,
+            'results': [{'error': 'Unavailable'}] * failure +
+                       [{'message_id': 'fake'}] * (count - failure),
+            'topic_message_id': None
+        }
+
+    def notify_single_device(self, registration_id=None, **kwargs):
+        return self.notify_multiple_devices([registration_id], **kwargs)
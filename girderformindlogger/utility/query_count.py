@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Counting of the MongoDB commands issued while handling a request.
+
+Every client created by `girderformindlogger.models.getDbConnection` reports
+its commands to `queryCountListener`, which adds them to the counters open
+in the current thread. With ``[server] query_count_header`` set, REST
+endpoints report their count in the ``Girder-Query-Count`` response header;
+tests can wrap a call in `countQueries` to assert on it.
+"""
+import collections
+import contextlib
+import threading
+
+from pymongo import monitoring
+
+# driver commands that are not queries of the application
+IGNORED_COMMANDS = {
+    'isMaster', 'ismaster', 'hello', 'ping', 'buildinfo', 'buildInfo',
+    'endSessions', 'saslStart', 'saslContinue', 'getnonce', 'authenticate'
+}
+
+_local = threading.local()
+
+
+class QueryCount(object):
+    """
+    Number of commands issued, in total and by command name.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.commands = collections.Counter()
+
+    def add(self, commandName):
+        self.count += 1
+        self.commands[commandName] += 1
+
+
+class QueryCountListener(monitoring.CommandListener):
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        for queryCount in getattr(_local, 'counts', ()):
+            queryCount.add(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+queryCountListener = QueryCountListener()
+
+
+@contextlib.contextmanager
+def countQueries():
+    """
+    Count the commands issued by the current thread within the block.
+
+        with countQueries() as queries:
+            ...
+        assert queries.count <= 10
+
+    :returns: QueryCount
+    """
+    queryCount = QueryCount()
+    if not hasattr(_local, 'counts'):
+        _local.counts = []
+    _local.counts.append(queryCount)
+    try:
+        yield queryCount
+    finally:
+        _local.counts.remove(queryCount)
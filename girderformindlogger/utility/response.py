@@ -17,11 +17,24 @@ from girderformindlogger.utility import clean_empty
 from pandas.api.types import is_numeric_dtype
 from pymongo import ASCENDING, DESCENDING
 from bson import json_util
-from girderformindlogger.utility import jsonld_expander
 from girderformindlogger.models.protocol import Protocol
 
 MonkeyPatch.patch_fromisoformat()
 
+# fields of a response read by aggregate; `meta.items` and
+# `meta.responseStarted` are needed to decrypt `meta.responses`
+AGGREGATE_FIELDS = [
+    'created',
+    'meta.responses',
+    'meta.items',
+    'meta.responseStarted',
+    'meta.applet.version',
+    'meta.dataSource'
+]
+
+# responses fetched per round trip by aggregate
+AGGREGATE_BATCH_SIZE = 500
+
 def getSchedule(currentUser, timezone=None):
     from girderformindlogger.models.profile import Profile
 
@@ -128,57 +141,67 @@ def aggregate(metadata, informant, startDate=None, endDate=None):
             "meta.subject.@id": metadata["subject_id"]
         }
 
-    definedRange = list(ResponseItem().find(
+    aggregated = aggregateResponses(ResponseItem().find(
         query=query,
         force=True,
+        fields=AGGREGATE_FIELDS,
         sort=[("created", ASCENDING)]
-    ))
+    ).batch_size(AGGREGATE_BATCH_SIZE))
 
-    if not len(definedRange):
+    if not aggregated:
         print('\n\n defined range returns an empty list.')
-        return {}
 
-    startDate = min([response.get(
-        'created',
-    ) for response in definedRange])
+    return(aggregated)
 
-    endDate = max([response.get(
-        'created'
-    ) for response in definedRange])
 
-    duration = isodate.duration_isoformat(
-        delocalize(endDate) - delocalize(startDate)
-    )
+def aggregateResponses(definedRange):
+    """
+    Group responses by item IRI in one pass over them.
 
-    responseIRIs = _responseIRIs(definedRange)
+    :param definedRange: responses sorted by `created`, with the fields in
+        AGGREGATE_FIELDS; any iterable, read once.
+    :returns: dict of the start date, end date, duration, responses by item
+        IRI and data sources by response id, or {} without responses.
+    """
+    responses = {}
+    dataSources = {}
+    startDate = endDate = None
 
-    aggregated = {
+    for response in definedRange:
+        created = completedDate(response)
+        if startDate is None:
+            startDate = created
+        endDate = created
+
+        meta = response.get('meta', {})
+        version = meta.get('applet', {}).get('version', '0.0.0')
+
+        for (itemIRI, value) in meta.get('responses', {}).items():
+            itemResponses = responses.get(itemIRI)
+            if itemResponses is None:
+                itemResponses = responses[itemIRI] = []
+            itemResponses.append({
+                "value": value,
+                "date": created,
+                "version": version
+            })
+
+        if 'dataSource' in meta:
+            dataSources[str(response['_id'])] = meta['dataSource']
+
+    if startDate is None:
+        return {}
+
+    return {
         "schema:startDate": startDate,
         "schema:endDate": endDate,
-        "schema:duration": duration,
-        "responses": {
-            itemIRI: [
-                {
-                    "value": response.get('meta', {}).get('responses', {}).get(
-                        itemIRI
-                    ),
-                    "date": completedDate(response),
-                    "version": response.get('meta', {}).get('applet', {}).get('version', '0.0.0')
-                } for response in definedRange if itemIRI in response.get(
-                    'meta',
-                    {}
-                ).get('responses', {})
-            ] for itemIRI in responseIRIs
-        }
+        "schema:duration": isodate.duration_isoformat(
+            delocalize(endDate) - delocalize(startDate)
+        ),
+        "responses": responses,
+        "dataSources": dataSources
     }
 
-    aggregated['dataSources'] = {}
-    for response in definedRange:
-        if 'dataSource' in response.get('meta', {}):
-            aggregated['dataSources'][str(response['_id'])] = response['meta']['dataSource']
-
-    return(aggregated)
-
 
 def completedDate(response):
     completed = response.get("created", {})
@@ -235,12 +258,6 @@ def string_or_ObjectID(s):
     return([str(s), ObjectId(s)])
 
 
-def _responseIRIs(definedRange):
-    return(list(set(itertools.chain.from_iterable([list(
-        response.get('meta', {}).get('responses', {}).keys()
-    ) for response in definedRange if isinstance(response, dict)]))))
-
-
 def _flattenDF(df, columnName):
     if isinstance(columnName, list):
         for c in columnName:
@@ -295,20 +312,14 @@ def delocalize(dt):
     print("Here's the problem: {}".format(dt))
     raise TypeError
 
-def last7Days(
-    appletId,
-    appletInfo,
-    informantId,
-    reviewer,
-    subject=None,
-    startDate=None,
-    includeOldItems=True,
-    groupByDateActivity=True,
-    localItems=[],
-    localActivities=[]
-):
-    from girderformindlogger.models.profile import Profile
+def last7DaysRange(startDate=None):
+    """
+    Range of responses returned by last7Days.
 
+    :param startDate: ISO date of the latest response held by the client
+    :type startDate: str or None
+    :returns: (start, end) as naive UTC datetimes
+    """
     referenceDate = datetime.combine(
         datetime.utcnow().date() + timedelta(days=1), datetime.min.time()
     )
@@ -325,7 +336,28 @@ def last7Days(
 
     startDate = weekBefore if not startDate or startDate < weekBefore else startDate
 
-    profile = Profile().findOne({'userId': ObjectId(informantId), 'appletId': ObjectId(appletId)})
+    return (startDate, referenceDate)
+
+def last7Days(
+    appletId,
+    appletInfo,
+    informantId,
+    reviewer,
+    subject=None,
+    startDate=None,
+    includeOldItems=True,
+    groupByDateActivity=True,
+    localItems=[],
+    localActivities=[],
+    profile=None,
+    tokens=None
+):
+    from girderformindlogger.models.profile import Profile
+
+    (startDate, referenceDate) = last7DaysRange(startDate)
+
+    if profile is None:
+        profile = Profile().findOne({'userId': ObjectId(informantId), 'appletId': ObjectId(appletId)})
 
     responses = aggregate({
         'applet_id': profile['appletId'],
@@ -339,14 +371,20 @@ def last7Days(
     outputResponses = responses.get('responses', {})
     dataSources = responses.get('dataSources', {})
 
+    # the responses to the items of a submission share its date
+    dates = {}
     for item in outputResponses:
         for resp in outputResponses[item]:
-            resp['date'] = delocalize(resp['date'])
-            if not groupByDateActivity:
-                resp['date'] = determine_date(resp['date'] + timedelta(hours=profile['timezone']))
+            date = dates.get(resp['date'])
+            if date is None:
+                date = delocalize(resp['date'])
+                if not groupByDateActivity:
+                    date = determine_date(date + timedelta(hours=profile['timezone']))
+                dates[resp['date']] = date
+            resp['date'] = date
 
     l7d = {}
-    l7d['tokens'] = ResponseTokens().getResponseTokens(profile, startDate, False)
+    l7d['tokens'] = tokens if tokens is not None else ResponseTokens().getResponseTokens(profile, startDate, False)
     l7d["responses"] = _oneResponsePerDatePerVersion(outputResponses, profile['timezone']) if groupByDateActivity else outputResponses
 
     l7d["schema:endDate"] = responses.get("schema:endDate", datetime.utcnow()).isoformat()
@@ -523,25 +561,54 @@ def add_latest_daily_response(data, responses, tokens):
 
 
 def _oneResponsePerDatePerVersion(responses, offset):
-    newResponses = {}
-    for response in responses:
-   
-        df = pd.DataFrame(responses[response])
+    """
+    Keep, for each item, the latest response of each day and version.
+
+    :param responses: item IRI -> responses with a naive UTC `date`, as
+        aggregated by last7Days.
+    :type responses: dict
+    :param offset: hours from UTC days are counted in.
+    :type offset: int or float
+    :returns: item IRI -> responses with the local `date` (a date), ordered
+        by date and version.
+    """
+    offset = timedelta(hours=offset)
+    dates = {}
+    versions = {}
 
-        df["datetime"] = df.date
-    
-        df["date"] = df.date + timedelta(hours=offset)
-        df["date"] = df.date.apply(determine_date)
-        df["versionValue"] = df.version.apply(convertToComparableVersion)
+    def localDate(d):
+        if d not in dates:
+            dates[d] = determine_date(d + offset)
+        return dates[d]
 
-        df.sort_values(by=['datetime', 'versionValue'], ascending=False, inplace=True)
-        df = df.groupby(['date', 'versionValue']).first()
+    def versionValue(version):
+        if version not in versions:
+            versions[version] = convertToComparableVersion(version)
+        return versions[version]
 
-        df.drop('datetime', axis=1, inplace=True)
+    newResponses = {}
+    for (IRI, itemResponses) in responses.items():
+        latest = {}
+        for response in sorted(
+            itemResponses,
+            key=lambda response: (response['date'], versionValue(response['version'])),
+            reverse=True
+        ):
+            key = (localDate(response['date']), versionValue(response['version']))
+            kept = latest.setdefault(key, {})
+
+            # fields missing from the latest response of the day are taken
+            # from the next one which has them
+            for (field, value) in response.items():
+                if field != 'date' and _isMissing(kept.get(field)):
+                    kept[field] = value
+
+        newResponses[IRI] = [
+            {**latest[key], 'date': key[0]} for key in sorted(latest)
+        ]
 
-        df['date'] = df.index
-        df['date'] = df.date.apply(lambda data: data[0])
+    return(newResponses)
 
-        newResponses[response] = df.to_dict(orient="records")
 
-    return(newResponses)
+def _isMissing(value):
+    return value is None or (isinstance(value, float) and value != value)
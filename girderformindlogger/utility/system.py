@@ -10,6 +10,7 @@ import time
 import girderformindlogger
 from girderformindlogger import logger
 from girderformindlogger.models import getDbConnection
+from girderformindlogger.models.cache import Cache
 
 
 def _objectToDict(obj):
@@ -131,6 +132,7 @@ def getStatus(mode='basic', user=None):
             True for threadId in cherrypy.tools.status.seenThreads
             if 'end' not in cherrypy.tools.status.seenThreads[threadId]])
         status['cherrypyThreadPoolSize'] = cherrypy.server.thread_pool
+        status['documentCache'] = Cache().getStats()
 
     if mode == 'slow' and isAdmin:
         _computeSlowStatus(process, status, db)
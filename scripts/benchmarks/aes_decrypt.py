@@ -0,0 +1,116 @@
+"""
+Decrypt 100k synthetic response documents the way `AESEncryption.find` used
+to (a key derived and stored on the model, and a new EAX cipher, for every
+document) and through the batched path with cached keys, with and without
+a thread pool.
+
+    python scripts/benchmarks/aes_decrypt.py [documents]
+"""
+import copy
+import datetime
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+from Cryptodome.Cipher import AES
+from girderformindlogger.models.aes_encrypt import DEFAULT_DECRYPT_BATCH_SIZE
+from girderformindlogger.models.response_folder import ResponseItem
+
+DOCUMENTS = 100000
+ITEMS = 5
+
+
+def responseModel():
+    # the cipher needs no database, so skip connecting
+    model = ResponseItem.__new__(ResponseItem)
+    model.initAES([
+        ('meta.responses', 1024),
+        ('meta.last7Days.responses', 1024),
+    ], 6)
+    return model
+
+
+def syntheticResponses(model, count):
+    started = int(time.time() * 1000) - count * 400
+    documents = []
+    for i in range(count):
+        document = {
+            'created': datetime.datetime.utcnow(),
+            'meta': {
+                'responseStarted': started + i * 400,
+                'items': ['item{}'.format(j) for j in range(ITEMS)],
+                # clients send responses serialized, keyed by item index
+                'responses': json_util.dumps({str(j): [i % 7, 'value'] for j in range(ITEMS)})
+            }
+        }
+        documents.append(model.encryptFields(document, model.fields))
+        assert isinstance(document['meta']['responses'], bytes)
+    return documents
+
+
+def legacyDecrypt(model, documents):
+    def updateAESKey(document, baseKey):
+        responseStartTime = document.get('meta', {}).get('responseStarted', None)
+        if responseStartTime:
+            timestamp = datetime.datetime.fromtimestamp(responseStartTime//1000).isoformat()[-32:].encode('utf-8')
+            length = len(timestamp)
+            model.AES_KEY = bytes( (baseKey[i] ^ timestamp[i%length] ^ 0x34) for i in range(0, 32))
+
+    def decrypt(data):
+        try:
+            cipher = AES.new(model.AES_KEY, AES.MODE_EAX, nonce=data[-32:-16])
+            plaintext = cipher.decrypt(data[:-32])
+            cipher.verify(data[-16:])
+
+            txt = plaintext.decode('utf-8')
+            length = int(txt[-model.maxCount: ])
+
+            return ('ok', txt[:length])
+        except:
+            return ('error', None)
+
+    result = []
+    for document in documents:
+        updateAESKey(document, model.baseKey)
+        for field in model.fields:
+            path = field[0].split('.')
+            key = path.pop()
+            data = model.navigate(document, path)
+            if data and data.get(key, None) and isinstance(data[key], bytes):
+                status, decrypted = decrypt(data[key])
+                if status == 'ok':
+                    data[key] = decrypted
+        model.decodeDocument(document)
+        model.AES_KEY = model.baseKey
+        result.append(document)
+    return result
+
+
+def batchedDecrypt(model, documents, executor=None):
+    result = []
+    for i in range(0, len(documents), DEFAULT_DECRYPT_BATCH_SIZE):
+        result.extend(model.decryptMany(
+            documents[i:i + DEFAULT_DECRYPT_BATCH_SIZE], executor))
+    return result
+
+
+def timed(label, fun, documents):
+    documents = copy.deepcopy(documents)
+    start = time.perf_counter()
+    decrypted = fun(documents)
+    elapsed = time.perf_counter() - start
+    assert decrypted[0]['meta']['responses']['item0'][1] == 'value'
+    print('{:<28} {:8.2f}s {:10.0f} docs/s'.format(label, elapsed, len(decrypted) / elapsed))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DOCUMENTS
+    model = responseModel()
+    documents = syntheticResponses(model, count)
+
+    timed('before (per-document key)', lambda d: legacyDecrypt(model, d), documents)
+    timed('after (cached keys)', lambda d: batchedDecrypt(model, d), documents)
+    with ThreadPoolExecutor(4) as pool:
+        timed('after (4 threads)', lambda d: batchedDecrypt(model, d, pool), documents)
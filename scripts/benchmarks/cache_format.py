@@ -0,0 +1,96 @@
+"""
+Compare the legacy JSON encoding of `Cache.cache_data` with the zlib
+compressed BSON encoding on a synthetic 300-item protocol.
+
+    python scripts/benchmarks/cache_format.py
+"""
+import datetime
+import timeit
+
+from bson import json_util
+from bson.objectid import ObjectId
+from girderformindlogger.models.cache import CACHE_FORMAT_JSON, \
+    decodeCacheData, encodeCacheData
+
+ITEMS = 300
+ACTIVITIES = 10
+REPEAT = 20
+
+
+def _languageTagged(value):
+    return [{'@language': 'en', '@value': value}]
+
+
+def syntheticProtocol(items=ITEMS, activities=ACTIVITIES):
+    protocolId = ObjectId()
+    protocol = {
+        'protocol': {
+            '@id': 'protocol',
+            '@type': ['reprolib:schemas/Protocol'],
+            '_id': 'protocol/{}'.format(protocolId),
+            'http://www.w3.org/2004/02/skos/core#prefLabel': _languageTagged('Benchmark'),
+            'schema:version': [{'@value': '1.0.0'}]
+        },
+        'activities': {},
+        'items': {}
+    }
+
+    for a in range(activities):
+        activityId = ObjectId()
+        protocol['activities'][str(activityId)] = {
+            '@id': 'activity{}'.format(a),
+            '@type': ['reprolib:schemas/Activity'],
+            '_id': 'activity/{}'.format(activityId),
+            'http://www.w3.org/2004/02/skos/core#prefLabel': _languageTagged('Activity {}'.format(a)),
+            'reprolib:terms/order': [{'@list': []}]
+        }
+
+        for i in range(items // activities):
+            itemId = ObjectId()
+            protocol['activities'][str(activityId)]['reprolib:terms/order'][0]['@list'].append(
+                {'@id': 'item{}'.format(i)}
+            )
+            protocol['items']['{}/{}'.format(activityId, itemId)] = {
+                '@id': 'item{}'.format(i),
+                '@type': ['reprolib:schemas/Field'],
+                '_id': 'screen/{}'.format(itemId),
+                'created': datetime.datetime.utcnow(),
+                'schema:question': _languageTagged('How are you feeling today? ' * 4),
+                'reprolib:terms/inputType': [{'@type': 'xsd:string', '@value': 'radio'}],
+                'reprolib:terms/responseOptions': [{
+                    'reprolib:terms/multipleChoice': [{'@value': False}],
+                    'schema:itemListElement': [{
+                        '@list': [{
+                            'schema:name': _languageTagged('Option {}'.format(o)),
+                            'schema:value': [{'@value': o}],
+                            'schema:image': 'https://example.com/images/{}.png'.format(o)
+                        } for o in range(5)]
+                    }]
+                }]
+            }
+
+    return protocol
+
+
+def main():
+    protocol = syntheticProtocol()
+
+    legacy = {'format': CACHE_FORMAT_JSON, 'cache_data': json_util.dumps(protocol)}
+    dataFormat, data = encodeCacheData(protocol)
+    current = {'format': dataFormat, 'cache_data': data}
+
+    assert decodeCacheData(legacy) == decodeCacheData(current)
+
+    for name, document in (('json_util string', legacy), ('zlib BSON', current)):
+        seconds = min(timeit.repeat(
+            lambda: decodeCacheData(document),
+            number=1,
+            repeat=REPEAT
+        ))
+        print('{:<18} {:>10,} bytes {:>9.2f} ms/load'.format(
+            name, len(document['cache_data']), seconds * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main()
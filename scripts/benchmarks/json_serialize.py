@@ -0,0 +1,42 @@
+"""
+Compare the standard library and orjson encodings of REST responses, as
+done by `json_serializer.dumps`, on the expanded applet of the API test
+fixtures and on a synthetic 300-item protocol, with and without sorting
+keys.
+
+    python scripts/benchmarks/json_serialize.py
+"""
+import json
+import os
+import timeit
+
+from cache_format import syntheticProtocol
+from girderformindlogger.utility.json_serializer import dumpsJson, dumpsOrjson, orjson
+
+REPEAT = 20
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'test', 'expected', 'test_1_HBN.jsonld')
+
+
+def main():
+    if orjson is None:
+        raise SystemExit('orjson is not installed (pip install girderformindlogger[json])')
+
+    with open(FIXTURE) as fixture:
+        payloads = (('test_1_HBN', json.load(fixture)), ('300 items', syntheticProtocol()))
+
+    for (name, payload) in payloads:
+        assert json.loads(dumpsOrjson(payload)) == json.loads(dumpsJson(payload))
+        for sortKeys in (False, True):
+            for (encoder, dumps) in (('json', dumpsJson), ('orjson', dumpsOrjson)):
+                seconds = min(timeit.repeat(
+                    lambda: dumps(payload, sortKeys),
+                    number=1,
+                    repeat=REPEAT
+                ))
+                print('{:<11} {:<7} sorted={!s:<6} {:>8,} bytes {:>8.2f} ms'.format(
+                    name, encoder, sortKeys, len(dumps(payload, sortKeys)), seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
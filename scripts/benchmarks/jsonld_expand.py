@@ -0,0 +1,142 @@
+"""
+Time the JSON-LD expansion of a synthetic protocol served by a local HTTP
+stand-in, with and without the context cache and the expansion memo.
+
+This covers the expansion part of `Protocol.importUrl`, which dominates it;
+the database writes are not included.
+
+    python scripts/benchmarks/jsonld_expand.py [items]
+"""
+import contextlib
+import http.server
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from girderformindlogger.utility import jsonld_context
+from girderformindlogger.utility.jsonld_expander import expand
+from pyld import jsonld
+
+ITEMS = 300
+ACTIVITIES = 10
+
+CONTEXT = {
+    '@context': {
+        '@version': 1.1,
+        'reproschema': 'http://schema.repronim.org/',
+        'schema': 'http://schema.org/',
+        'skos': 'http://www.w3.org/2004/02/skos/core#',
+        'prefLabel': {'@id': 'skos:prefLabel', '@container': '@language'},
+        'question': {'@id': 'schema:question', '@container': '@language'},
+        'name': {'@id': 'schema:name', '@container': '@language'},
+        'value': {'@id': 'schema:value'},
+        'inputType': {'@id': 'reproschema:inputType', '@type': 'xsd:string'},
+        'order': {'@id': 'reproschema:order', '@container': '@list', '@type': '@id'},
+        'valueconstraints': {'@id': 'reproschema:valueconstraints', '@type': '@id'},
+        'choices': {'@id': 'schema:itemListElement', '@container': '@list'}
+    }
+}
+
+
+def documents(base, items=ITEMS, activities=ACTIVITIES):
+    docs = {'/context.json': CONTEXT}
+    docs['/protocol'] = {
+        '@context': ['{}/context.json'.format(base)],
+        '@type': 'reproschema:Protocol',
+        '@id': 'protocol',
+        'prefLabel': 'Benchmark',
+        'order': ['{}/activities/{}'.format(base, a) for a in range(activities)]
+    }
+    docs['/valueConstraints'] = {
+        '@context': ['{}/context.json'.format(base)],
+        'choices': [{'name': 'Option {}'.format(o), 'value': o} for o in range(5)]
+    }
+    perActivity = items // activities
+    for a in range(activities):
+        docs['/activities/{}'.format(a)] = {
+            '@context': ['{}/context.json'.format(base)],
+            '@type': 'reproschema:Activity',
+            '@id': 'activity{}'.format(a),
+            'prefLabel': 'Activity {}'.format(a),
+            'order': ['{}/items/{}'.format(base, a * perActivity + i) for i in range(perActivity)]
+        }
+        for i in range(perActivity):
+            docs['/items/{}'.format(a * perActivity + i)] = {
+                '@context': ['{}/context.json'.format(base)],
+                '@type': 'reproschema:Field',
+                '@id': 'item{}'.format(i),
+                'prefLabel': 'Item {}'.format(i),
+                'question': 'How are you feeling today?',
+                'inputType': 'radio',
+                'valueconstraints': '{}/valueConstraints'.format(base)
+            }
+    return docs
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.documents.get(self.path, {})).encode('utf8')
+        self.send_response(200 if self.path in self.server.documents else 404)
+        self.send_header('Content-Type', 'application/ld+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def importProtocol(base):
+    protocol = expand('{}/protocol'.format(base))
+    for activity in protocol['reprolib:order'][0]['@list']:
+        activity = expand(activity['@id'])
+        for item in activity['reprolib:order'][0]['@list']:
+            expand(item['@id'])
+
+
+def timed(base, loader, memo):
+    jsonld_context.setDocumentLoader(loader)
+    jsonld_context.setExpansionMemo(memo)
+    jsonld._resolved_context_cache.clear()
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        importProtocol(base)
+    return time.time() - start
+
+
+def main(items=ITEMS):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    base = 'http://127.0.0.1:{}'.format(server.server_port)
+    server.documents = documents(base, items)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    pyldLoader = jsonld.requests_document_loader()
+
+    def standIn(url, options={}):
+        # the expander pins @context to the reproschema context on GitHub
+        if url == jsonld_context.REPROSCHEMA_CONTEXT:
+            url = '{}/context.json'.format(base)
+        return pyldLoader(url, options)
+
+    before = timed(base, standIn, jsonld_context.ExpansionMemo(0))
+
+    with tempfile.TemporaryDirectory() as cacheDir:
+        loader = jsonld_context.CachingDocumentLoader(cacheDir=cacheDir, remote=standIn)
+        memo = jsonld_context.ExpansionMemo()
+        cold = timed(base, loader, memo)
+        warm = timed(base, loader, memo)
+
+    server.shutdown()
+
+    print('{} items'.format(items))
+    print('without caching   {:8.2f} s'.format(before))
+    print('cached, cold      {:8.2f} s ({:.1f}x)'.format(cold, before / cold))
+    print('cached, warm      {:8.2f} s ({:.1f}x)'.format(warm, before / warm))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
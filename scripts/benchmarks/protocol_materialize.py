@@ -0,0 +1,76 @@
+"""
+Save a synthetic protocol in the single file format, as the applet builder
+does, one document at a time and in bulk, and report the time and the
+number of database commands of `createProtocolFromExpandedDocument`.
+
+Needs a MongoDB; documents are written to the configured database, so point
+GIRDER_MONGO_URI at a scratch one.
+
+    GIRDER_MONGO_URI=mongodb://localhost:27017/benchmark \
+        python scripts/benchmarks/protocol_materialize.py [items] [activities]
+"""
+import sys
+import time
+
+from bson.objectid import ObjectId
+from girderformindlogger.utility import jsonld_expander
+from girderformindlogger.utility.query_count import countQueries
+
+ITEMS = 500
+ACTIVITIES = 10
+
+REPROSCHEMA = 'http://schema.repronim.org/'
+SCHEMA = 'http://schema.org/'
+
+
+def syntheticDocument(items, activities, prefix):
+    def document(identifier, type, **properties):
+        document = {
+            '@id': identifier,
+            '@type': [REPROSCHEMA + type],
+            SCHEMA + 'description': [{'@value': 'description of ' + identifier}]
+        }
+        document.update(properties)
+        return document
+
+    perActivity = items // activities
+    return {
+        'contexts': {},
+        'protocol': {
+            'data': document(prefix, 'Protocol'),
+            'activities': {
+                str(a): {
+                    'data': document('{}-activity-{}'.format(prefix, a), 'Activity'),
+                    'items': {
+                        str(i): document(
+                            '{}-item-{}-{}'.format(prefix, a, i), 'Field',
+                            **{
+                                SCHEMA + 'question': [{'@value': 'Question {}?'.format(i)}],
+                                REPROSCHEMA + 'inputType': [{'@value': 'radio'}]
+                            }
+                        ) for i in range(perActivity)
+                    }
+                } for a in range(activities)
+            }
+        }
+    }
+
+
+def timed(label, user, items, activities, bulk):
+    protocol = jsonld_expander.expandSingleFile(
+        syntheticDocument(items, activities, 'benchmark-{}'.format(ObjectId())))
+
+    start = time.perf_counter()
+    with countQueries() as queries:
+        jsonld_expander.createProtocolFromExpandedDocument(protocol, user, bulk=bulk)
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:8.2f}s {:8d} commands'.format(label, elapsed, queries.count))
+
+
+if __name__ == '__main__':
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else ITEMS
+    activities = int(sys.argv[2]) if len(sys.argv) > 2 else ACTIVITIES
+    user = {'_id': ObjectId(), 'login': 'benchmark'}
+
+    timed('one document at a time', user, items, activities, bulk=False)
+    timed('bulk', user, items, activities, bulk=True)
@@ -0,0 +1,69 @@
+"""
+Deliver a scheduled notification to synthetic profiles through a fake FCM
+with a fixed latency per request: in one job, as `send_push_notification`
+used to, and in batch jobs of AMOUNT_MESSAGES_PER_REQUEST profiles spread
+over several worker processes. Badge updates are not included.
+
+    python scripts/benchmarks/push_delivery.py [profiles] [workers] [latency]
+"""
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from girderformindlogger.external.notification import \
+    AMOUNT_MESSAGES_PER_REQUEST, deliver_push_batch
+from girderformindlogger.utility.notification import FakeNotification
+
+PROFILES = 50000
+WORKERS = 4
+LATENCY = 0.2
+
+MESSAGE = {
+    'message_title': 'Daily check-in',
+    'message_body': '',
+    'time_to_live': 0,
+    'data_message': {'type': 'event-alert'}
+}
+
+
+def syntheticProfiles(count):
+    # most participants have read their notifications, a few are behind
+    return [{
+        'userId': i,
+        'deviceId': 'device-{}'.format(i),
+        'badge': 0 if i % 10 else i % 4
+    } for i in range(count)]
+
+
+def deliverBatch(batch, latency):
+    return deliver_push_batch(batch, MESSAGE, FakeNotification(latency))
+
+
+def timed(label, fun, profiles):
+    start = time.perf_counter()
+    devices = sum(metrics['devices'] for metrics in fun(profiles))
+    elapsed = time.perf_counter() - start
+    assert devices == len(profiles)
+    print('{:<28} {:8.2f}s {:10.0f} devices/s'.format(label, elapsed, devices / elapsed))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else PROFILES
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else WORKERS
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else LATENCY
+    profiles = syntheticProfiles(count)
+    # as selected by send_push_notification
+    ordered = sorted(profiles, key=lambda profile: (profile['badge'], profile['userId']))
+
+    def batches(profiles):
+        return [
+            profiles[i:i + AMOUNT_MESSAGES_PER_REQUEST]
+            for i in range(0, len(profiles), AMOUNT_MESSAGES_PER_REQUEST)
+        ]
+
+    timed('before (one job)', lambda p: [deliverBatch(p, latency)], profiles)
+    timed('after (1 worker)', lambda p: [deliverBatch(b, latency) for b in batches(p)], ordered)
+    with ProcessPoolExecutor(workers) as pool:
+        timed('after ({} workers)'.format(workers), lambda p: list(pool.map(
+            deliverBatch, batches(p), [latency] * len(batches(p)))), ordered)
@@ -0,0 +1,92 @@
+"""
+Compare the single pass of `aggregateResponses` with the former grouping
+of `aggregate`, which scanned every response once per item IRI, on
+synthetic sets of 1k, 10k and 100k responses.
+
+    python scripts/benchmarks/response_aggregate.py [responses ...]
+"""
+import datetime
+import itertools
+import random
+import sys
+import timeit
+
+from bson.objectid import ObjectId
+from girderformindlogger.utility.response import aggregateResponses
+
+SIZES = [1000, 10000, 100000]
+ITEMS = 200
+ITEMS_PER_RESPONSE = 20
+REPEAT = 3
+
+
+def syntheticResponses(count, items=ITEMS, perResponse=ITEMS_PER_RESPONSE):
+    IRIs = ['https://example.org/items/{}'.format(i) for i in range(items)]
+    created = datetime.datetime(2020, 1, 1)
+
+    responses = []
+    for r in range(count):
+        meta = {
+            'applet': {'version': '1.0.{}'.format(r // 1000)},
+            'responses': {
+                IRI: random.randint(0, 4) for IRI in random.sample(IRIs, perResponse)
+            }
+        }
+        if r % 10 == 0:
+            meta['dataSource'] = 'encrypted data source {}'.format(r)
+
+        responses.append({
+            '_id': ObjectId(),
+            'created': created + datetime.timedelta(minutes=r),
+            'meta': meta
+        })
+    return responses
+
+
+def legacyAggregate(definedRange):
+    responseIRIs = list(set(itertools.chain.from_iterable([list(
+        response.get('meta', {}).get('responses', {}).keys()
+    ) for response in definedRange])))
+
+    aggregated = {
+        'schema:startDate': min(response.get('created') for response in definedRange),
+        'schema:endDate': max(response.get('created') for response in definedRange),
+        'responses': {
+            itemIRI: [
+                {
+                    'value': response.get('meta', {}).get('responses', {}).get(itemIRI),
+                    'date': response.get('created'),
+                    'version': response.get('meta', {}).get('applet', {}).get('version', '0.0.0')
+                } for response in definedRange if itemIRI in response.get(
+                    'meta', {}
+                ).get('responses', {})
+            ] for itemIRI in responseIRIs
+        },
+        'dataSources': {}
+    }
+    for response in definedRange:
+        if 'dataSource' in response.get('meta', {}):
+            aggregated['dataSources'][str(response['_id'])] = response['meta']['dataSource']
+    return aggregated
+
+
+def main(sizes):
+    for size in sizes:
+        responses = syntheticResponses(size)
+
+        legacy = legacyAggregate(responses)
+        current = aggregateResponses(responses)
+        assert current['responses'] == legacy['responses']
+        assert current['dataSources'] == legacy['dataSources']
+
+        for name, aggregator in (('rescan per IRI', legacyAggregate), ('single pass', aggregateResponses)):
+            seconds = min(timeit.repeat(
+                lambda: aggregator(responses),
+                number=1,
+                repeat=REPEAT
+            ))
+            print('{:>7,} responses  {:<15} {:>10.1f} ms'.format(size, name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or SIZES)
@@ -79,6 +79,12 @@ extrasReqs = {
     ],
     'mount': [
         'fusepy>=3.0'
+    ],
+    'json': [
+        'orjson>=3.6'
+    ],
+    'brotli': [
+        'brotli>=1.0'
     ]
 }
 
@@ -0,0 +1,124 @@
+# query count regression tests: the number of commands an endpoint sends to
+# MongoDB for N applets is fixed here, so that per applet queries coming back
+# fail a test. They need a mongod, given by GIRDER_TEST_MONGO_URI
+# (mongodb://localhost:27017 by default), and are skipped without one.
+import datetime
+import inspect
+import os
+import pytest
+import pymongo
+from bson.objectid import ObjectId
+
+MONGO_URI = os.environ.get('GIRDER_TEST_MONGO_URI', 'mongodb://localhost:27017')
+DATABASE = 'girder_test_query_counts'
+
+
+@pytest.fixture(scope='module')
+def database():
+    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip('no mongod at {}'.format(MONGO_URI))
+    client.drop_database(DATABASE)
+    client.close()
+
+    from girderformindlogger.models import _dbClients, getDbConnection
+    from girderformindlogger.models import model_base
+
+    # models connect to the database of (None, None), see the db fixture of
+    # pytest_girder
+    previous = _dbClients.get((None, None))
+    connection = getDbConnection(uri='{}/{}'.format(MONGO_URI, DATABASE), quiet=True)
+    _dbClients[(None, None)] = connection
+    for model in model_base._modelSingletons:
+        model.reconnect()
+
+    yield connection.get_database()
+
+    connection.drop_database(DATABASE)
+    if previous is None:
+        _dbClients.pop((None, None), None)
+    else:
+        _dbClients[(None, None)] = previous
+
+
+def insertApplets(database, n):
+    """
+    Insert n cached applets of one user group in the "Applets" collection,
+    and a reviewer in that group.
+
+    :returns: (reviewer, applet ids)
+    """
+    from girderformindlogger.models.cache import Cache as CacheModel
+
+    now = datetime.datetime.utcnow()
+    collection = database['collection'].find_one({'name': 'Applets'})
+    if collection is None:
+        collectionId = database['collection'].insert_one({
+            'name': 'Applets', 'lowerName': 'applets', 'public': True, 'meta': {}
+        }).inserted_id
+    else:
+        collectionId = collection['_id']
+
+    groupId = database['group'].insert_one({
+        'name': 'users', 'lowerName': 'users', 'public': False
+    }).inserted_id
+    reviewer = {
+        '_id': ObjectId(), 'login': 'reviewer', 'timezone': 0,
+        'groups': [groupId], 'formerGroups': [], 'groupInvites': [],
+        'declinedInvites': []
+    }
+
+    appletIds = []
+    for i in range(n):
+        appletId = ObjectId()
+        (cacheId, ) = CacheModel().insertCaches([(
+            'folder', appletId, 'applet', {
+                'applet': {'_id': 'applet/{}'.format(appletId)},
+                'activities': {}, 'items': {}, 'protocol': {}
+            }
+        )])
+        database['folder'].insert_one({
+            '_id': appletId,
+            'name': 'applet {}'.format(i),
+            'lowerName': 'applet {}'.format(i),
+            'parentCollection': 'collection',
+            'parentId': collectionId,
+            'baseParentType': 'collection',
+            'baseParentId': collectionId,
+            'public': True,
+            'access': {'users': [], 'groups': []},
+            'created': now,
+            'updated': now,
+            'cached': cacheId,
+            'meta': {'applet': {}},
+            'roles': {'user': {'groups': [{'id': groupId}]}}
+        })
+        appletIds.append(appletId)
+
+    return (reviewer, appletIds)
+
+
+@pytest.mark.parametrize('n', [1, 5])
+def testOwnAppletsQueryCount(database, monkeypatch, n):
+    from girderformindlogger.api.v1.user import User
+    from girderformindlogger.models.cache import Cache as CacheModel
+    from girderformindlogger.utility.query_count import countQueries
+
+    (reviewer, appletIds) = insertApplets(database, n)
+    resource = User()
+    monkeypatch.setattr(resource, 'getCurrentUser', lambda: reviewer)
+    monkeypatch.setattr(
+        resource, 'getAccountProfile', lambda: {'applets': {'user': appletIds}})
+    getOwnApplets = inspect.unwrap(User.getOwnApplets)
+    CacheModel()._documents.clear()
+
+    # PUT /user/applets with its defaults: the applets, their parent
+    # collection and caches (updated times, then documents) are loaded once
+    # for all, and the groups of each applet twice by getFullRolesList
+    with countQueries() as queries:
+        applets = getOwnApplets(resource, 'user', {})
+
+    assert [applet['id'] for applet in applets] == appletIds
+    assert queries.count == 4 + 2 * n, dict(queries.commands)
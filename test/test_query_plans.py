@@ -0,0 +1,57 @@
+# query plan regression tests: the hot queries must not scan whole
+# collections once the indices of the catalog exist. They need a mongod,
+# given by GIRDER_TEST_MONGO_URI (mongodb://localhost:27017 by default),
+# and are skipped without one.
+import os
+import pytest
+import pymongo
+from girderformindlogger.models.index_catalog import HOT_QUERIES, INDEX_CATALOG
+
+MONGO_URI = os.environ.get('GIRDER_TEST_MONGO_URI', 'mongodb://localhost:27017')
+
+
+@pytest.fixture(scope='module')
+def database():
+    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip('no mongod at {}'.format(MONGO_URI))
+
+    database = client['girder_test_query_plans']
+    client.drop_database(database.name)
+
+    for (collection, indices) in INDEX_CATALOG.items():
+        for index in indices:
+            if isinstance(index, str):
+                database[collection].create_index(index)
+            else:
+                database[collection].create_index(index[0], **index[1])
+
+    yield database
+
+    client.drop_database(database.name)
+    client.close()
+
+
+def planStages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from planStages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from planStages(value)
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def testHotQueryUsesIndex(database, name):
+    (collection, query, sort) = HOT_QUERIES[name]
+
+    cursor = database[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    stages = list(planStages(cursor.explain()['queryPlanner']['winningPlan']))
+
+    assert 'COLLSCAN' not in stages, '{} scans {}: {}'.format(name, collection, stages)
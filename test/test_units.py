@@ -29,3 +29,511 @@ testOutput = {
 def testDereference(args):
     from girderformindlogger.utility.jsonld_expander import dereference
     assert dereference(testInput)==testOutput, 'Dereferencing failed.'
+
+
+def testDocumentLRU():
+    from girderformindlogger.models.cache import DocumentLRU
+
+    lru = DocumentLRU(maxBytes=1024)
+    lru.put('a', 1, {'items': {'x': 1}})
+
+    hit = lru.get('a', 1)
+    assert hit == {'items': {'x': 1}}
+    hit['items'].pop('x')
+    assert lru.get('a', 1) == {'items': {'x': 1}}, 'Cached copy was mutated.'
+
+    assert lru.get('a', 2) is None, 'Stale entry was returned.'
+    lru.invalidate('a')
+    assert lru.get('a', 1) is None
+
+    for i in range(100):
+        lru.put(str(i), 1, {'data': 'x' * 100})
+    stats = lru.stats()
+    assert stats['bytes'] <= 1024
+    assert stats['evictions'] > 0
+    assert stats['hits'] == 2 and stats['misses'] == 2
+
+
+def testCacheDataFormats():
+    from bson import json_util
+    from girderformindlogger.models.cache import CACHE_FORMAT_BSON_ZLIB, \
+        CACHE_FORMAT_JSON, decodeCacheData, encodeCacheData
+
+    data = {'items': {'a/b': {'http://schema.org/url': ['x'], '@id': 'b'}}}
+
+    dataFormat, encoded = encodeCacheData(data)
+    assert dataFormat == CACHE_FORMAT_BSON_ZLIB
+    assert decodeCacheData({'format': dataFormat, 'cache_data': encoded}) == data
+
+    legacy = {'cache_data': json_util.dumps(data)}
+    assert decodeCacheData(legacy) == data
+
+    assert encodeCacheData({1: 'x'})[0] == CACHE_FORMAT_JSON
+
+
+def testCachingDocumentLoader(tmp_path):
+    from girderformindlogger.utility.jsonld_context import \
+        CachingDocumentLoader
+
+    url = 'https://example.com/context.json'
+    calls = []
+
+    def remote(url, options):
+        calls.append(url)
+        if len(calls) > 1:
+            raise IOError('offline')
+        return {'document': {'@context': {'schema': 'http://schema.org/'}}}
+
+    loader = CachingDocumentLoader(cacheDir=str(tmp_path), ttl=0, remote=remote)
+    first = loader(url)['document']
+    assert loader(url)['document'] == first, 'Stale copy was not used.'
+    assert len(calls) == 2
+
+
+def testJsonSessionPerThread():
+    from concurrent.futures import ThreadPoolExecutor
+    from girderformindlogger.utility import _jsonSession
+
+    assert _jsonSession() is _jsonSession()
+    with ThreadPoolExecutor(2) as pool:
+        sessions = list(pool.map(lambda i: _jsonSession(), range(8)))
+    assert all(session is not _jsonSession() for session in sessions)
+    assert 1 <= len({id(session) for session in sessions}) <= 2
+
+
+def testImportComponentsSkipsFailures(monkeypatch):
+    from girderformindlogger.utility import jsonld_expander
+
+    calls = []
+
+    def importComponent(IRI, user, refreshCache, meta):
+        calls.append((IRI, refreshCache))
+        if IRI == 'bad':
+            raise IOError('unreachable')
+        return ('items', IRI, IRI.upper())
+
+    monkeypatch.setattr(jsonld_expander, '_importComponent', importComponent)
+    monkeypatch.setattr(jsonld_expander, '_componentIRIs', lambda obj: ['good', 'bad'])
+
+    protocol = jsonld_expander.importComponents(
+        {'protocol': {}, 'activities': {}, 'items': {}}, {'@id': 'p'}, None)
+    assert protocol['items'] == {'good': 'GOOD'}
+    assert sorted(calls) == [('bad', False), ('bad', True), ('good', False)]
+
+def testTenantRouterBind():
+    from girderformindlogger.models.tenant import TenantRouter
+
+    class FakeModel(object):
+        name = 'item'
+        db_uri = None
+        connects = 0
+
+        def reconnect(self):
+            FakeModel.connects += 1
+            self._dbserver_version = (4, 0)
+            self.database = 'db:%s' % self.db_uri
+            self.collection = 'collection:%s' % self.db_uri
+
+    model = FakeModel()
+    router = TenantRouter()
+
+    assert router.bind(model, None) is model
+
+    first = router.bind(model, 'mongodb://tenant/a')
+    second = router.bind(model, 'mongodb://tenant/a')
+    assert first is not model and second is not first
+    assert second.collection == 'collection:mongodb://tenant/a'
+    assert FakeModel.connects == 1
+    assert model.db_uri is None and not hasattr(model, 'collection')
+
+
+def testDecryptedCursor():
+    from girderformindlogger.models.aes_encrypt import DecryptedCursor
+    from girderformindlogger.models.response_folder import ResponseItem
+
+    model = ResponseItem.__new__(ResponseItem)
+    model.initAES([('meta.responses', 1024)], 6)
+
+    documents = [
+        model.encryptFields({
+            'meta': {
+                'responseStarted': 1600000000000 + i * 1000,
+                'items': ['a'],
+                'responses': '{"0": %d}' % i
+            }
+        }, model.fields) for i in range(5)
+    ]
+    assert isinstance(documents[0]['meta']['responses'], bytes)
+    assert model.AES_KEY == model.baseKey
+
+    cursor = DecryptedCursor(model, iter(documents), batchSize=2)
+    assert [d['meta']['responses'] for d in cursor] == [{'a': i} for i in range(5)]
+
+
+@pytest.mark.parametrize('length', [0, 1, 15, 16, 17, 1030])
+def testAESDecrypt(length):
+    import os
+    from girderformindlogger.models.aes_encrypt import AESEncryption
+
+    model = AESEncryption.__new__(AESEncryption)
+    model.initAES([], 4)
+    key = os.urandom(32)
+    plaintext = 'x' * length
+
+    data = model.encrypt(plaintext, 0, key)
+    assert model.decrypt(data, key) == ('ok', plaintext)
+    assert model.decrypt(data[:-1] + bytes([data[-1] ^ 1]), key) == ('error', None)
+    assert model.decrypt(data, os.urandom(32)) == ('error', None)
+    # values too short to hold a nonce and a full tag
+    for truncated in (data[:31], data[-20:], b''):
+        assert model.decrypt(truncated, key) == ('error', None)
+
+
+def testDeliverPushBatch():
+    from girderformindlogger.external.notification import deliver_push_batch
+    from girderformindlogger.utility.notification import FakeNotification
+
+    service = FakeNotification()
+    sent = []
+    notify = service.notify_multiple_devices
+    service.notify_multiple_devices = lambda **kwargs: sent.append(kwargs) or notify(**kwargs)
+
+    profiles = [{'deviceId': 'a', 'badge': 0}, {'deviceId': 'b', 'badge': 2},
+                {'deviceId': 'c', 'badge': 0}, {'deviceId': None, 'badge': 0}]
+    metrics = deliver_push_batch(profiles, {'message_title': 't'}, service)
+
+    assert sorted((r['badge'], r['registration_ids']) for r in sent) == [
+        (1, ['a', 'c']), (3, ['b'])]
+    assert metrics['profiles'] == 4 and metrics['devices'] == 3
+    assert metrics['requests'] == 2 and metrics['success'] == 3
+
+
+def testCountQueries():
+    from types import SimpleNamespace
+    from girderformindlogger.utility.query_count import countQueries, queryCountListener
+
+    def command(name):
+        queryCountListener.started(SimpleNamespace(command_name=name))
+
+    command('find')
+    with countQueries() as outer:
+        command('find')
+        command('isMaster')
+        with countQueries() as inner:
+            command('aggregate')
+        command('getMore')
+
+    assert inner.count == 1
+    assert outer.count == 3 and outer.commands['find'] == 1
+
+
+def testDisplayCacheQueue():
+    import threading
+    from girderformindlogger.models.profile import DisplayCacheQueue
+
+    stored = []
+    release = threading.Event()
+
+    def store(displays):
+        release.wait(5)
+        stored.append(displays)
+
+    def wait(condition):
+        for _ in range(100):
+            if condition():
+                return
+            threading.Event().wait(0.02)
+
+    queue = DisplayCacheQueue(store, maxSize=3)
+    assert queue.put(1, 'manager', {'v': 0})
+    # the worker holds the first display; the rest wait
+    wait(lambda: len(queue) == 0)
+    assert queue.put(2, 'manager', {'v': 1})
+    assert queue.put(2, 'manager', {'v': 2})
+    assert queue.put(3, 'manager', {'v': 3})
+    assert queue.submit('task', lambda: None)
+    assert not queue.put(5, 'manager', {}) and queue.dropped == 1
+
+    release.set()
+    wait(lambda: len(queue) == 0 and len(stored) == 2)
+    assert stored == [[(1, 'manager', {'v': 0})],
+                      [(2, 'manager', {'v': 2}), (3, 'manager', {'v': 3})]]
+
+
+
+def testQueuedDisplayIsACopy(monkeypatch):
+    from girderformindlogger.models import profile as profileModule
+
+    queued = []
+
+    class Queue(object):
+        def put(self, profileId, role, display):
+            queued.append(display)
+
+    monkeypatch.setattr(profileModule, 'getDisplayCacheQueue', lambda: Queue())
+    model = profileModule.Profile.__new__(profileModule.Profile)
+    monkeypatch.setattr(model, '_buildDisplays', lambda profiles, *args: [
+        {'_id': profile['_id'], 'MRN': 'mrn'} for profile in profiles])
+
+    (display,) = model.displayProfileFieldsMany([{'_id': 1}], None, forceManager=True)
+    display['roles'] = ['user']
+    assert queued == [{'_id': 1, 'MRN': 'mrn'}]
+
+def testProfilePageToken():
+    import datetime
+    from bson import ObjectId
+    from girderformindlogger.exceptions import ValidationException
+    from girderformindlogger.models.profile import decodePageToken, encodePageToken, \
+        matchesSearch
+
+    lastId = ObjectId()
+    created = datetime.datetime(2021, 4, 1, 12, 30)
+    for value in (created, 'MRN-1', None):
+        assert decodePageToken(encodePageToken(value, lastId)) == (value, lastId)
+
+    with pytest.raises(ValidationException):
+        decodePageToken('not a token')
+    with pytest.raises(ValidationException) as error:
+        decodePageToken('not a token', 'pendingAfter')
+    assert error.value.field == 'pendingAfter'
+
+    invitation = {'firstName': 'Ada', 'lastName': 'Lovelace', 'MRN': None}
+    assert matchesSearch(invitation, 'LOVE')
+    assert not matchesSearch(invitation, 'babbage')
+
+
+def testHistoryReferenceIndex():
+    from girderformindlogger.models.protocol import buildReferenceIndex, findReference
+
+    history = [
+        {'version': '1.0.0', 'reference': None},
+        {'version': '1.2.0', 'reference': 'screen/a'},
+        {'version': '1.9.0', 'reference': 'screen/b'},
+        {'version': '1.10.0', 'reference': 'screen/c'}
+    ]
+    derived = buildReferenceIndex({'history': history})
+    stored = buildReferenceIndex({'referenceIndex': [
+        [entry['version'], entry['reference']] for entry in history[1:]
+    ]})
+
+    for index in (derived, stored):
+        assert findReference(index, '1.0') == 'screen/a'
+        assert findReference(index, '1.2.0') == 'screen/a'
+        assert findReference(index, '1.2.1') == 'screen/b'
+        assert findReference(index, '1.9.5') == 'screen/c'
+        assert findReference(index, '1.10.0') == 'screen/c'
+        assert findReference(index, '1.10.1') is None
+
+
+def testAllocateNames():
+    from girderformindlogger.models.folder import allocateNames, renamedNamePatterns
+
+    taken = {('a', 'Mood'), ('a', 'Mood (1)'), ('b', 'Sleep')}
+    names = allocateNames(
+        [('a', 'Mood'), ('a', 'Mood'), ('b', 'Mood'), ('b', 'Sleep'), ('a', 'Sleep')],
+        taken
+    )
+    assert names == ['Mood (2)', 'Mood (3)', 'Mood', 'Sleep (1)', 'Sleep']
+    assert ('a', 'Mood (3)') in taken
+
+    (pattern, ) = renamedNamePatterns(['Mood (am)'])
+    assert pattern.match('Mood (am)') and pattern.match('Mood (am) (12)')
+    assert not pattern.match('Mood (am) 2') and not pattern.match('Mood')
+
+
+def testFormatAppletContent():
+    from bson import ObjectId
+    from girderformindlogger.utility.jsonld_expander import _formatAppletContent
+
+    applet = {
+        '_id': ObjectId(),
+        'meta': {
+            'applet': {'displayName': 'Mood'},
+            'protocol': {'url': 'https://example.org/protocol'}
+        }
+    }
+    content = _formatAppletContent(applet, {
+        'protocol': {
+            '_id': 'protocol/1',
+            '@type': ['reprolib:schemas/Protocol'],
+            'skos:prefLabel': [{'@value': 'Protocol'}]
+        },
+        'activities': {'a': {}},
+        'items': {'a/b': {}}
+    })
+
+    assert content['activities'] == {'a': {}} and content['items'] == {'a/b': {}}
+    assert content['protocol'] == {'_id': 'protocol/1', '@type': ['reprolib:schemas/Protocol']}
+    assert content['applet']['_id'] == 'applet/{}'.format(applet['_id'])
+    assert content['applet']['skos:prefLabel'] == [{'@value': 'Mood'}]
+    assert content['applet']['url'] == 'https://example.org/protocol'
+
+
+def testAggregateResponses():
+    import datetime
+    from bson import ObjectId
+    from girderformindlogger.utility.response import aggregateResponses
+
+    start = datetime.datetime(2020, 1, 1)
+    responses = [{
+        '_id': ObjectId(),
+        'created': start + datetime.timedelta(hours=h),
+        'meta': {
+            'applet': {'version': '1.0.{}'.format(h)},
+            'responses': {'a': h, 'b': -h} if h % 2 else {'a': h}
+        }
+    } for h in range(4)]
+    responses[1]['meta']['dataSource'] = 'source'
+
+    aggregated = aggregateResponses(iter(responses))
+    assert aggregated['schema:startDate'] == start
+    assert aggregated['schema:endDate'] == start + datetime.timedelta(hours=3)
+    assert aggregated['schema:duration'] == 'PT3H'
+    assert [r['value'] for r in aggregated['responses']['a']] == [0, 1, 2, 3]
+    assert aggregated['responses']['b'] == [
+        {'value': -1, 'date': start + datetime.timedelta(hours=1), 'version': '1.0.1'},
+        {'value': -3, 'date': start + datetime.timedelta(hours=3), 'version': '1.0.3'}
+    ]
+    assert aggregated['dataSources'] == {str(responses[1]['_id']): 'source'}
+    assert aggregateResponses([]) == {}
+
+
+def testOneResponsePerDatePerVersion():
+    import datetime
+    from girderformindlogger.utility.response import _oneResponsePerDatePerVersion
+
+    def response(value, day, hour, version):
+        return {'value': value, 'date': datetime.datetime(2020, 1, day, hour), 'version': version}
+
+    responses = _oneResponsePerDatePerVersion({'item': [
+        response(1, 1, 2, '1.0.10'),
+        response(2, 1, 20, '1.0.9'),
+        response(3, 1, 22, '1.0.10'),
+        response(None, 1, 23, '1.0.10'),
+        response(4, 2, 5, '1.0.10')
+    ]}, -4)
+
+    # days are counted at UTC-4; the latest response of a day missing a
+    # value takes the one before
+    assert responses['item'] == [
+        {'value': 1, 'version': '1.0.10', 'date': datetime.date(2019, 12, 31)},
+        {'value': 2, 'version': '1.0.9', 'date': datetime.date(2020, 1, 1)},
+        {'value': 3, 'version': '1.0.10', 'date': datetime.date(2020, 1, 1)},
+        {'value': 4, 'version': '1.0.10', 'date': datetime.date(2020, 1, 2)}
+    ]
+
+
+@pytest.mark.parametrize('sortKeys', [False, True])
+def testJsonSerializerParity(sortKeys):
+    import datetime
+    import json
+    import os
+    import pytz
+    from bson import ObjectId
+    from girderformindlogger.utility.json_serializer import dumpsJson, dumpsOrjson
+
+    pytest.importorskip('orjson')
+
+    with open(os.path.join(os.path.dirname(__file__), 'expected', 'test_1_HBN.jsonld')) as fixture:
+        expected = json.load(fixture)
+
+    values = [expected, {
+        '_id': ObjectId(),
+        'created': datetime.datetime(2020, 1, 2, 3, 4, 5, 6789),
+        'updated': datetime.datetime(2020, 1, 2, 3, tzinfo=pytz.timezone('America/New_York')),
+        'date': datetime.date(2020, 1, 2),
+        'tags': {'a'},
+        'nested': [{1: 'one', 2: 'two'}],
+        'text': 'caf\u00e9 \u2713'
+    }]
+    for value in values + [{'big': 2 ** 70}]:
+        assert json.loads(dumpsOrjson(value, sortKeys)) == json.loads(dumpsJson(value, sortKeys))
+    for value in values:
+        encoded = dumpsOrjson(value, sortKeys)
+        if sortKeys:
+            assert encoded == json.dumps(json.loads(encoded), sort_keys=True,
+                                         separators=(',', ':'), ensure_ascii=False).encode('utf8')
+
+
+def testHttpEncoding():
+    import datetime
+    import gzip
+    from bson import ObjectId
+    from girderformindlogger.utility import http_encoding
+    from girderformindlogger.utility.http_encoding import compress, encodedETag, \
+        etagMatches, makeETag, negotiateEncoding
+
+    preferred = 'br' if http_encoding.brotli is not None else 'gzip'
+    assert negotiateEncoding(None) is None
+    assert negotiateEncoding('identity') is None
+    assert negotiateEncoding('gzip;q=0, deflate') is None
+    assert negotiateEncoding('br;q=0, GZIP') == 'gzip'
+    assert negotiateEncoding('gzip, deflate, br') == preferred
+    assert negotiateEncoding('*') == preferred
+
+    body = b'{"a": "' + b'x' * 5000 + b'"}'
+    assert gzip.decompress(compress(body, 'gzip')) == body
+
+    appletId = ObjectId()
+    updated = datetime.datetime(2020, 1, 2, 3, 4, 5)
+    etag = makeETag(appletId, updated, ObjectId(appletId))
+    assert etag == makeETag(appletId, updated, ObjectId(appletId))
+    assert etag != makeETag(appletId, updated + datetime.timedelta(seconds=1), appletId)
+    assert etag.startswith('"') and etag.endswith('"')
+
+    assert etagMatches(etag, etag)
+    assert etagMatches('"other", W/' + encodedETag(etag, 'gzip'), etag)
+    assert etagMatches('*', etag)
+    assert not etagMatches(None, etag)
+    assert not etagMatches('"other"', etag)
+    assert encodedETag(etag, None) == etag
+
+
+def testNotificationHub():
+    import datetime
+    import queue
+    import time
+    from bson import ObjectId
+    from girderformindlogger.models.notification_hub import NotificationHub
+
+    class FakeRedis(object):
+        messages = queue.Queue()
+
+        def publish(self, channel, data):
+            self.messages.put({'type': 'message', 'channel': channel, 'data': data})
+
+        def pubsub(self, **kwargs):
+            return self
+
+        def subscribe(self, channel):
+            pass
+
+        def listen(self):
+            while True:
+                yield self.messages.get()
+
+    hub = NotificationHub(FakeRedis, queueSize=2)
+    user, other = {'_id': ObjectId()}, {'_id': ObjectId()}
+    notification = {
+        '_id': ObjectId(), 'userId': user['_id'], 'type': 'progress',
+        'updated': datetime.datetime(2021, 4, 1, 12, 30)
+    }
+
+    with hub.subscribe(user) as subscription, hub.subscribe(other) as unrelated:
+        deadline = time.time() + 5
+        while not hub.listening and time.time() < deadline:
+            time.sleep(0.01)
+        # subscriptions opened before the listener started read the database
+        assert subscription.get(0) in (None, [])
+        assert unrelated.get(0) in (None, [])
+
+        hub.publish(notification)
+        assert subscription.get(5) == [notification]
+        assert unrelated.get(0) == []
+
+        for i in range(3):
+            hub.publish(notification)
+        time.sleep(0.2)
+        assert subscription.get(0) is None
+
+    assert not hub._subscriptions